@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Micro-benchmark: regex fast path vs BeautifulSoup for the CAS "execution" token.
+#   python tools/bench_execution.py [saved_login_page.html ...] [-n 2000]
+from __future__ import annotations 
+
+import argparse 
+import os 
+import subprocess 
+import sys 
+import timeit 
+
+sys .path .insert (0 ,os .path .dirname (os .path .dirname (os .path .abspath (__file__ ))))
+
+import zju_innercurly_tool_2 as app 
+
+SAMPLE_PAGE ="""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>统一身份认证平台</title>
+<link rel="stylesheet" href="/cas/css/login.css"></head>
+<body>
+<div class="login-box">
+<form id="fm1" action="/cas/login?service=https%3A%2F%2Fzdbk.zju.edu.cn%2Fjwglxt%2Fxtgl%2Flogin_ssologin.html" method="post">
+"""+"".join (f'<div class="row"><span class="tip" id="tip{i }">提示 {i }</span></div>\n'for i in range (200 ))+"""
+<input id="username" name="username" type="text" value="" autocomplete="off"/>
+<input id="password" name="password" type="password" value=""/>
+<input type="hidden" name="execution" value="e1s1_0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef"/>
+<input type="hidden" name="_eventId" value="submit"/>
+</form></div>
+<script src="/cas/js/login.js"></script>
+</body></html>
+"""
+
+
+def _bs4_import_cost ()->float :
+    code ="import time; t=time.perf_counter(); import bs4; print(time.perf_counter()-t)"
+    try :
+        out =subprocess .run ([sys .executable ,"-c",code ],capture_output =True ,text =True ,timeout =60 )
+        return float (out .stdout .strip ()or 0.0 )
+    except Exception :
+        return -1.0 
+
+
+def main ()->int :
+    ap =argparse .ArgumentParser (description ="execution 提取器基准测试")
+    ap .add_argument ("pages",nargs ="*",help ="保存的 CAS 登录页 HTML 文件")
+    ap .add_argument ("-n","--number",type =int ,default =2000 ,help ="每个页面的重复次数")
+    args =ap .parse_args ()
+
+    pages =[]
+    for p in args .pages :
+        with open (p ,"r",encoding ="utf-8",errors ="replace")as f :
+            pages .append ((os .path .basename (p ),f .read ()))
+    if not pages :
+        pages .append (("<内置样例>",SAMPLE_PAGE ))
+
+    print (f"bs4 冷导入耗时：{_bs4_import_cost ()*1000 :.1f} ms")
+    print (f"{'page':<24}{'bytes':>10}{'fast(us)':>12}{'bs4(us)':>12}{'speedup':>10}  agree")
+    for name ,html in pages :
+        fast_v =app .extract_execution_fast (html )
+        slow_v =app .extract_execution_bs4 (html )
+        t_fast =timeit .timeit (lambda :app .extract_execution_fast (html ),number =args .number )/args .number 
+        n_slow =max (1 ,args .number //20 )
+        t_slow =timeit .timeit (lambda :app .extract_execution_bs4 (html ),number =n_slow )/n_slow 
+        speedup =t_slow /t_fast if t_fast >0 else 0.0 
+        print (f"{name [:23 ]:<24}{len (html ):>10}{t_fast *1e6 :>12.1f}{t_slow *1e6 :>12.1f}{speedup :>9.0f}x  {fast_v ==slow_v }")
+    return 0 
+
+
+if __name__ =="__main__":
+    sys .exit (main ())
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Micro-benchmark: course normalisation against the baseline commit's merge + _raw_to_courses
+# (loaded from git, so this needs a checkout), plus CourseIndex re-normalising a poll in
+# which a single grade changed.
+#   python tools/bench_normalize.py [-c 3000] [-n 20] [--rev 4127c2d]
+from __future__ import annotations 
+
+import argparse 
+import os 
+import random 
+import subprocess 
+import sys 
+import timeit 
+import types 
+
+ROOT =os .path .dirname (os .path .dirname (os .path .abspath (__file__ )))
+sys .path .insert (0 ,ROOT )
+
+import zju_innercurly_tool_2 as app 
+
+BASELINE_REV ="4127c2d"
+
+
+def load_baseline (rev :str =BASELINE_REV ):
+    # import the tool exactly as it was at the baseline commit, straight out of git
+    src =subprocess .run (["git","show",f"{rev }:zju_innercurly_tool_2.py"],cwd =ROOT ,
+    capture_output =True ,check =True ).stdout 
+    mod =types .ModuleType ("zju_baseline")
+    mod .__file__ =os .path .join (ROOT ,"zju_innercurly_tool_2.py")
+    sys .modules [mod .__name__ ]=mod 
+    exec (compile (src ,f"{rev }:zju_innercurly_tool_2.py","exec"),mod .__dict__ )
+    return mod 
+
+
+def synthetic_items (count :int ,seed :int =7 )->tuple :
+    rng =random .Random (seed )
+    score ,stats =[],[]
+    for i in range (count ):
+        year =2018 +rng .randrange (6 )
+        term =rng .choice ("12")
+        code =f"{rng .randrange (10 ,99 )}1{i :05d}"
+        item ={
+        "kcmc":f"课程{i }",
+        "cj":rng .choice (["优秀","良好","合格",str (rng .randrange (55 ,100 ))]),
+        "xf":str (rng .choice ([0.5 ,1.0 ,1.5 ,2.0 ,2.5 ,3.0 ,4.0 ])),
+        "xkkh":f"({year }-{year +1 }-{term })-{code }-0{rng .randrange (100000 ,999999 )}-1",
+        "kch":code ,
+        }
+        score .append (item )
+        if rng .random ()<0.7 :
+            stats .append (dict (item ))
+    return score ,stats 
+
+
+def baseline_pipeline (base ,score_data :list ,stats_data :list )->list :
+    # the merge is inlined at the tail of the baseline fetch_data (after both requests
+    # return), so it is copied here verbatim; the rebuild is the baseline method itself
+    map_semester ,safe_float =base .map_semester ,base .safe_float 
+
+    raw_courses =[]
+    existing_primary =set ()# (ident, credits_2, semester)
+    existing_by_name =set ()
+
+    def _extract_course_code (item :dict )->str :
+    
+        if not isinstance (item ,dict ):
+            return ""
+
+        for k in ("kch","kcdm","kcbh","courseCode","course_code"):
+            v =(item .get (k )or "").strip ()
+            if v :
+                return v 
+
+        xkkh =(item .get ("xkkh")or "").strip ()
+        if xkkh .startswith ("(")and ")-"in xkkh :
+            try :
+                tail =xkkh .split (")-",1 )[1 ]
+                parts =tail .split ("-")
+                if len (parts )>=1 :
+                    code =(parts [0 ]or "").strip ()
+                    if code :
+                        return code 
+            except Exception :
+                pass 
+
+        return ""
+
+    def _extract_semester (item :dict )->str :
+        
+        if not isinstance (item ,dict ):
+            return "未知学期"
+
+        for k in ("xkkh","xnxq01id","xnxq"):
+            raw =(item .get (k )or "").strip ()
+            if raw :
+                sem =map_semester (raw )
+                if sem !="未知学期":
+                    return sem 
+
+        xnm =str (item .get ("xnm")or "").strip ()
+        xqm =str (item .get ("xqm")or item .get ("xq")or "").strip ()
+        if xnm .isdigit ()and xqm in ("1","2"):
+            try :
+                end_year =int (xnm )+1 
+                sem =map_semester (f"({xnm }-{end_year }-{xqm })")
+                return sem 
+            except Exception :
+                pass 
+
+        return "未知学期"
+
+    for item in stats_data :
+        course_name =(item .get ("kcmc")or "").strip ()
+        cj =(item .get ("cj")or "").strip ()
+        if course_name and cj :
+            semester =_extract_semester (item )
+            credits =safe_float (item .get ("xf",0.0 ),0.0 )
+            credits2 =float (f"{credits :.2f}")
+            code =_extract_course_code (item )
+
+            k_primary =((code or course_name ),credits2 ,semester )
+            k_name =(course_name ,credits2 ,semester )
+
+            existing_primary .add (k_primary )
+            existing_by_name .add (k_name )
+
+            raw_courses .append ({
+            "name":course_name ,
+            "course_code":code ,
+            "credits":credits ,
+            "score":cj ,
+            "semester":semester ,
+            "is_major":True 
+            })
+
+    for item in score_data :
+        course_name =(item .get ("kcmc")or "").strip ()
+        cj =(item .get ("cj")or "").strip ()
+        if not course_name or not cj :
+            continue 
+
+        semester =_extract_semester (item )
+        credits =safe_float (item .get ("xf",0.0 ),0.0 )
+        credits2 =float (f"{credits :.2f}")
+        code =_extract_course_code (item )
+
+        k_primary =((code or course_name ),credits2 ,semester )
+        k_name =(course_name ,credits2 ,semester )
+
+        if (k_primary in existing_primary )or (k_name in existing_by_name ):
+            continue 
+
+        raw_courses .append ({
+        "name":course_name ,
+        "course_code":code ,
+        "credits":credits ,
+        "score":cj ,
+        "semester":semester ,
+        "is_major":False 
+        })
+
+        existing_primary .add (k_primary )
+        existing_by_name .add (k_name )
+
+    # keep_user_override=False never touches self
+    return base .GradeApp ._raw_to_courses (None ,raw_courses ,keep_user_override =False )
+
+
+def current_pipeline (score :list ,stats :list )->tuple :
+    return app .normalize_courses (app ._merge_raw_items (score ,stats ))
+
+
+def _best (fn ,number :int )->float :
+    # min over a few repeats keeps the numbers usable on a noisy machine
+    return min (timeit .repeat (fn ,number =number ,repeat =5 ))/number 
+
+
+def main ()->int :
+    ap =argparse .ArgumentParser (description ="课程归一化基准测试")
+    ap .add_argument ("-c","--courses",type =int ,default =3000 ,help ="合成成绩条目数")
+    ap .add_argument ("-n","--number",type =int ,default =20 ,help ="重复次数")
+    ap .add_argument ("--rev",default =BASELINE_REV ,help ="对比的基线提交")
+    args =ap .parse_args ()
+
+    base =load_baseline (args .rev )
+    score ,stats =synthetic_items (args .courses )
+    old_courses =baseline_pipeline (base ,score ,stats )
+    new_courses ,_new_keys =current_pipeline (score ,stats )
+    agree =[vars (c )for c in old_courses ]==[vars (c )for c in new_courses ]
+
+    t_old =_best (lambda :baseline_pipeline (base ,score ,stats ),args .number )
+    t_new =_best (lambda :current_pipeline (score ,stats ),args .number )
+    speedup =t_old /t_new if t_new >0 else 0.0 
+    print (f"score={len (score )} stats={len (stats )} courses={len (new_courses )}")
+    print (f"{'baseline(ms)':>12}{'current(ms)':>12}{'speedup':>10}  agree")
+    print (f"{t_old *1e3 :>12.2f}{t_new *1e3 :>12.2f}{speedup :>9.2f}x  {agree }")
+
+    raw_a =app ._merge_raw_items (score ,stats )
+    raw_b =list (raw_a )
+    raw_b [len (raw_b )//2 ]=dict (raw_b [len (raw_b )//2 ],score ="100")
+    index =app .CourseIndex ()
+    index .update (raw_a )
+    polls =[raw_b ,raw_a ]
+    t_full =_best (lambda :app .normalize_courses (raw_b ),args .number )
+    t_inc =_best (lambda :index .update (polls [index .parsed %2 ]),args .number )
+    inc_courses ,inc_keys =index .update (raw_b )
+    agree =(inc_courses ,inc_keys )==app .normalize_courses (raw_b )
+    print (f"{'full(ms)':>12}{'incr(ms)':>12}{'speedup':>10}  agree")
+    print (f"{t_full *1e3 :>12.2f}{t_inc *1e3 :>12.2f}{(t_full /t_inc if t_inc >0 else 0.0 ):>9.2f}x  {agree }")
+    return 0 
+
+
+if __name__ =="__main__":
+    sys .exit (main ())
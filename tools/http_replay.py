@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+# Record the login + fetch conversation once, then replay it locally for offline benchmarks.
+#   python tools/http_replay.py record USERNAME -o data/replay.json
+#   python tools/http_replay.py serve data/replay.json --latency-ms 40 --bandwidth-kbps 512
+#   python tools/http_replay.py bench data/replay.json -n 20 --latency-ms 40
+from __future__ import annotations 
+
+import argparse 
+import base64 
+import getpass 
+import json 
+import os 
+import statistics 
+import sys 
+import threading 
+import time 
+from http .server import BaseHTTPRequestHandler ,ThreadingHTTPServer 
+from typing import Dict ,List ,Optional ,Tuple 
+from urllib .parse import parse_qsl ,urlencode ,urlsplit 
+
+sys .path .insert (0 ,os .path .dirname (os .path .dirname (os .path .abspath (__file__ ))))
+
+import zju_innercurly_tool_2 as app 
+
+REPLAY_VERSION =1 
+IGNORED_QUERY_KEYS =("service","ticket","_")
+DROPPED_HEADERS =("content-length","transfer-encoding","content-encoding","connection","date","keep-alive")
+SCRUB_FIELDS =("xh","xh_id","xm","xmpy","sfzjh","zjhm","sjhm")
+SCRUB_TEXT ="000000"
+
+
+def _request_key (method :str ,path :str ,query :str )->str :
+    pairs =sorted ((k ,v )for k ,v in parse_qsl (query ,keep_blank_values =True )if k not in IGNORED_QUERY_KEYS )
+    return f"{method .upper ()} {path }?{urlencode (pairs )}"
+
+
+def _scrub_json (obj ):
+    if isinstance (obj ,dict ):
+        return {k :(SCRUB_TEXT if k in SCRUB_FIELDS else _scrub_json (v ))for k ,v in obj .items ()}
+    if isinstance (obj ,list ):
+        return [_scrub_json (v )for v in obj ]
+    return obj 
+
+
+def _scrub_text (text :str ,secrets :List [str ])->str :
+    for secret in secrets :
+        if secret :
+            text =text .replace (secret ,SCRUB_TEXT )
+    return text 
+
+
+def _scrub_body (body :bytes ,ctype :str ,secrets :List [str ])->bytes :
+    if "json"in ctype :
+        try :
+            return json .dumps (_scrub_json (json .loads (body .decode ("utf-8"))),ensure_ascii =False ).encode ("utf-8")
+        except Exception :
+            pass 
+    if "text"in ctype or "json"in ctype or "javascript"in ctype :
+        try :
+            return _scrub_text (body .decode ("utf-8"),secrets ).encode ("utf-8")
+        except UnicodeDecodeError :
+            pass 
+    return body 
+
+
+def _scrub_header (name :str ,value :str ,secrets :List [str ])->str :
+    if name .lower ()=="set-cookie":
+        cookie ,_sep ,attrs =value .partition (";")
+        cname =cookie .split ("=",1 )[0 ]
+        return f"{cname }=replay;{attrs }"if attrs else f"{cname }=replay"
+    return _scrub_text (value ,secrets )
+
+
+class RecordingSession (app .ZdbkSession ):
+
+    def __init__ (self ,username :str ,password :str ,page_size :int =app .DATA_PAGE_SIZE ):
+        super ().__init__ (username ,password ,page_size =page_size )
+        self .exchanges :List [dict ]=[]
+        self ._rec_lock =threading .Lock ()
+
+    def _record (self ,method :str ,url :str ,response )->None :
+        secrets =[self .username ,self .password ]
+        parts =urlsplit (url )
+        ctype =response .headers .get ("Content-Type","")
+        entry ={
+        "method":method ,
+        "path":parts .path ,
+        "query":_scrub_text (parts .query ,secrets ),
+        "status":response .status_code ,
+        "headers":[
+        [k ,_scrub_header (k ,v ,secrets )]
+        for k ,v in response .headers .items ()
+        if k .lower ()not in DROPPED_HEADERS 
+        ],
+        "body":base64 .b64encode (_scrub_body (response .content ,ctype ,secrets )).decode ("ascii"),
+        "elapsed":round (response .elapsed .total_seconds (),4 )
+        }
+        with self ._rec_lock :
+            self .exchanges .append (entry )
+
+    def _get (self ,url :str ,phase :str ="",**kwargs ):
+        response =super ()._get (url ,phase ,**kwargs )
+        self ._record ("GET",url ,response )
+        return response 
+
+    def _post (self ,url :str ,phase :str ="",**kwargs ):
+        response =super ()._post (url ,phase ,**kwargs )
+        self ._record ("POST",url ,response )
+        return response 
+
+
+def record (username :str ,password :str ,path :str ,page_size :int =app .DATA_PAGE_SIZE )->Tuple [bool ,str ]:
+    zs =RecordingSession (username ,password ,page_size =page_size )
+    try :
+        _raw ,ok ,msg ,_meta =zs .fetch ()
+    finally :
+        zs .close ()
+    doc ={
+    "version":REPLAY_VERSION ,
+    "recorded_at":app .now_str (),
+    "cas_base":app .CAS_BASE ,
+    "zdbk_base":app .ZDBK_BASE ,
+    "page_size":page_size ,
+    "exchanges":zs .exchanges 
+    }
+    app .ensure_dir (os .path .dirname (os .path .abspath (path )))
+    with open (path ,"w",encoding ="utf-8")as f :
+        json .dump (doc ,f ,ensure_ascii =False ,indent =1 )
+    return ok ,msg 
+
+
+def load_recording (path :str )->dict :
+    with open (path ,"r",encoding ="utf-8")as f :
+        doc =json .load (f )
+    if int (doc .get ("version",0 ))!=REPLAY_VERSION :
+        raise ValueError (f"不支持的录制版本：{doc .get ('version')}")
+    return doc 
+
+
+class ReplayServer (ThreadingHTTPServer ):
+    daemon_threads =True 
+
+    def __init__ (self ,doc :dict ,host :str ="127.0.0.1",port :int =0 ,latency_ms :float =0.0 ,bandwidth_kbps :float =0.0 ):
+        super ().__init__ ((host ,port ),_ReplayHandler )
+        self .latency_sec =max (0.0 ,float (latency_ms ))/1000.0 
+        self .bytes_per_sec =max (0.0 ,float (bandwidth_kbps ))*1024.0 /8.0 
+        self .origins =[doc .get ("cas_base",""),doc .get ("zdbk_base","")]
+        self .routes :Dict [str ,List [dict ]]={}
+        self .fallback :Dict [str ,List [dict ]]={}
+        self ._cursor :Dict [str ,int ]={}
+        self ._cursor_lock =threading .Lock ()
+        for ex in doc .get ("exchanges",[]):
+            self .routes .setdefault (_request_key (ex ["method"],ex ["path"],ex ["query"]),[]).append (ex )
+            self .fallback .setdefault (f"{ex ['method'].upper ()} {ex ['path']}",[]).append (ex )
+        self .served =0 
+
+    @property 
+    def base_url (self )->str :
+        host ,port =self .server_address [:2 ]
+        return f"http://{host }:{port }"
+
+    def lookup (self ,method :str ,path :str ,query :str )->Optional [dict ]:
+        key =_request_key (method ,path ,query )
+        candidates =self .routes .get (key )or self .fallback .get (f"{method .upper ()} {path }")
+        if not candidates :
+            return None 
+        with self ._cursor_lock :
+            idx =self ._cursor .get (key ,0 )
+            self ._cursor [key ]=idx +1 
+            self .served +=1 
+        return candidates [idx %len (candidates )]
+
+    def rewrite_location (self ,value :str )->str :
+        for origin in self .origins :
+            if not origin :
+                continue 
+            host =urlsplit (origin ).netloc 
+            for prefix in (f"https://{host }",f"http://{host }"):
+                if value .startswith (prefix ):
+                    return self .base_url +value [len (prefix ):]
+        return value 
+
+    def start (self )->threading .Thread :
+        t =threading .Thread (target =self .serve_forever ,name ="replay-server",daemon =True )
+        t .start ()
+        return t 
+
+
+class _ReplayHandler (BaseHTTPRequestHandler ):
+    protocol_version ="HTTP/1.1"
+    server :ReplayServer 
+
+    def log_message (self ,fmt ,*args )->None :
+        pass 
+
+    def _replay (self ,method :str )->None :
+        length =int (self .headers .get ("Content-Length")or 0 )
+        if length :
+            self .rfile .read (length )
+        parts =urlsplit (self .path )
+        ex =self .server .lookup (method ,parts .path ,parts .query )
+        if ex is None :
+            self .send_response (404 )
+            self .send_header ("Content-Length","0")
+            self .end_headers ()
+            return 
+
+        body =base64 .b64decode (ex ["body"])
+        if self .server .latency_sec :
+            time .sleep (self .server .latency_sec )
+        self .send_response (int (ex ["status"]))
+        for k ,v in ex ["headers"]:
+            self .send_header (k ,self .server .rewrite_location (v )if k .lower ()=="location"else v )
+        self .send_header ("Content-Length",str (len (body )))
+        self .end_headers ()
+
+        if not self .server .bytes_per_sec :
+            self .wfile .write (body )
+            return 
+        chunk =16 *1024 
+        for i in range (0 ,len (body ),chunk ):
+            piece =body [i :i +chunk ]
+            self .wfile .write (piece )
+            self .wfile .flush ()
+            time .sleep (len (piece )/self .server .bytes_per_sec )
+
+    def do_GET (self )->None :
+        self ._replay ("GET")
+
+    def do_POST (self )->None :
+        self ._replay ("POST")
+
+
+def bench (doc :dict ,runs :int ,latency_ms :float ,bandwidth_kbps :float ,rate_limit :float =0.0 )->int :
+    srv =ReplayServer (doc ,latency_ms =latency_ms ,bandwidth_kbps =bandwidth_kbps )
+    srv .start ()
+    app .configure_endpoints (srv .base_url ,srv .base_url )
+    # the default per-host limiter would otherwise dominate the timings against a local server
+    app .rate_limiter .configure (rate_limit )
+    page_size =int (doc .get ("page_size",app .DATA_PAGE_SIZE ))
+
+    totals :List [float ]=[]
+    phases :Dict [str ,List [float ]]={"login":[],"score":[],"stats":[]}
+    requests_per_run :List [int ]=[]
+    failures =0 
+    try :
+        for _ in range (max (1 ,runs )):
+            t0 =time .perf_counter ()
+            _raw ,ok ,msg ,meta =app .fetch_data ("replay","replay",page_size )
+            totals .append (time .perf_counter ()-t0 )
+            if not ok :
+                failures +=1 
+                print (f"失败：{msg }",file =sys .stderr )
+                continue 
+            requests_per_run .append (int (meta .get ("requests",0 )))
+            for name ,secs in (meta .get ("timings")or {}).items ():
+                phases .setdefault (name ,[]).append (float (secs ))
+    finally :
+        srv .shutdown ()
+        srv .server_close ()
+
+    print (f"回放：{len (doc .get ('exchanges',[]))} 条交换｜延迟 {latency_ms :.0f} ms｜带宽 {bandwidth_kbps or 0 :.0f} kbps｜{len (totals )} 次｜失败 {failures }")
+    print (f"{'phase':<10}{'mean(ms)':>12}{'p50(ms)':>12}{'p95(ms)':>12}")
+    for name ,values in [("total",totals )]+list (phases .items ()):
+        if not values :
+            continue 
+        print (
+        f"{name :<10}{statistics .fmean (values )*1000 :>12.1f}"
+        f"{app .percentile (values ,50 )*1000 :>12.1f}{app .percentile (values ,95 )*1000 :>12.1f}"
+        )
+    if requests_per_run :
+        print (f"每次请求数：{statistics .fmean (requests_per_run ):.1f}")
+    return 0 if failures ==0 else 1 
+
+
+def main ()->int :
+    ap =argparse .ArgumentParser (description ="zjuam/zdbk 录制与回放")
+    sub =ap .add_subparsers (dest ="command",required =True )
+
+    p_rec =sub .add_parser ("record",help ="登录并录制完整的请求/响应序列（已脱敏）")
+    p_rec .add_argument ("username")
+    p_rec .add_argument ("-o","--out",default =os .path .join (app .OUTPUT_DIR ,"replay.json"))
+    p_rec .add_argument ("--page-size",type =int ,default =app .DATA_PAGE_SIZE )
+
+    for name ,help_text in (("serve","启动本地回放服务器"),("bench","对回放服务器运行 fetch_data 基准测试")):
+        p =sub .add_parser (name ,help =help_text )
+        p .add_argument ("recording")
+        p .add_argument ("--latency-ms",type =float ,default =0.0 ,help ="每个响应的附加延迟")
+        p .add_argument ("--bandwidth-kbps",type =float ,default =0.0 ,help ="响应体带宽上限，0 表示不限")
+        if name =="serve":
+            p .add_argument ("--port",type =int ,default =8765 )
+        else :
+            p .add_argument ("-n","--runs",type =int ,default =10 )
+            p .add_argument ("--rate-limit",type =float ,default =0.0 ,help ="每个主机每秒请求上限，0 表示不限")
+
+    args =ap .parse_args ()
+    if args .command =="record":
+        password =getpass .getpass ("密码：")
+        ok ,msg =record (args .username ,password ,args .out ,args .page_size )
+        print (f"{msg }｜已写入 {args .out }")
+        return 0 if ok else 1 
+
+    doc =load_recording (args .recording )
+    if args .command =="bench":
+        return bench (doc ,args .runs ,args .latency_ms ,args .bandwidth_kbps ,args .rate_limit )
+
+    srv =ReplayServer (doc ,port =args .port ,latency_ms =args .latency_ms ,bandwidth_kbps =args .bandwidth_kbps )
+    print (f"回放服务器：{srv .base_url }")
+    print (f"  ZJU_CAS_BASE={srv .base_url } ZJU_ZDBK_BASE={srv .base_url } python zju_innercurly_tool_2.py")
+    try :
+        srv .serve_forever ()
+    except KeyboardInterrupt :
+        pass 
+    finally :
+        srv .server_close ()
+    return 0 
+
+
+if __name__ =="__main__":
+    sys .exit (main ())
@@ -0,0 +1,623 @@
+# -*- coding: utf-8 -*-
+# Load test: N simulated pollers against a local mock of the CAS login flow and both zdbk endpoints.
+#   python tools/load_test.py run -n 50 --interval 2 --duration 60 --error-rate 0.05
+#   python tools/load_test.py serve --port 8766 --latency-ms 30
+#   python tools/load_test.py run --server http://127.0.0.1:8766 -n 200 --json data/load.json
+# Soak: thousands of poll cycles in one session, watching RSS, tracemalloc, threads and Tk widgets.
+#   python tools/load_test.py soak --cycles 5000 --churn-every 100 [--gui]
+from __future__ import annotations 
+
+import argparse 
+import gc 
+import json 
+import os 
+import random 
+import secrets 
+import subprocess 
+import sys 
+import tempfile 
+import threading 
+import time 
+import tracemalloc 
+from http .server import BaseHTTPRequestHandler ,ThreadingHTTPServer 
+from typing import Dict ,List ,Optional 
+from urllib .parse import parse_qs ,urlsplit 
+
+sys .path .insert (0 ,os .path .dirname (os .path .dirname (os .path .abspath (__file__ ))))
+
+import zju_innercurly_tool_2 as app 
+
+MOCK_MODULUS ="c"+"".join (random .Random (7 ).choice ("0123456789abcdef")for _ in range (126 ))+"1"
+MOCK_EXPONENT ="10001"
+MOCK_COURSES =60 
+SOAK_SNAPSHOT_KEEP =200 
+LOGIN_PATH ="/cas/login"
+PUBKEY_PATH ="/cas/v2/getPubKey"
+SSO_PATH ="/jwglxt/xtgl/login_ssologin.html"
+INDEX_PATH ="/jwglxt/xtgl/index_initMenu.html"
+SCORE_PATH ="/jwglxt/cxdy/xscjcx_cxXscjIndex.html"
+STATS_PATH ="/jwglxt/zycjtj/xszgkc_cxXsZgkcIndex.html"
+LOGIN_PAGE ="""<!DOCTYPE html><html><head><meta charset="utf-8"><title>统一身份认证平台</title></head><body>
+<form id="fm1" method="post"><input id="username" name="username" type="text" value=""/>
+<input id="password" name="password" type="password" value=""/>
+<input type="hidden" name="execution" value="{execution}"/><input type="hidden" name="_eventId" value="submit"/>
+</form></body></html>"""
+
+
+def _mock_items (username :str ,count :int ,major :bool )->List [dict ]:
+    # same seed for both endpoints so each xszgkc row matches its score twin
+    rng =random .Random (username )
+    items =[]
+    for i in range (count ):
+        year =2021 +i //16 
+        term =1 +(i //8 )%2 
+        items .append ({
+        "kcmc":f"模拟课程{i :03d}",
+        "kch":f"MOCK{i :04d}",
+        "xkkh":f"({year }-{year +1 }-{term })-MOCK{i :04d}-0000001-1",
+        "xf":str (rng .choice ((1.0 ,1.5 ,2.0 ,2.5 ,3.0 ,4.0 ))),
+        "cj":str (rng .randint (60 ,100 )),
+        "xdbjmc":"已修"if major else "",
+        })
+    return items [:count //2 ]if major else items 
+
+
+class MockZjuServer (ThreadingHTTPServer ):
+    daemon_threads =True 
+
+    def __init__ (
+    self ,
+    host :str ="127.0.0.1",
+    port :int =0 ,
+    *,
+    latency_ms :float =0.0 ,
+    jitter_ms :float =0.0 ,
+    error_rate :float =0.0 ,
+    expire_rate :float =0.0 ,
+    churn_every :int =0 ,
+    courses :int =MOCK_COURSES 
+    ):
+        super ().__init__ ((host ,port ),_MockHandler )
+        self .latency_sec =max (0.0 ,float (latency_ms ))/1000.0 
+        self .jitter_sec =max (0.0 ,float (jitter_ms ))/1000.0 
+        self .error_rate =max (0.0 ,min (1.0 ,float (error_rate )))
+        self .expire_rate =max (0.0 ,min (1.0 ,float (expire_rate )))
+        self .courses =max (0 ,int (courses ))
+        self .churn_every =max (0 ,int (churn_every ))
+        self .tickets :Dict [str ,str ]={}
+        self .sessions :Dict [str ,str ]={}
+        self .served =0 
+        self .errors =0 
+        self ._lock =threading .Lock ()
+        self ._items :Dict [tuple ,List [dict ]]={}
+        self ._score_reads :Dict [str ,int ]={}
+
+    @property 
+    def base_url (self )->str :
+        host ,port =self .server_address [:2 ]
+        return f"http://{host }:{port }"
+
+    def items_for (self ,username :str ,major :bool )->List [dict ]:
+        key =(username ,major )
+        with self ._lock :
+            items =self ._items .get (key )
+            if items is None :
+                items =self ._items [key ]=_mock_items (username ,self .courses ,major )
+            return items 
+
+    def score_items (self ,username :str )->List [dict ]:
+        # with churn, the first row's grade flips every churn_every reads: same rows, changed fingerprint
+        items =self .items_for (username ,False )
+        if not self .churn_every or not items :
+            return items 
+        with self ._lock :
+            n =self ._score_reads .get (username ,0 )
+            self ._score_reads [username ]=n +1 
+        if (n //self .churn_every )%2 ==0 :
+            return items 
+        return [dict (items [0 ],cj =str (100 -int (items [0 ]["cj"])+60 ))]+items [1 :]
+
+    def start (self )->threading .Thread :
+        t =threading .Thread (target =self .serve_forever ,name ="mock-zju",daemon =True )
+        t .start ()
+        return t 
+
+
+class _MockHandler (BaseHTTPRequestHandler ):
+    protocol_version ="HTTP/1.1"
+    server :MockZjuServer 
+
+    def log_message (self ,fmt ,*args )->None :
+        pass 
+
+    def _reply (self ,status :int ,body :bytes =b"",ctype :str ="text/html; charset=utf-8",headers :Optional [List [tuple ]]=None )->None :
+        self .send_response (status )
+        self .send_header ("Content-Type",ctype )
+        for k ,v in headers or []:
+            self .send_header (k ,v )
+        self .send_header ("Content-Length",str (len (body )))
+        self .end_headers ()
+        if body :
+            self .wfile .write (body )
+
+    def _redirect (self ,location :str ,cookie :str ="")->None :
+        headers =[("Location",location )]
+        if cookie :
+            headers .append (("Set-Cookie",cookie ))
+        self ._reply (302 ,headers =headers )
+
+    def _cookie (self ,name :str )->str :
+        for part in (self .headers .get ("Cookie")or "").split (";"):
+            k ,_sep ,v =part .strip ().partition ("=")
+            if k ==name :
+                return v 
+        return ""
+
+    def _handle (self ,method :str )->None :
+        srv =self .server 
+        length =int (self .headers .get ("Content-Length")or 0 )
+        form =parse_qs (self .rfile .read (length ).decode ("utf-8"))if length else {}
+        parts =urlsplit (self .path )
+        query =parse_qs (parts .query )
+        with srv ._lock :
+            srv .served +=1 
+        if srv .latency_sec or srv .jitter_sec :
+            time .sleep (srv .latency_sec +random .uniform (0.0 ,srv .jitter_sec ))
+        if srv .error_rate and random .random ()<srv .error_rate :
+            with srv ._lock :
+                srv .errors +=1 
+            self ._reply (500 ,b"mock error")
+            return 
+
+        if parts .path ==LOGIN_PATH and method =="GET":
+            body =LOGIN_PAGE .format (execution =secrets .token_hex (16 )).encode ("utf-8")
+            self ._reply (200 ,body ,headers =[("Set-Cookie",f"_pv0={secrets .token_hex (8 )}; Path=/")])
+        elif parts .path ==LOGIN_PATH :
+            username =(form .get ("username")or [""])[0 ]
+            if not username or not (form .get ("execution")or [""])[0 ]:
+                self ._reply (200 ,"用户名或密码错误".encode ("utf-8"))
+                return 
+            ticket =f"ST-{secrets .token_hex (8 )}"
+            with srv ._lock :
+                srv .tickets [ticket ]=username 
+            self ._redirect (f"{srv .base_url }{SSO_PATH }?ticket={ticket }")
+        elif parts .path ==PUBKEY_PATH :
+            body =json .dumps ({"modulus":MOCK_MODULUS ,"exponent":MOCK_EXPONENT }).encode ("utf-8")
+            self ._reply (200 ,body ,"application/json")
+        elif parts .path ==SSO_PATH :
+            with srv ._lock :
+                username =srv .tickets .pop ((query .get ("ticket")or [""])[0 ],"")
+                token =secrets .token_hex (12 )if username else ""
+                if token :
+                    srv .sessions [token ]=username 
+            if not token :
+                self ._redirect (f"{srv .base_url }{LOGIN_PATH }")
+                return 
+            self ._redirect (f"{srv .base_url }{INDEX_PATH }",f"JSESSIONID={token }; Path=/")
+        elif parts .path ==INDEX_PATH :
+            self ._reply (200 ,b"<html><body>index</body></html>")
+        elif parts .path in (SCORE_PATH ,STATS_PATH ):
+            token =self ._cookie ("JSESSIONID")
+            with srv ._lock :
+                username =srv .sessions .get (token ,"")
+                if username and srv .expire_rate and random .random ()<srv .expire_rate :
+                    srv .sessions .pop (token ,None )
+                    username =""
+            if not username :
+                self ._redirect (f"{srv .base_url }{LOGIN_PATH }")
+                return 
+            items =srv .items_for (username ,True )if parts .path ==STATS_PATH else srv .score_items (username )
+            show =int (app .safe_float ((query .get ("queryModel.showCount")or ["0"])[0 ],0 ))or len (items )or 1 
+            page =max (1 ,int (app .safe_float ((query .get ("queryModel.currentPage")or ["1"])[0 ],1 )))
+            chunk =items [(page -1 )*show :page *show ]
+            total_pages =max (1 ,(len (items )+show -1 )//show )
+            body =json .dumps ({"items":chunk ,"totalPage":total_pages ,"currentPage":page },ensure_ascii =False ).encode ("utf-8")
+            self ._reply (200 ,body ,"application/json;charset=UTF-8")
+        else :
+            self ._reply (404 )
+
+    def do_GET (self )->None :
+        self ._handle ("GET")
+
+    def do_POST (self )->None :
+        self ._handle ("POST")
+
+
+def _rss_mb ()->float :
+    try :
+        with open ("/proc/self/statm","r")as f :
+            pages =int (f .read ().split ()[1 ])
+        return pages *os .sysconf ("SC_PAGE_SIZE")/(1024 *1024 )
+    except (OSError ,ValueError ,AttributeError ):
+        pass 
+    try :
+        import resource 
+
+        peak =resource .getrusage (resource .RUSAGE_SELF ).ru_maxrss 
+        return peak /(1024 *1024 )if sys .platform =="darwin"else peak /1024 
+    except Exception :
+        return 0.0 
+
+
+class PollerStats :
+
+    def __init__ (self ):
+        self .latencies :List [float ]=[]
+        self .ok =0 
+        self .failed :Dict [str ,int ]={}
+        self .relogins =0 
+        self ._lock =threading .Lock ()
+
+    def add (self ,ok :bool ,meta :Dict [str ,object ])->None :
+        with self ._lock :
+            self .latencies .append (float (meta .get ("elapsed",0.0 )or 0.0 ))
+            if ok :
+                self .ok +=1 
+            else :
+                key =str (meta .get ("error_type")or "other")
+                self .failed [key ]=self .failed .get (key ,0 )+1 
+            if meta .get ("relogin"):
+                self .relogins +=1 
+
+    def drain (self )->List [float ]:
+        with self ._lock :
+            out ,self .latencies =self .latencies ,[]
+        return out 
+
+
+def _poller (username :str ,interval :float ,fresh :bool ,stop :threading .Event ,stats :PollerStats )->None :
+    # mirrors the GUI poll loop: one reused session, PollScheduler deciding the next delay
+    scheduler =app .PollScheduler (interval )
+    zs =None if fresh else app .ZdbkSession (username ,"mock-password")
+    stop .wait (random .uniform (0.0 ,interval ))
+    try :
+        while not stop .is_set ():
+            if zs is None :
+                _raw ,ok ,_msg ,meta =app .fetch_data (username ,"mock-password")
+            else :
+                _raw ,ok ,_msg ,meta =zs .fetch (stop )
+            if meta .get ("error_type")==app .ERR_CANCELLED :
+                return 
+            stats .add (ok ,meta )
+            delay =scheduler .record (ok ,meta .get ("error_type"))
+            if delay is None :
+                return 
+            stop .wait (delay )
+    finally :
+        if zs is not None :
+            zs .close ()
+
+
+def _spawn_server (args )->tuple :
+    cmd =[
+    sys .executable ,os .path .abspath (__file__ ),"serve","--port","0",
+    "--latency-ms",str (args .latency_ms ),"--jitter-ms",str (args .jitter_ms ),
+    "--error-rate",str (args .error_rate ),"--expire-rate",str (args .expire_rate ),
+    "--courses",str (args .courses ),"--churn-every",str (getattr (args ,"churn_every",0 ))
+    ]
+    proc =subprocess .Popen (cmd ,stdout =subprocess .PIPE ,text =True )
+    line =proc .stdout .readline ().strip ()
+    if not line .startswith ("http"):
+        proc .kill ()
+        raise RuntimeError (f"mock server failed to start: {line !r}")
+    return proc ,line 
+
+
+def run (args )->int :
+    proc =None 
+    base =args .server 
+    if not base :
+        # separate process so the client's CPU, RSS and thread counts are not mixed with the server's
+        proc ,base =_spawn_server (args )
+    app .configure_endpoints (base ,base )
+    app .rate_limiter .configure (args .rate_limit )
+    app .configure_data_pools (args .pollers )
+
+    stats =PollerStats ()
+    stop =threading .Event ()
+    threads =[
+    threading .Thread (target =_poller ,args =(f"3200{i :06d}",args .interval ,args .fresh ,stop ,stats ),name =f"poller-{i }",daemon =True )
+    for i in range (max (1 ,args .pollers ))
+    ]
+    print (f"模拟服务器：{base }｜轮询器 {len (threads )}｜间隔 {args .interval :g}s｜时长 {args .duration :g}s｜错误率 {args .error_rate :g}")
+    print (f"{'t(s)':>6}{'polls/s':>9}{'p50(ms)':>9}{'p95(ms)':>9}{'p99(ms)':>9}{'cpu%':>7}{'rss(MB)':>9}{'threads':>8}{'ok':>8}{'fail':>6}")
+
+    timeline :List [dict ]=[]
+    all_latencies :List [float ]=[]
+    start =time .perf_counter ()
+    last_wall ,last_cpu =start ,time .process_time ()
+    for t in threads :
+        t .start ()
+    try :
+        while True :
+            elapsed =time .perf_counter ()-start 
+            if elapsed >=args .duration :
+                break 
+            time .sleep (min (args .sample_sec ,args .duration -elapsed ))
+            now ,cpu =time .perf_counter (),time .process_time ()
+            window =stats .drain ()
+            all_latencies .extend (window )
+            sample ={
+            "t":round (now -start ,2 ),
+            "polls_per_sec":round (len (window )/max (1e-9 ,now -last_wall ),3 ),
+            "p50":round (app .percentile (window ,50 ),4 ),
+            "p95":round (app .percentile (window ,95 ),4 ),
+            "p99":round (app .percentile (window ,99 ),4 ),
+            "cpu_pct":round ((cpu -last_cpu )/max (1e-9 ,now -last_wall )*100.0 ,1 ),
+            "rss_mb":round (_rss_mb (),1 ),
+            "threads":threading .active_count (),
+            "ok":stats .ok ,
+            "failed":sum (stats .failed .values ())
+            }
+            last_wall ,last_cpu =now ,cpu 
+            timeline .append (sample )
+            print (
+            f"{sample ['t']:>6.0f}{sample ['polls_per_sec']:>9.2f}{sample ['p50']*1000 :>9.0f}{sample ['p95']*1000 :>9.0f}"
+            f"{sample ['p99']*1000 :>9.0f}{sample ['cpu_pct']:>7.1f}{sample ['rss_mb']:>9.1f}{sample ['threads']:>8}"
+            f"{sample ['ok']:>8}{sample ['failed']:>6}"
+            )
+    except KeyboardInterrupt :
+        pass 
+    finally :
+        stop .set ()
+        for t in threads :
+            t .join (timeout =max (app .TIMEOUT ))
+        if proc is not None :
+            proc .terminate ()
+            proc .wait ()
+
+    all_latencies .extend (stats .drain ())
+    wall =time .perf_counter ()-start 
+    summary ={
+    "server":base ,
+    "pollers":len (threads ),
+    "interval":args .interval ,
+    "wall_sec":round (wall ,3 ),
+    "polls":len (all_latencies ),
+    "polls_per_sec":round (len (all_latencies )/wall ,3 )if wall >0 else 0.0 ,
+    "ok":stats .ok ,
+    "failed":dict (stats .failed ),
+    "relogins":stats .relogins ,
+    "latency_p50":round (app .percentile (all_latencies ,50 ),4 ),
+    "latency_p95":round (app .percentile (all_latencies ,95 ),4 ),
+    "latency_p99":round (app .percentile (all_latencies ,99 ),4 ),
+    "rate_limit":app .rate_limiter .metrics (),
+    "timeline":timeline 
+    }
+    failed_text ="，".join (f"{k } {v }"for k ,v in sorted (stats .failed .items ()))or "无"
+    print (
+    f"合计 {summary ['polls']} 次｜{summary ['polls_per_sec']:.2f} 次/s｜成功 {stats .ok }｜失败 {failed_text }｜重新登录 {stats .relogins }｜"
+    f"p50 {summary ['latency_p50']*1000 :.0f}ms｜p95 {summary ['latency_p95']*1000 :.0f}ms｜p99 {summary ['latency_p99']*1000 :.0f}ms"
+    )
+    if args .json :
+        app .ensure_dir (os .path .dirname (os .path .abspath (args .json )))
+        with open (args .json ,"w",encoding ="utf-8")as f :
+            json .dump (summary ,f ,ensure_ascii =False ,indent =2 )
+        print (f"已写入 {args .json }")
+    return 0 
+
+
+def _open_fds ()->int :
+    try :
+        return len (os .listdir ("/proc/self/fd"))
+    except OSError :
+        return -1 
+
+
+def _count_widgets (w )->int :
+    return 1 +sum (_count_widgets (c )for c in w .winfo_children ())
+
+
+class SoakGui :
+    # drives a hidden GradeApp through the same handlers the poll loop uses
+
+    def __init__ (self ,zs ,raw :List [dict ],meta :Dict [str ,object ],data_dir :str ):
+        app .CONFIG_FILE =os .path .join (data_dir ,"config.json")
+        app .SNAPSHOT_DIR =os .path .join (data_dir ,"snapshots")
+        app .SESSION_FILE =os .path .join (data_dir ,"session.json")
+        app .SNAPSHOT_KEEP =SOAK_SNAPSHOT_KEEP 
+        self .root =app .GradeApp ()
+        self .root .withdraw ()
+        self .root ._handle_net_result ({
+        "type":"login_result","ok":True ,"msg":"","meta":meta ,"raw":raw ,
+        "username":zs .username ,"password":zs .password ,"session":zs 
+        })
+        self .root .update ()
+
+    def feed (self ,raw :List [dict ],ok :bool ,msg :str ,meta :Dict [str ,object ])->None :
+        item ={"type":"poll_result","ok":ok ,"msg":msg ,"meta":meta ,"raw":raw }
+        self .root ._handle_net_result (item )
+        self .root ._record_fetch (item )
+        self .root .update ()
+
+    def counts (self )->Dict [str ,int ]:
+        return {
+        "widgets":_count_widgets (self .root ),
+        "tcl_commands":len (self .root .tk .splitlist (self .root .tk .call ("info","commands"))),
+        "after":len (self .root .tk .splitlist (self .root .tk .call ("after","info"))),
+        "log_lines":int (self .root .txt_log .index ("end-1c").split (".")[0 ])if hasattr (self .root ,"txt_log")else 0 
+        }
+
+    def close (self )->None :
+        self .root ._on_close ()
+
+
+def soak (args )->int :
+    proc ,base =(None ,args .server )if args .server else _spawn_server (args )
+    app .configure_endpoints (base ,base )
+    app .rate_limiter .configure (0 )
+    data_dir =tempfile .mkdtemp (prefix ="zju-soak-")
+    snap_dir =os .path .join (data_dir ,"snapshots")
+
+    tracemalloc .start (10 )
+    zs =app .ZdbkSession ("3200000001","mock-password")
+    gui =None 
+    raw ,ok ,msg ,meta =zs .fetch ()
+    if not ok :
+        print (f"首次拉取失败：{msg }",file =sys .stderr )
+        return 1 
+    if args .gui :
+        try :
+            gui =SoakGui (zs ,raw ,meta ,data_dir )
+        except Exception as e :
+            print (f"无法创建 Tk 窗口（{e }），仅运行无界面部分。",file =sys .stderr )
+    courses ,course_by_key =app .normalize_courses (raw )
+    fingerprint =str (meta .get ("fingerprint",""))
+
+    print (f"模拟服务器：{base }｜{args .cycles } 轮｜每 {args .sample_every } 轮采样｜变化周期 {args .churn_every }｜界面 {'开'if gui else '关'}")
+    header =f"{'cycle':>7}{'rss(MB)':>9}{'heap(KB)':>10}{'objects':>9}{'threads':>8}{'fds':>5}{'changed':>8}{'fail':>6}"
+    if gui :
+        header +=f"{'widgets':>8}{'tclcmd':>8}{'after':>6}{'log':>6}"
+    print (header )
+
+    timeline :List [dict ]=[]
+    baseline =None 
+    changed =failed =0 
+    try :
+        for cycle in range (1 ,args .cycles +1 ):
+            raw ,ok ,msg ,meta =zs .fetch (refresh_stats =False )
+            if gui is not None :
+                gui .feed (raw ,ok ,msg ,meta )
+            elif ok and str (meta .get ("fingerprint",""))!=fingerprint :
+                # the headless mirror of the GUI's changed-data path
+                fingerprint =str (meta .get ("fingerprint",""))
+                courses ,course_by_key =app .normalize_courses (raw )
+                app .write_courses_snapshot (courses ,snap_dir ,keep =SOAK_SNAPSHOT_KEEP )
+            failed +=0 if ok else 1 
+            changed +=1 if ok and not meta .get ("stats_skipped")else 0 
+            if args .interval :
+                time .sleep (args .interval )
+            if cycle %args .sample_every and cycle !=args .cycles :
+                continue 
+
+            gc .collect ()
+            current ,_peak =tracemalloc .get_traced_memory ()
+            sample ={
+            "cycle":cycle ,
+            "rss_mb":round (_rss_mb (),2 ),
+            "heap_kb":round (current /1024 ,1 ),
+            "objects":len (gc .get_objects ()),
+            "threads":threading .active_count (),
+            "fds":_open_fds (),
+            "changed":changed ,
+            "failed":failed 
+            }
+            if gui is not None :
+                sample .update (gui .counts ())
+            timeline .append (sample )
+            line =(
+            f"{cycle :>7}{sample ['rss_mb']:>9.1f}{sample ['heap_kb']:>10.1f}{sample ['objects']:>9}"
+            f"{sample ['threads']:>8}{sample ['fds']:>5}{changed :>8}{failed :>6}"
+            )
+            if gui is not None :
+                line +=f"{sample ['widgets']:>8}{sample ['tcl_commands']:>8}{sample ['after']:>6}{sample ['log_lines']:>6}"
+            print (line )
+            if baseline is None :
+                # first sample is the warmed-up reference: pools, caches and the latency window are full by now
+                baseline =tracemalloc .take_snapshot ()
+    except KeyboardInterrupt :
+        pass 
+    finally :
+        if gui is not None :
+            gui .close ()
+        zs .close ()
+        if proc is not None :
+            proc .terminate ()
+            proc .wait ()
+
+    growth =[]
+    if baseline is not None :
+        stats =tracemalloc .take_snapshot ().compare_to (baseline ,"lineno")
+        growth =[s for s in stats if s .size_diff >0 ][:args .top ]
+        print (f"相对第 {timeline [0 ]['cycle']} 轮的内存增长（前 {args .top }）：")
+        for s in growth :
+            frame =s .traceback [0 ]
+            print (f"  {s .size_diff /1024 :>9.1f} KB {s .count_diff :>+7} 块  {frame .filename }:{frame .lineno }")
+    tracemalloc .stop ()
+
+    if len (timeline )>=2 :
+        first ,last =timeline [0 ],timeline [-1 ]
+        per_k =1000.0 /max (1 ,last ["cycle"]-first ["cycle"])
+        keys =[k for k in ("rss_mb","heap_kb","objects","threads","fds","widgets","tcl_commands","after")if k in last ]
+        print ("每千轮变化："+"｜".join (f"{k } {(last [k ]-first [k ])*per_k :+.1f}"for k in keys ))
+    snapshots =len (os .listdir (snap_dir ))if os .path .isdir (snap_dir )else 0 
+    print (f"快照文件：{snapshots }（{snap_dir }）")
+    if args .json :
+        doc ={
+        "server":base ,"cycles":args .cycles ,"churn_every":args .churn_every ,"gui":gui is not None ,
+        "snapshots":snapshots ,"timeline":timeline ,
+        "growth":[{"where":f"{s .traceback [0 ].filename }:{s .traceback [0 ].lineno }","kb":round (s .size_diff /1024 ,1 ),"blocks":s .count_diff }for s in growth ]
+        }
+        app .ensure_dir (os .path .dirname (os .path .abspath (args .json )))
+        with open (args .json ,"w",encoding ="utf-8")as f :
+            json .dump (doc ,f ,ensure_ascii =False ,indent =2 )
+        print (f"已写入 {args .json }")
+    return 0 
+
+
+def _add_server_args (p )->None :
+    p .add_argument ("--latency-ms",type =float ,default =20.0 ,help ="每个响应的附加延迟")
+    p .add_argument ("--jitter-ms",type =float ,default =10.0 ,help ="附加延迟的随机抖动上限")
+    p .add_argument ("--error-rate",type =float ,default =0.0 ,help ="返回 HTTP 500 的概率")
+    p .add_argument ("--expire-rate",type =float ,default =0.0 ,help ="数据请求时会话被判过期的概率")
+    p .add_argument ("--courses",type =int ,default =MOCK_COURSES ,help ="每个账号的成绩条数")
+    p .add_argument ("--churn-every",type =int ,default =0 ,help ="每读取多少次成绩就改动一条成绩，0 表示不变")
+
+
+def main ()->int :
+    ap =argparse .ArgumentParser (description ="CAS/zdbk 本地模拟服务器与轮询压力测试")
+    sub =ap .add_subparsers (dest ="command",required =True )
+
+    p_serve =sub .add_parser ("serve",help ="启动本地 CAS/zdbk 模拟服务器")
+    p_serve .add_argument ("--port",type =int ,default =8766 )
+    _add_server_args (p_serve )
+
+    p_run =sub .add_parser ("run",help ="运行 N 个模拟轮询器并按时间输出指标")
+    p_run .add_argument ("-n","--pollers",type =int ,default =20 )
+    p_run .add_argument ("--interval",type =float ,default =5.0 ,help ="每个轮询器的间隔（秒）")
+    p_run .add_argument ("--duration",type =float ,default =60.0 ,help ="运行时长（秒）")
+    p_run .add_argument ("--sample-sec",type =float ,default =5.0 ,help ="指标采样间隔（秒）")
+    p_run .add_argument ("--fresh",action ="store_true",help ="每次轮询都调用 fetch_data 重新登录，而不是复用会话")
+    p_run .add_argument ("--rate-limit",type =float ,default =0.0 ,help ="每个主机每秒请求上限，0 表示不限")
+    p_run .add_argument ("--server",default ="",help ="使用已运行的模拟服务器，不再自动启动")
+    p_run .add_argument ("--json",default ="",help ="把汇总与时间线写入 JSON 文件")
+    _add_server_args (p_run )
+
+    p_soak =sub .add_parser ("soak",help ="长时间轮询单个会话，观察内存、线程与 Tk 控件是否增长")
+    p_soak .add_argument ("--cycles",type =int ,default =3000 )
+    p_soak .add_argument ("--sample-every",type =int ,default =250 ,help ="每多少轮采样一次")
+    p_soak .add_argument ("--interval",type =float ,default =0.0 ,help ="两轮之间的休眠（秒）")
+    p_soak .add_argument ("--gui",action ="store_true",help ="同时驱动隐藏的 GradeApp（需要图形环境）")
+    p_soak .add_argument ("--top",type =int ,default =10 ,help ="列出增长最多的分配位置数")
+    p_soak .add_argument ("--server",default ="",help ="使用已运行的模拟服务器，不再自动启动")
+    p_soak .add_argument ("--json",default ="",help ="把时间线与增长明细写入 JSON 文件")
+    _add_server_args (p_soak )
+    p_soak .set_defaults (latency_ms =0.0 ,jitter_ms =0.0 ,churn_every =100 )
+
+    args =ap .parse_args ()
+    if args .command =="run":
+        return run (args )
+    if args .command =="soak":
+        return soak (args )
+
+    srv =MockZjuServer (
+    port =args .port ,
+    latency_ms =args .latency_ms ,
+    jitter_ms =args .jitter_ms ,
+    error_rate =args .error_rate ,
+    expire_rate =args .expire_rate ,
+    churn_every =args .churn_every ,
+    courses =args .courses 
+    )
+    print (srv .base_url ,flush =True )
+    try :
+        srv .serve_forever ()
+    except KeyboardInterrupt :
+        pass 
+    finally :
+        srv .server_close ()
+    return 0 
+
+
+if __name__ =="__main__":
+    sys .exit (main ())
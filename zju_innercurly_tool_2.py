@@ -1,21 +1,36 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations 
 
+import argparse 
+import asyncio 
 import base64 
+import bisect 
+import csv 
+import hashlib 
+import heapq 
+import io 
 import json 
 import os 
+import random 
+import re 
 import shutil 
+import signal 
 import sys 
 import threading 
 import time 
-from dataclasses import dataclass 
+from collections import deque 
+from concurrent .futures import FIRST_COMPLETED ,Future ,ThreadPoolExecutor ,wait 
+from dataclasses import dataclass ,replace 
 from datetime import datetime 
+from functools import lru_cache 
+from html import unescape 
+from http .server import BaseHTTPRequestHandler ,ThreadingHTTPServer 
 from queue import Queue ,Empty 
-from typing import Dict ,List ,Optional ,Tuple 
+from typing import Callable ,Dict ,Iterator ,List ,Optional ,Tuple 
+from urllib .parse import quote ,urlsplit 
 
 
 import requests 
-from bs4 import BeautifulSoup 
 
 import tkinter as tk 
 from tkinter import ttk ,messagebox ,simpledialog 
@@ -27,6 +42,12 @@ try :
 except Exception :
     PLYER_AVAILABLE =False 
 
+try :
+    import aiohttp 
+    AIOHTTP_AVAILABLE =True 
+except Exception :
+    AIOHTTP_AVAILABLE =False 
+
 
     
 APP_TITLE ="ZJUのInnerCruly小工具(made by Colamentos's GPT5.2)"
@@ -90,12 +111,42 @@ migrate_portable_data_if_needed (DATA_ROOT ,"data")
 OUTPUT_DIR =os .path .join (DATA_ROOT ,"data")
 CONFIG_FILE =os .path .join (OUTPUT_DIR ,"config.json")
 SNAPSHOT_DIR =os .path .join (OUTPUT_DIR ,"snapshots")
+SESSION_FILE =os .path .join (OUTPUT_DIR ,"session.json")
+SNAPSHOT_KEEP =50 # newest courses_*.json kept per directory; ZJU_SNAPSHOT_KEEP=0 keeps every one
+INGEST_CHUNK_SIZE =1 <<16 
 
 
 MAX_RETRIES =3 
 TIMEOUT =(5 ,12 )
+RETRY_BASE_DELAY_SEC =0.5 
+RETRY_MAX_DELAY_SEC =4.0 
+
+LATENCY_WINDOW =100 
+ADAPTIVE_TIMEOUT_MIN_SAMPLES =5 
+ADAPTIVE_TIMEOUT_FACTOR =3.0 # read timeout = p95 * factor, clamped to [floor, TIMEOUT[1]]
+ADAPTIVE_TIMEOUT_FLOOR_SEC =3.0 
+HEDGE_DATA_REQUESTS =True 
+HEDGE_MIN_DELAY_SEC =0.3 
+
+RATE_LIMIT_PER_SEC =5.0 # per host, shared by every session in the process; 0 = unlimited
+RATE_LIMIT_BURST =10 
+
+FETCH_HISTORY_SIZE =50 
+NETWORK_WORKERS =2 
+
+POLL_BACKOFF_MAX_SEC =600 
+POLL_API_FAILURES_TO_OPEN =3 
+POLL_CIRCUIT_COOLDOWN_SEC =1800 
+
+WATCH_DEFAULT_INTERVAL_SEC =300 
+WATCH_MIN_INTERVAL_SEC =5 
+WATCH_CONCURRENCY =4 
+
+METRICS_BUCKETS =(0.05 ,0.1 ,0.25 ,0.5 ,1.0 ,2.5 ,5.0 ,10.0 ,30.0 )
+METRICS_TEXTFILE_INTERVAL_SEC =15 
 
-MAX_SEMESTER_INDEX =12 
+CIRCUIT_CLOSED ="closed"
+CIRCUIT_OPEN ="open"
 
 TYPE_CORE ="专业核心课程"
 TYPE_MAJOR ="主修课程"
@@ -189,8 +240,13 @@ def map_semester (semester_code :str )->str :
     
     if not semester_code or not isinstance (semester_code ,str )or len (semester_code )<12 :
         return "未知学期"
+    # xkkh is unique per class but its "(yyyy-yyyy-t)" prefix is shared, so memoise on the prefix
+    return _map_semester_part (semester_code [1 :].partition (")")[0 ])
+
+
+@lru_cache (maxsize =256 )
+def _map_semester_part (semester_part :str )->str :
     try :
-        semester_part =semester_code [1 :].split (")")[0 ]
         start_year ,end_year ,term =semester_part .split ("-")
         short_start =str (int (start_year )%100 ).zfill (2 )
         short_end =str (int (end_year )%100 ).zfill (2 )
@@ -212,6 +268,55 @@ def parse_semester_sort_key (sem :str )->Tuple [int ,int ]:
         return (9999 ,9 )
 
 
+class SemesterRegistry :
+    # interns semester labels into dense ids; ranks follow chronological order and are rebuilt only when a new label appears
+
+    def __init__ (self ):
+        self ._lock =threading .Lock ()
+        self ._ids :Dict [str ,int ]={}
+        self ._labels :List [str ]=[]
+        self ._sort_keys :List [Tuple [int ,int ]]=[]
+        self ._ranks :List [int ]=[]
+
+    def __len__ (self )->int :
+        return len (self ._labels )
+
+    def intern (self ,label :str )->int :
+        sid =self ._ids .get (label )
+        if sid is not None :
+            return sid 
+        with self ._lock :
+            sid =self ._ids .get (label )
+            if sid is not None :
+                return sid 
+            sid =len (self ._labels )
+            self ._labels .append (label )
+            self ._sort_keys .append (parse_semester_sort_key (label ))
+            order =sorted (range (len (self ._labels )),key =lambda i :(self ._sort_keys [i ],self ._labels [i ]))
+            ranks =[0 ]*len (order )
+            for r ,i in enumerate (order ):
+                ranks [i ]=r 
+            self ._ranks =ranks 
+            self ._ids [label ]=sid 
+            return sid 
+
+    def label (self ,sid :int )->str :
+        return self ._labels [sid ]
+
+    def sort_key (self ,sid :int )->Tuple [int ,int ]:
+        return self ._sort_keys [sid ]
+
+    def rank (self ,sid :int )->int :
+        return self ._ranks [sid ]
+
+    def ordinals (self ,sids )->Dict [int ,int ]:
+        ranks =self ._ranks 
+        return {sid :i +1 for i ,sid in enumerate (sorted (set (sids ),key =ranks .__getitem__ ))}
+
+
+semester_registry =SemesterRegistry ()
+
+
         
 GRADE_TO_GPA ={
 (95 ,100 ):5.0 ,(92 ,94 ):4.8 ,(89 ,91 ):4.5 ,(86 ,88 ):4.2 ,
@@ -378,7 +483,7 @@ class Course :
     credits :float 
     score_text :str 
     semester :str 
-    semester_index :int # 1..12
+    semester_index :int # 1-based, chronological within one student's courses
     course_type :str 
     source_major_flag :bool 
     course_code :str =""
@@ -409,6 +514,7 @@ class ConfigStore :
         "username":"",
         "password":""
         },
+        "persist_session":False ,
         "weights_by_user":{},
 
         
@@ -561,290 +667,1821 @@ class ConfigStore :
     def clear_saved_login (self )->None :
         self .set_saved_login (False ,"","")
 
+    def get_persist_session (self )->bool :
+        return bool (self .data .get ("persist_session",False ))
+
+    def set_persist_session (self ,enabled :bool )->None :
+        self .data ["persist_session"]=bool (enabled )
+        self .save ()
+
         
-def fetch_data (username :str ,password :str )->Tuple [List [dict ],bool ,str ,Dict [str ,object ]]:
-    start_ts =time .perf_counter ()
-    error_type :Optional [str ]=None 
+LOGIN_URL ="https://zjuam.zju.edu.cn/cas/login?service=https%3A%2F%2Fzdbk.zju.edu.cn%2Fjwglxt%2Fxtgl%2Flogin_ssologin.html"
+PUBKEY_URL ="https://zjuam.zju.edu.cn/cas/v2/getPubKey"
+SCORE_URL ="https://zdbk.zju.edu.cn/jwglxt/cxdy/xscjcx_cxXscjIndex.html?doType=query"
+STATS_URL ="https://zdbk.zju.edu.cn/jwglxt/zycjtj/xszgkc_cxXsZgkcIndex.html?doType=query"
+CAS_BASE ="https://zjuam.zju.edu.cn"
+ZDBK_BASE ="https://zdbk.zju.edu.cn"
+
+LEGACY_SHOW_COUNT =2000 
+ASYNC_CONCURRENCY =8 
+DATA_PAGE_SIZE =0 # 0 = single showCount=2000 request; >0 = paged
+MAX_DATA_PAGES =50 # hard stop for servers that omit totalPage or ignore the page parameter
+
+LOGIN_HEADERS ={
+"User-Agent":"Mozilla/5.0",
+"Accept":"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+"Accept-Language":"zh-CN,zh;q=0.9,en;q=0.8",
+"Connection":"keep-alive",
+}
+DATA_HEADERS ={
+"User-Agent":"Mozilla/5.0",
+"Accept":"application/json, text/javascript, */*; q=0.01",
+"Host":"zdbk.zju.edu.cn",
+"Origin":"https://zdbk.zju.edu.cn",
+"X-Requested-With":"XMLHttpRequest",
+"Connection":"keep-alive",
+}
 
-    def _meta ()->Dict [str ,object ]:
-        return {
-        "elapsed":round (float (time .perf_counter ()-start_ts ),4 ),
-        "error_type":error_type 
-        }
+ERR_SESSION_EXPIRED ="expired"
+ERR_STALE_TOKEN ="stale"
+ERR_CANCELLED ="cancelled"
 
-    headers ={
-    "User-Agent":"Mozilla/5.0",
-    "Accept":"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    "Accept-Language":"zh-CN,zh;q=0.9,en;q=0.8",
-    "Connection":"keep-alive",
-    }
-    data_headers ={
-    "User-Agent":"Mozilla/5.0",
-    "Accept":"application/json, text/javascript, */*; q=0.01",
-    "Host":"zdbk.zju.edu.cn",
-    "Origin":"https://zdbk.zju.edu.cn",
-    "X-Requested-With":"XMLHttpRequest",
-    "Connection":"keep-alive",
-    }
+LOGIN_PREFETCH_TTL_SEC =120 
+LOGIN_PREFETCH_RETRY_SEC =30 
+
+
+def configure_endpoints (cas_base :Optional [str ]=None ,zdbk_base :Optional [str ]=None )->None :
+    # point the client at another CAS/zdbk deployment, e.g. a local replay server
+    global CAS_BASE ,ZDBK_BASE ,LOGIN_URL ,PUBKEY_URL ,SCORE_URL ,STATS_URL 
+    if cas_base :
+        CAS_BASE =cas_base .rstrip ("/")
+    if zdbk_base :
+        ZDBK_BASE =zdbk_base .rstrip ("/")
+    LOGIN_URL =f"{CAS_BASE }/cas/login?service="+quote (f"{ZDBK_BASE }/jwglxt/xtgl/login_ssologin.html",safe ="")
+    PUBKEY_URL =f"{CAS_BASE }/cas/v2/getPubKey"
+    SCORE_URL =f"{ZDBK_BASE }/jwglxt/cxdy/xscjcx_cxXscjIndex.html?doType=query"
+    STATS_URL =f"{ZDBK_BASE }/jwglxt/zycjtj/xszgkc_cxXsZgkcIndex.html?doType=query"
+    DATA_HEADERS ["Host"]=urlsplit (ZDBK_BASE ).netloc 
+    DATA_HEADERS ["Origin"]=ZDBK_BASE 
+
+
+if os .environ .get ("ZJU_CAS_BASE")or os .environ .get ("ZJU_ZDBK_BASE"):
+    configure_endpoints (os .environ .get ("ZJU_CAS_BASE"),os .environ .get ("ZJU_ZDBK_BASE"))
+
+_data_pool :Optional [ThreadPoolExecutor ]=None 
+_data_pool_lock =threading .Lock ()
+_data_pool_sessions =2 # concurrent fetches the shared pools are sized for
+
+
+def configure_data_pools (concurrency :int )->None :
+    # each fetch runs score+stats side by side and each of those may hedge, so the shared pools
+    # grow with the caller's concurrency instead of capping every account at a fixed 4 threads
+    global _data_pool ,_hedge_pool ,_data_pool_sessions 
+    with _data_pool_lock :
+        if concurrency <=_data_pool_sessions :
+            return 
+        _data_pool_sessions =int (concurrency )
+        old =(_data_pool ,_hedge_pool )
+        _data_pool =_hedge_pool =None 
+    for pool in old :
+        if pool is not None :
+            pool .shutdown (wait =False )
+
+
+def _get_data_pool ()->ThreadPoolExecutor :
+    global _data_pool 
+    with _data_pool_lock :
+        if _data_pool is None :
+            _data_pool =ThreadPoolExecutor (max_workers =2 *_data_pool_sessions ,thread_name_prefix ="zdbk-data")
+        return _data_pool 
 
-    session =requests .session ()
-    session .headers .update (headers )
 
-    log_url ="https://zjuam.zju.edu.cn/cas/login?service=https%3A%2F%2Fzdbk.zju.edu.cn%2Fjwglxt%2Fxtgl%2Flogin_ssologin.html"
-    user_data ={"username":username ,"password":password ,"execution":None ,"_eventId":"submit"}
+_hedge_pool :Optional [ThreadPoolExecutor ]=None 
 
-    execution_value =None 
-    for attempt in range (MAX_RETRIES ):
+
+def _get_hedge_pool ()->ThreadPoolExecutor :
+    # separate from the data pool: score/stats workers block on these futures
+    global _hedge_pool 
+    with _data_pool_lock :
+        if _hedge_pool is None :
+            _hedge_pool =ThreadPoolExecutor (max_workers =4 *_data_pool_sessions ,thread_name_prefix ="zdbk-hedge")
+        return _hedge_pool 
+
+
+def _timed (fn ):
+    t0 =time .perf_counter ()
+    res =fn ()
+    return res ,round (float (time .perf_counter ()-t0 ),4 )
+
+
+_EXECUTION_INPUT_RE =re .compile (r"<input\b[^>]*\bname\s*=\s*[\"']execution[\"'][^>]*>",re .IGNORECASE )
+_VALUE_ATTR_RE =re .compile (r"\bvalue\s*=\s*(?:\"([^\"]*)\"|'([^']*)')",re .IGNORECASE )
+
+
+def extract_execution_fast (html :str )->Optional [str ]:
+    m =_EXECUTION_INPUT_RE .search (html or "")
+    if not m :
+        return None 
+    v =_VALUE_ATTR_RE .search (m .group (0 ))
+    if not v :
+        return ""
+    return unescape (v .group (1 )if v .group (1 )is not None else v .group (2 ))
+
+
+def extract_execution_bs4 (html :str )->Optional [str ]:
+    from bs4 import BeautifulSoup 
+
+    soup =BeautifulSoup (html or "","html.parser")
+    input_tag =soup .find ("input",{"name":"execution"})
+    if not input_tag :
+        return None 
+    return input_tag .get ("value")or ""
+
+
+EXECUTION_EXTRACTORS =[extract_execution_fast ,extract_execution_bs4 ]
+
+
+def extract_execution (html :str )->Optional [str ]:
+    for extractor in EXECUTION_EXTRACTORS :
         try :
-            res =session .get (log_url ,timeout =TIMEOUT )
-            res .raise_for_status ()
-            soup =BeautifulSoup (res .text ,"html.parser")
-            input_tag =soup .find ("input",{"name":"execution"})
-            if not input_tag :
-                error_type ="api"
-                return [],False ,"接口变更：无法获取登录参数 execution",_meta ()
-            execution_value =input_tag .get ("value")
-            if not execution_value :
-                error_type ="api"
-                return [],False ,"接口变更：登录参数 execution 为空",_meta ()
-            break 
-        except requests .exceptions .Timeout :
-            error_type ="timeout"
-            if attempt ==MAX_RETRIES -1 :
-                return [],False ,"网络超时：访问登录页超时",_meta ()
-            time .sleep (1 )
-        except requests .exceptions .RequestException as e :
-            if attempt ==MAX_RETRIES -1 :
-                return [],False ,f"访问登录页失败：{e }",_meta ()
-            time .sleep (1 )
+            value =extractor (html )
+        except Exception :
+            continue 
+        if value is not None :
+            return value 
+    return None 
 
-    user_data ["execution"]=execution_value 
 
-    try :
-        pub =session .get ("https://zjuam.zju.edu.cn/cas/v2/getPubKey",timeout =TIMEOUT ).json ()
-        n ,e =pub ["modulus"],pub ["exponent"]
-        user_data ["password"]=_rsa_encrypt (password ,e ,n )
-    except requests .exceptions .Timeout :
-        error_type ="timeout"
-        return [],False ,"网络超时：获取公钥超时",_meta ()
-    except Exception as e :
-        error_type ="api"
-        return [],False ,f"接口变更：获取/加密公钥失败：{e }",_meta ()
+def _text_field (*keys :str )->Callable [[dict ],str ]:
+    # built once per field; imported files may carry numbers where zdbk sends strings
 
-    try :
-        login_response =session .post (log_url ,data =user_data ,allow_redirects =False ,timeout =TIMEOUT )
+    def get (item :dict )->str :
+        for k in keys :
+            v =item .get (k )
+            if v :
+                v =str (v ).strip ()
+                if v :
+                    return v 
+        return ""
 
-        
-        if login_response .status_code ==200 :
-            txt =login_response .text or ""
-            if ("用户名或密码"in txt )or ("密码错误"in txt )or ("登录失败"in txt ):
-                error_type ="auth"
-                return [],False ,"认证失败：用户名或密码错误",_meta ()
+    return get 
+
+
+_field_name =_text_field ("kcmc")
+_field_score =_text_field ("cj")
+_field_code =_text_field ("kch","kcdm","kcbh","courseCode","course_code")
+_field_xkkh =_text_field ("xkkh")
+_SEMESTER_FIELDS =tuple (_text_field (k )for k in ("xkkh","xnxq01id","xnxq"))
+
+
+def _extract_course_code (item :dict )->str :
+
+    if not isinstance (item ,dict ):
+        return ""
+
+    v =_field_code (item )
+    if v :
+        return v 
+
+    xkkh =_field_xkkh (item )
+    if xkkh .startswith ("(")and ")-"in xkkh :
+        try :
+            tail =xkkh .split (")-",1 )[1 ]
+            parts =tail .split ("-")
+            if len (parts )>=1 :
+                code =(parts [0 ]or "").strip ()
+                if code :
+                    return code 
+        except Exception :
+            pass 
+
+    return ""
+
+
+def _extract_semester (item :dict )->str :
+
+    if not isinstance (item ,dict ):
+        return "未知学期"
+
+    for field in _SEMESTER_FIELDS :
+        raw =field (item )
+        if raw :
+            sem =map_semester (raw )
+            if sem !="未知学期":
+                return sem 
+
+    xnm =str (item .get ("xnm")or "").strip ()
+    xqm =str (item .get ("xqm")or item .get ("xq")or "").strip ()
+    if xnm .isdigit ()and xqm in ("1","2"):
+        try :
+            end_year =int (xnm )+1 
+            sem =map_semester (f"({xnm }-{end_year }-{xqm })")
+            return sem 
+        except Exception :
+            pass 
+
+    return "未知学期"
+
+
+def _split_xkkh (xkkh :str )->Tuple [str ,str ]:
+    # one split of "(yyyy-yyyy-t)-code-..." yields both the semester label and the course code
+    head ,_ ,tail =xkkh [1 :].partition (")")
+    semester =_map_semester_part (head )if len (xkkh )>=12 else "未知学期"
+    code =""
+    if xkkh .startswith ("("):
+        if tail .startswith ("-"):
+            code =tail [1 :].partition ("-")[0 ].strip ()
+        elif ")-"in tail :
+            code =_extract_course_code ({"xkkh":xkkh })
+    return semester ,code 
+
+
+def raw_course_from_item (item :dict ,is_major :bool )->Optional [dict ]:
+    course_name =_field_name (item )
+    cj =_field_score (item )
+    if not course_name or not cj :
+        return None 
+    semester ,xkkh_code =_split_xkkh (_field_xkkh (item ))
+    if semester =="未知学期":
+        semester =_extract_semester (item )
+    return {
+    "name":course_name ,
+    "course_code":_field_code (item )or xkkh_code ,
+    "credits":safe_float (item .get ("xf",0.0 ),0.0 ),
+    "score":cj ,
+    "semester":semester ,
+    "is_major":is_major 
+    }
+
+
+class MergedRawCourses (list ):
+    # RawCourseMerger output: already unique on (name, credits, semester); `rows` holds each entry's
+    # normalised row, built during the merge, so normalize_courses neither re-parses nor re-merges them
+
+    def __init__ (self ):
+        super ().__init__ ()
+        self .rows :List [tuple ]=[]
+
+
+class RawCourseMerger :
+    # score and stats pages may arrive interleaved; rows are parsed as they come and merged once, stats
+    # first, when raw_courses is read
+
+    def __init__ (self ):
+        self ._stats :List [dict ]=[]
+        self ._score :List [dict ]=[]
+        self ._merged :Optional [MergedRawCourses ]=None 
+        self ._lock =threading .Lock ()
+
+    def add_items (self ,items :List [dict ],is_major :bool )->None :
+        entries =[e for e in (raw_course_from_item (item ,is_major )for item in items )if e is not None ]
+        with self ._lock :
+            (self ._stats if is_major else self ._score ).extend (entries )
+            self ._merged =None 
+
+    def add (self ,item :dict ,is_major :bool )->None :
+        self .add_items ((item ,),is_major )
+
+    @property 
+    def raw_courses (self )->MergedRawCourses :
+        with self ._lock :
+            if self ._merged is None :
+                self ._merged =_merge_entries (self ._stats ,self ._score )
+            return self ._merged 
+
+
+def _merge_entries (stats_rows :List [dict ],score_rows :List [dict ])->MergedRawCourses :
+    # a score row loses to any stats row sharing its (code or name) or name key; repeated stats rows fold
+    # together the way _raw_to_courses used to merge them, so the result needs no second dedupe
+    out =MergedRawCourses ()
+    rows =out .rows 
+    intern =semester_registry .intern 
+    by_primary :set =set ()
+    by_name :Dict [Tuple [str ,str ,str ],int ]={}
+    for entry in stats_rows :
+        name ,sem ,code ,credits =entry ["name"],entry ["semester"],entry ["course_code"],entry ["credits"]
+        credits2 =f"{credits :.2f}"
+        k_name =(name ,credits2 ,sem )
+        by_primary .add (((code or name ),credits2 ,sem ))
+        pos =by_name .get (k_name )
+        if pos is None :
+            by_name [k_name ]=len (out )
+            out .append (entry )
+            rows .append ((name ,credits ,credits2 ,entry ["score"],sem ,code ,True ,intern (sem )))
+        elif not out [pos ]["course_code"]and code :
+            out [pos ]=dict (out [pos ],course_code =code )
+            rows [pos ]=rows [pos ][:5 ]+(code ,)+rows [pos ][6 :]
+
+    for entry in score_rows :
+        name ,sem ,code ,credits =entry ["name"],entry ["semester"],entry ["course_code"],entry ["credits"]
+        credits2 =f"{credits :.2f}"
+        k_primary =((code or name ),credits2 ,sem )
+        k_name =(name ,credits2 ,sem )
+        if k_primary in by_primary or k_name in by_name :
+            continue 
+        by_primary .add (k_primary )
+        by_name [k_name ]=len (out )
+        out .append (entry )
+        rows .append ((name ,credits ,credits2 ,entry ["score"],sem ,code ,False ,intern (sem )))
+    return out 
+
+
+def _merge_raw_items (score_data :List [dict ],stats_data :List [dict ])->MergedRawCourses :
+    merger =RawCourseMerger ()
+    merger .add_items (stats_data ,True )
+    merger .add_items (score_data ,False )
+    return merger .raw_courses 
+
+
+def _hash_page (h ,items :List [dict ],prev :Optional [bytes ]=None )->Optional [bytes ]:
+    # returns the page's canonical bytes, or None when it repeats the previous page (nothing is hashed)
+    blob =json .dumps (items ,ensure_ascii =False ,sort_keys =True ,separators =(",",":")).encode ("utf-8")
+    if prev is not None and blob ==prev :
+        return None 
+    h .update (blob )
+    return blob 
+
+
+def _combine_fingerprint (h_score ,h_stats )->str :
+    return hashlib .sha1 ((h_score .hexdigest ()+h_stats .hexdigest ()).encode ("ascii")).hexdigest ()
+
+
+def _query_url (base_url :str ,page_size :int ,page :int )->str :
+    if page_size <=0 :
+        return f"{base_url }&queryModel.showCount={LEGACY_SHOW_COUNT }"
+    return f"{base_url }&queryModel.showCount={page_size }&queryModel.currentPage={page }"
+
+def _looks_expired (status_code :int ,content_type :str )->bool :
+
+    if status_code in (301 ,302 ,303 ,307 ,308 ):
+        return True 
+    return "text/html"in (content_type or "").lower ()
+
+
+def _is_login_redirect (response :requests .Response )->bool :
+    return _looks_expired (response .status_code ,response .headers .get ("Content-Type")or "")
+
+
+def _check_login_post (status_code :int ,text :str )->Optional [Tuple [str ,str ]]:
+    if status_code ==200 :
+        if ("用户名或密码"in text )or ("密码错误"in text )or ("登录失败"in text ):
+            return "认证失败：用户名或密码错误","auth"
+    if status_code not in (200 ,301 ,302 ):
+        return f"登录请求失败，HTTP {status_code }","api"
+    return None 
+
+
+def _https_location (url :Optional [str ])->Optional [str ]:
+    if url and url .startswith ("http://")and ZDBK_BASE .startswith ("https://"):
+        return url .replace ("http://","https://")
+    return url 
+
+
+def _page_items (data )->Optional [List [dict ]]:
+    if not isinstance (data ,dict ):
+        return None 
+    items =data .get ("items",[])or []
+    return items if isinstance (items ,list )else None 
+
+
+def _is_last_page (data :dict ,items :List [dict ],page :int ,page_size :int )->bool :
+    if page_size <=0 or len (items )<page_size or page >=MAX_DATA_PAGES :
+        return True 
+    total_pages =int (safe_float (data .get ("totalPage",0 ),0 ))
+    return bool (total_pages )and page >=total_pages 
+
+
+PHASE_LABELS ={
+"login_page":"登录页",
+"pubkey":"公钥",
+"login_post":"提交",
+"redirects":"重定向",
+"score":"成绩",
+"stats":"统计",
+}
+
+
+_redirect_shortcuts :Dict [str ,str ]={}
+_redirect_shortcuts_lock =threading .Lock ()
+
+
+class RedirectWalk :
+    # learns where the ticket-validation hop sits in the post-login redirect chain;
+    # once known, later logins stop right after it instead of walking to the landing page
+
+    def __init__ (self ,key :str ):
+        self .key =key 
+        with _redirect_shortcuts_lock :
+            self .shortcut =_redirect_shortcuts .get (key ,"")
+        self .ticket_path =""
+        self .tail_hops =0 
+        self .cut_short =False 
+
+    def visited (self ,url :str ,next_url :Optional [str ])->bool :
+        parts =urlsplit (url )
+        if self .ticket_path :
+            self .tail_hops +=1 
+        elif "ticket="in parts .query :
+            self .ticket_path =parts .path 
+            if next_url and self .shortcut ==parts .path :
+                self .cut_short =True 
+                return True 
+        return False 
 
-        if login_response .status_code not in (200 ,301 ,302 ):
-            error_type ="api"
-            return [],False ,f"登录请求失败，HTTP {login_response .status_code }",_meta ()
+    def finish (self )->None :
+        if not self .cut_short and self .ticket_path and self .tail_hops :
+            with _redirect_shortcuts_lock :
+                _redirect_shortcuts [self .key ]=self .ticket_path 
 
-        current_url =login_response .headers .get ("location")
-        if current_url and current_url .startswith ("http://"):
-            current_url =current_url .replace ("http://","https://")
 
-        max_redirects =10 
-        redirect_count =0 
-        while current_url and redirect_count <max_redirects :
+def forget_redirect_shortcut (key :str )->None :
+    with _redirect_shortcuts_lock :
+        _redirect_shortcuts .pop (key ,None )
+
+
+class FetchTrace :
+
+    def __init__ (self ):
+        self .phases :Dict [str ,Dict [str ,object ]]={}
+        self ._lock =threading .Lock ()
+
+    def _phase (self ,name :str )->Dict [str ,object ]:
+        return self .phases .setdefault (name ,{"secs":0.0 ,"requests":0 ,"retries":0 ,"hedges":0 ,"status":None ,"bytes":0 })
+
+    def add_request (self ,phase :str ,secs :float ,status :Optional [int ],nbytes :int )->None :
+        with self ._lock :
+            ph =self ._phase (phase )
+            ph ["secs"]+=secs 
+            ph ["requests"]+=1 
+            ph ["bytes"]+=nbytes 
+            if status is not None :
+                ph ["status"]=status 
+
+    def add_retry (self ,phase :str )->None :
+        with self ._lock :
+            self ._phase (phase )["retries"]+=1 
+
+    def add_hedge (self ,phase :str )->None :
+        with self ._lock :
+            self ._phase (phase )["hedges"]+=1 
+
+    def to_dict (self )->Dict [str ,object ]:
+        with self ._lock :
+            phases ={name :dict (ph ,secs =round (float (ph ["secs"]),4 ))for name ,ph in self .phases .items ()}
+        return {
+        "phases":phases ,
+        "bytes":sum (int (ph ["bytes"])for ph in phases .values ()),
+        "retries":sum (int (ph ["retries"])for ph in phases .values ()),
+        "hedges":sum (int (ph ["hedges"])for ph in phases .values ()),
+        "redirects":int (phases .get ("redirects",{}).get ("requests",0 ))
+        }
+
+
+def format_trace (trace :Dict [str ,object ])->str :
+    parts =[]
+    phases =trace .get ("phases")or {}
+    names =[n for n in PHASE_LABELS if n in phases ]+[n for n in phases if n not in PHASE_LABELS ]
+    for name in names :
+        ph =phases [name ]
+        text =f"{PHASE_LABELS .get (name ,name )} {float (ph ['secs'])*1000 :.0f}ms"
+        if ph .get ("status")is not None :
+            text +=f"/{ph ['status']}"
+        text +=f"/{int (ph ['bytes'])/1024 :.1f}KB"
+        if ph .get ("retries"):
+            text +=f"/重试{ph ['retries']}"
+        if ph .get ("hedges"):
+            text +=f"/对冲{ph ['hedges']}"
+        parts .append (text )
+    parts .append (f"重定向 {trace .get ('redirects',0 )}")
+    return "｜".join (parts )
+
+
+class FetchHistory :
+
+    def __init__ (self ,maxlen :int =FETCH_HISTORY_SIZE ):
+        self .entries :deque =deque (maxlen =maxlen )
+
+    def add (self ,meta :Dict [str ,object ])->None :
+        phases =((meta .get ("trace")or {}).get ("phases")or {})
+        sample ={name :float (ph .get ("secs",0.0 ))for name ,ph in phases .items ()}
+        sample ["total"]=float (meta .get ("elapsed",0.0 )or 0.0 )
+        self .entries .append (sample )
+
+    def percentiles (self ,qs :Tuple [float ,...]=(50 ,95 ))->Dict [str ,List [float ]]:
+        by_phase :Dict [str ,List [float ]]={}
+        for sample in self .entries :
+            for name ,secs in sample .items ():
+                by_phase .setdefault (name ,[]).append (secs )
+        return {name :[percentile (values ,q )for q in qs ]for name ,values in by_phase .items ()}
+
+    def format_summary (self )->str :
+        pct =self .percentiles ()
+        names =["total"]+[n for n in PHASE_LABELS if n in pct ]
+        parts =[
+        f"{'总计'if n =='total'else PHASE_LABELS [n ]} {pct [n ][0 ]:.3f}/{pct [n ][1 ]:.3f}s"
+        for n in names if n in pct 
+        ]
+        return f"近 {len (self .entries )} 次 p50/p95："+"｜".join (parts )
+
+
+class LatencyTracker :
+    # process-wide rolling latencies per phase; drives read timeouts and hedge delays
+
+    def __init__ (self ,maxlen :int =LATENCY_WINDOW ):
+        self .maxlen =int (maxlen )
+        self ._samples :Dict [str ,deque ]={}
+        self ._lock =threading .Lock ()
+
+    def observe (self ,phase :str ,secs :float )->None :
+        with self ._lock :
+            self ._samples .setdefault (phase ,deque (maxlen =self .maxlen )).append (float (secs ))
+
+    def timed_out (self ,phase :str )->None :
+        # the server just got slower than the window says: drop it so the retry (and the next
+        # few requests) use the static timeout until fresh samples describe the new latency
+        with self ._lock :
+            self ._samples .pop (phase ,None )
+
+    def p95 (self ,phase :str )->Optional [float ]:
+        with self ._lock :
+            values =list (self ._samples .get (phase )or ())
+        if len (values )<ADAPTIVE_TIMEOUT_MIN_SAMPLES :
+            return None 
+        return percentile (values ,95 )
+
+    def timeout (self ,phase :str )->Tuple [float ,float ]:
+        p95 =self .p95 (phase )if phase else None 
+        if p95 is None :
+            return TIMEOUT 
+        read =min (float (TIMEOUT [1 ]),max (ADAPTIVE_TIMEOUT_FLOOR_SEC ,p95 *ADAPTIVE_TIMEOUT_FACTOR ))
+        return TIMEOUT [0 ],round (read ,3 )
+
+    def hedge_delay (self ,phase :str )->Optional [float ]:
+        if not HEDGE_DATA_REQUESTS :
+            return None 
+        p95 =self .p95 (phase )
+        if p95 is None :
+            return None 
+        return max (HEDGE_MIN_DELAY_SEC ,p95 )
+
+    def snapshot (self )->Dict [str ,Dict [str ,float ]]:
+        with self ._lock :
+            phases ={name :list (values )for name ,values in self ._samples .items ()}
+        return {
+        name :{"n":len (values ),"p50":round (percentile (values ,50 ),4 ),"p95":round (percentile (values ,95 ),4 )}
+        for name ,values in phases .items ()
+        }
+
+
+latency_tracker =LatencyTracker ()
+
+
+class TokenBucket :
+
+    def __init__ (self ,rate :float ,burst :int ):
+        self .rate =float (rate )
+        self .burst =max (1 ,int (burst ))
+        self .tokens =float (self .burst )
+        self .updated =time .monotonic ()
+        self ._lock =threading .Lock ()
+
+    def reserve (self )->float :
+        # takes a token now and returns how long the caller must wait before using it;
+        # the balance may go negative, which queues later callers behind earlier ones
+        with self ._lock :
+            now =time .monotonic ()
+            self .tokens =min (float (self .burst ),self .tokens +(now -self .updated )*self .rate )
+            self .updated =now 
+            self .tokens -=1.0 
+            return max (0.0 ,-self .tokens /self .rate )
+
+
+class HostRateLimiter :
+    # one token bucket per host so batch runs and parallel sessions stay under a shared ceiling
+
+    def __init__ (self ,rate :float =RATE_LIMIT_PER_SEC ,burst :int =RATE_LIMIT_BURST ):
+        self ._buckets :Dict [str ,TokenBucket ]={}
+        self ._stats :Dict [str ,Dict [str ,float ]]={}
+        self ._lock =threading .Lock ()
+        self .configure (rate ,burst )
+
+    def configure (self ,rate :float ,burst :Optional [int ]=None )->None :
+        with self ._lock :
+            self .rate =max (0.0 ,float (rate ))
+            if burst is not None :
+                self .burst =max (1 ,int (burst ))
+            self ._buckets .clear ()
+
+    def _reserve (self ,url :str )->Tuple [str ,float ]:
+        host =urlsplit (url ).netloc 
+        with self ._lock :
+            st =self ._stats .setdefault (host ,{"requests":0 ,"throttled":0 ,"wait_sec":0.0 ,"max_wait_sec":0.0 ,"queued":0 ,"max_queued":0 })
+            st ["requests"]+=1 
+            if self .rate <=0 :
+                return host ,0.0 
+            bucket =self ._buckets .get (host )
+            if bucket is None :
+                bucket =self ._buckets [host ]=TokenBucket (self .rate ,self .burst )
+        delay =bucket .reserve ()
+        if delay >0 :
+            with self ._lock :
+                st ["throttled"]+=1 
+                st ["wait_sec"]+=delay 
+                st ["max_wait_sec"]=max (st ["max_wait_sec"],delay )
+                st ["queued"]+=1 
+                st ["max_queued"]=max (st ["max_queued"],st ["queued"])
+        return host ,delay 
+
+    def _dequeue (self ,host :str )->None :
+        with self ._lock :
+            self ._stats [host ]["queued"]-=1 
+
+    def acquire (self ,url :str ,sleep :Callable [[float ],None ]=time .sleep )->float :
+        host ,delay =self ._reserve (url )
+        if delay >0 :
             try :
-                redirect_response =session .get (current_url ,allow_redirects =False ,timeout =TIMEOUT )
-                redirect_response .raise_for_status ()
-                if "filtererr.jsp"in current_url :
-                    error_type ="auth"
-                    return [],False ,"认证失败：登录被拦截（filtererr.jsp）",_meta ()
-                current_url =redirect_response .headers .get ("location")
-                if current_url and current_url .startswith ("http://"):
-                    current_url =current_url .replace ("http://","https://")
-                redirect_count +=1 
+                sleep (delay )
+            finally :
+                self ._dequeue (host )
+        return delay 
+
+    async def acquire_async (self ,url :str )->float :
+        host ,delay =self ._reserve (url )
+        if delay >0 :
+            try :
+                await asyncio .sleep (delay )
+            finally :
+                self ._dequeue (host )
+        return delay 
+
+    def metrics (self )->Dict [str ,Dict [str ,float ]]:
+        with self ._lock :
+            return {
+            host :dict (st ,wait_sec =round (float (st ["wait_sec"]),4 ),max_wait_sec =round (float (st ["max_wait_sec"]),4 ))
+            for host ,st in self ._stats .items ()
+            }
+
+
+rate_limiter =HostRateLimiter ()
+if os .environ .get ("ZJU_RATE_LIMIT"):
+    rate_limiter .configure (safe_float (os .environ .get ("ZJU_RATE_LIMIT"),RATE_LIMIT_PER_SEC ))
+if os .environ .get ("ZJU_SNAPSHOT_KEEP"):
+    SNAPSHOT_KEEP =max (0 ,int (safe_float (os .environ .get ("ZJU_SNAPSHOT_KEEP"),0 )))
+
+
+def _prom_labels (labels :Dict [str ,str ])->str :
+    if not labels :
+        return ""
+    parts =[]
+    for k ,v in sorted (labels .items ()):
+        v =str (v ).replace ("\\","\\\\").replace ("\"","\\\"").replace ("\n","\\n")
+        parts .append (f'{k }="{v }"')
+    return "{"+",".join (parts )+"}"
+
+
+def _prom_value (v )->str :
+    v =float (v )
+    return str (int (v ))if v .is_integer ()else repr (v )
+
+
+class PollMetrics :
+    # Prometheus text-format counters/gauges/histograms for the poll loop (GUI and watch daemon)
+
+    def __init__ (self ,buckets :Tuple [float ,...]=METRICS_BUCKETS ):
+        self .buckets =tuple (sorted (buckets ))
+        self ._fetches :Dict [Tuple [str ,str ],int ]={}
+        self ._success :Dict [str ,int ]={}
+        self ._failures :Dict [Tuple [str ,str ],int ]={}
+        self ._new_grades :Dict [str ,int ]={}
+        self ._courses :Dict [str ,int ]={}
+        self ._last_success :Dict [str ,float ]={}
+        self ._hist :Dict [str ,List [float ]]={}
+        self ._lock =threading .Lock ()
+
+    def _observe (self ,phase :str ,secs :float )->None :
+        # per phase: one cumulative count per bucket, then +Inf count, then sum
+        h =self ._hist .setdefault (phase ,[0.0 ]*(len (self .buckets )+2 ))
+        for i ,le in enumerate (self .buckets ):
+            if secs <=le :
+                h [i ]+=1 
+        h [-2 ]+=1 
+        h [-1 ]+=secs 
+
+    def record_fetch (self ,account :str ,kind :str ,ok :bool ,meta :Dict [str ,object ])->None :
+        account =str (account or "")
+        phases =((meta .get ("trace")or {}).get ("phases")or {})
+        with self ._lock :
+            key =(account ,kind )
+            self ._fetches [key ]=self ._fetches .get (key ,0 )+1 
+            if ok :
+                self ._success [account ]=self ._success .get (account ,0 )+1 
+                self ._last_success [account ]=time .time ()
+            else :
+                fkey =(account ,str (meta .get ("error_type")or "other"))
+                self ._failures [fkey ]=self ._failures .get (fkey ,0 )+1 
+            self ._observe ("total",float (meta .get ("elapsed",0.0 )or 0.0 ))
+            for name ,ph in phases .items ():
+                self ._observe (name ,float (ph .get ("secs",0.0 )or 0.0 ))
+
+    def record_new_grades (self ,account :str ,count :int )->None :
+        with self ._lock :
+            self ._new_grades [str (account or "")]=self ._new_grades .get (str (account or ""),0 )+int (count )
+
+    def set_courses (self ,account :str ,count :int )->None :
+        with self ._lock :
+            self ._courses [str (account or "")]=int (count )
+
+    def render (self )->str :
+        now =time .time ()
+        out :List [str ]=[]
+
+        def _family (name :str ,kind :str ,help_text :str ,samples )->None :
+            out .append (f"# HELP {name } {help_text }")
+            out .append (f"# TYPE {name } {kind }")
+            for labels ,value in samples :
+                out .append (f"{name }{_prom_labels (labels )} {_prom_value (value )}")
+
+        with self ._lock :
+            accounts =sorted (set (self ._success )|set (self ._courses )|set (a for a ,_k in self ._fetches ))
+            _family ("zju_poller_fetches_total","counter","Fetches started by the poll loop.",
+            [({"account":a ,"kind":k },v )for (a ,k ),v in sorted (self ._fetches .items ())])
+            _family ("zju_poller_fetch_success_total","counter","Fetches that returned data.",
+            [({"account":a },v )for a ,v in sorted (self ._success .items ())])
+            _family ("zju_poller_fetch_failures_total","counter","Failed fetches by error_type.",
+            [({"account":a ,"error_type":e },v )for (a ,e ),v in sorted (self ._failures .items ())])
+            _family ("zju_poller_new_grades_total","counter","Newly published grades detected.",
+            [({"account":a },self ._new_grades .get (a ,0 ))for a in accounts ])
+            _family ("zju_poller_courses","gauge","Courses in the current list.",
+            [({"account":a },v )for a ,v in sorted (self ._courses .items ())])
+            _family ("zju_poller_last_success_timestamp_seconds","gauge","Unix time of the last successful fetch.",
+            [({"account":a },round (v ,3 ))for a ,v in sorted (self ._last_success .items ())])
+            _family ("zju_poller_last_success_age_seconds","gauge","Seconds since the last successful fetch.",
+            [({"account":a },round (now -v ,3 ))for a ,v in sorted (self ._last_success .items ())])
+
+            name ="zju_poller_fetch_phase_seconds"
+            out .append (f"# HELP {name } Wall time per fetch phase; phase=total is the whole fetch.")
+            out .append (f"# TYPE {name } histogram")
+            for phase ,h in sorted (self ._hist .items ()):
+                for le ,count in zip (self .buckets ,h ):
+                    out .append (f"{name }_bucket{_prom_labels ({'phase':phase ,'le':f'{le :g}'})} {_prom_value (count )}")
+                out .append (f"{name }_bucket{_prom_labels ({'phase':phase ,'le':'+Inf'})} {_prom_value (h [-2 ])}")
+                out .append (f"{name }_sum{_prom_labels ({'phase':phase })} {_prom_value (round (h [-1 ],6 ))}")
+                out .append (f"{name }_count{_prom_labels ({'phase':phase })} {_prom_value (h [-2 ])}")
+        return "\n".join (out )+"\n"
+
+    def write_textfile (self ,path :str )->None :
+        # node_exporter textfile collector picks up *.prom; write-then-rename so it never reads half a file
+        ensure_dir (os .path .dirname (os .path .abspath (path )))
+        tmp =path +".tmp"
+        with open (tmp ,"w",encoding ="utf-8")as f :
+            f .write (self .render ())
+        os .replace (tmp ,path )
+
+
+poll_metrics =PollMetrics ()
+
+
+class _MetricsHandler (BaseHTTPRequestHandler ):
+
+    def log_message (self ,fmt ,*args )->None :
+        pass 
+
+    def do_GET (self )->None :
+        if self .path .split ("?",1 )[0 ]not in ("/metrics","/"):
+            self .send_response (404 )
+            self .send_header ("Content-Length","0")
+            self .end_headers ()
+            return 
+        body =poll_metrics .render ().encode ("utf-8")
+        self .send_response (200 )
+        self .send_header ("Content-Type","text/plain; version=0.0.4; charset=utf-8")
+        self .send_header ("Content-Length",str (len (body )))
+        self .end_headers ()
+        self .wfile .write (body )
+
+
+def start_metrics_exporter (port :int =0 ,textfile :str ="",host :str ="127.0.0.1")->Optional [ThreadingHTTPServer ]:
+    # both outputs are optional; the endpoint binds to localhost only
+    server =None 
+    if port :
+        server =ThreadingHTTPServer ((host ,int (port )),_MetricsHandler )
+        server .daemon_threads =True 
+        threading .Thread (target =server .serve_forever ,name ="metrics-http",daemon =True ).start ()
+    if textfile :
+        def _loop ()->None :
+            while True :
+                try :
+                    poll_metrics .write_textfile (textfile )
+                except OSError :
+                    pass 
+                time .sleep (METRICS_TEXTFILE_INTERVAL_SEC )
+
+        threading .Thread (target =_loop ,name ="metrics-textfile",daemon =True ).start ()
+    return server 
+
+
+class FetchCancelled (BaseException ):
+    # BaseException so the broad "except Exception" retry handlers let it through
+    pass 
+
+
+class NetworkTask :
+
+    def __init__ (self ,key :str ):
+        self .key =key 
+        self .cancel_event =threading .Event ()
+        self .future :Optional [Future ]=None 
+
+    def cancel (self )->None :
+        self .cancel_event .set ()
+        if self .future is not None :
+            self .future .cancel ()
+
+    def cancelled (self )->bool :
+        return self .cancel_event .is_set ()
+
+    def done (self )->bool :
+        return self .future is not None and self .future .done ()
+
+    def result (self ,timeout :Optional [float ]=None ):
+        return self .future .result (timeout )
+
+    def add_done_callback (self ,fn :Callable [["NetworkTask"],None ])->None :
+        self .future .add_done_callback (lambda _f :fn (self ))
+
+
+class NetworkExecutor :
+    # owns all GUI-initiated HTTP work; tasks are keyed so duplicate requests coalesce
+
+    def __init__ (self ,max_workers :int =NETWORK_WORKERS ):
+        self ._pool =ThreadPoolExecutor (max_workers =max_workers ,thread_name_prefix ="zdbk-net")
+        self ._inflight :Dict [str ,NetworkTask ]={}
+        self ._closed =False 
+        self ._lock =threading .Lock ()
+
+    def submit (self ,key :str ,fn :Callable [[threading .Event ],object ])->Tuple [NetworkTask ,bool ]:
+        # returns (task, joined); joined is True when an identical task was already running
+        with self ._lock :
+            task =self ._inflight .get (key )
+            # a cancelled task may still be finishing its last request; never hand it out again
+            if task is not None and not task .done ()and not task .cancelled ():
+                return task ,True 
+            if self ._closed :
+                raise RuntimeError ("network executor is shut down")
+            task =NetworkTask (key )
+            task .future =self ._pool .submit (fn ,task .cancel_event )
+            self ._inflight [key ]=task 
+        task .future .add_done_callback (lambda _f :self ._forget (task ))
+        return task ,False 
+
+    def _forget (self ,task :NetworkTask )->None :
+        with self ._lock :
+            if self ._inflight .get (task .key )is task :
+                del self ._inflight [task .key ]
+
+    def inflight (self ,key :str )->Optional [NetworkTask ]:
+        with self ._lock :
+            task =self ._inflight .get (key )
+        return task if task is not None and not task .done ()else None 
+
+    def cancel (self ,key :str )->bool :
+        task =self .inflight (key )
+        if task is None :
+            return False 
+        task .cancel ()
+        return True 
+
+    def shutdown (self )->None :
+        with self ._lock :
+            self ._closed =True 
+            tasks =list (self ._inflight .values ())
+        for task in tasks :
+            task .cancel ()
+        self ._pool .shutdown (wait =False ,cancel_futures =True )
+
+
+class LoginPrefetch :
+    # warms a CAS session (execution token + RSA public key) before the user clicks 登录
+
+    def __init__ (self ,ttl_sec :float =LOGIN_PREFETCH_TTL_SEC ):
+        self .ttl_sec =float (ttl_sec )
+        self ._session :Optional [requests .Session ]=None 
+        self ._execution =""
+        self ._pubkey :Optional [Tuple [str ,str ]]=None 
+        self ._fetched_at =0.0 
+        self ._failed_at =None 
+        self .closed =False 
+        self ._lock =threading .Lock ()
+
+    def warm (self )->bool :
+        try :
+            ok =self ._warm ()
+        except Exception :
+            ok =False 
+        with self ._lock :
+            self ._failed_at =None if ok else time .monotonic ()
+        return ok 
+
+    def _warm (self )->bool :
+        session =requests .session ()
+        session .headers .update (LOGIN_HEADERS )
+        try :
+            rate_limiter .acquire (LOGIN_URL )
+            res =session .get (LOGIN_URL ,timeout =latency_tracker .timeout ("login_page"))
+            res .raise_for_status ()
+            execution_value =extract_execution (res .text )
+            rate_limiter .acquire (PUBKEY_URL )
+            pub =session .get (PUBKEY_URL ,timeout =latency_tracker .timeout ("pubkey")).json ()
+            pubkey =(str (pub ["exponent"]),str (pub ["modulus"]))
+        except Exception :
+            session .close ()
+            return False 
+        if not execution_value :
+            session .close ()
+            return False 
+
+        with self ._lock :
+            if self .closed :
+                session .close ()
+                return False 
+            old =self ._session 
+            self ._session =session 
+            self ._execution =execution_value 
+            self ._pubkey =pubkey 
+            self ._fetched_at =time .monotonic ()
+        if old is not None :
+            old .close ()
+        return True 
+
+    def is_fresh (self )->bool :
+        with self ._lock :
+            return self ._session is not None and time .monotonic ()-self ._fetched_at <=self .ttl_sec 
+
+    def should_warm (self )->bool :
+        # not while a warm-up is still usable, nor within LOGIN_PREFETCH_RETRY_SEC of a failed one
+        with self ._lock :
+            now =time .monotonic ()
+            if self ._session is not None and now -self ._fetched_at <=self .ttl_sec :
+                return False 
+            return self ._failed_at is None or now -self ._failed_at >=LOGIN_PREFETCH_RETRY_SEC 
+
+    def take (self )->Optional [Tuple [requests .Session ,str ,Tuple [str ,str ]]]:
+        # one-shot: an execution token is only good for a single POST
+        with self ._lock :
+            session ,self ._session =self ._session ,None 
+            if session is None :
+                return None 
+            if time .monotonic ()-self ._fetched_at >self .ttl_sec :
+                session .close ()
+                return None 
+            return session ,self ._execution ,self ._pubkey 
+
+    def close (self )->None :
+        with self ._lock :
+            self .closed =True 
+            session ,self ._session =self ._session ,None 
+        if session is not None :
+            session .close ()
+
+
+class ZdbkSession :
+
+    def __init__ (self ,username :str ,password :str ,page_size :int =DATA_PAGE_SIZE ,prefetch :Optional [LoginPrefetch ]=None ):
+        self .username =username 
+        self .password =password 
+        self .page_size =int (page_size )
+        self .prefetch =prefetch 
+        self .session :Optional [requests .Session ]=None 
+        self .logged_in =False 
+        self .request_count =0 
+        self .trace =FetchTrace ()
+        self ._cancel =threading .Event ()
+        self ._walk :Optional [RedirectWalk ]=None 
+        self ._stats_items :Optional [List [dict ]]=None 
+        self ._stats_hash =None 
+        self ._score_digest =""
+        self ._stats_wanted =threading .Event ()
+        self ._lock =threading .Lock ()
+        self ._count_lock =threading .Lock ()
+
+    def close (self )->None :
+        if self .session is not None :
+            try :
+                self .session .close ()
+            except Exception :
+                pass 
+        self .session =None 
+        self .logged_in =False 
+
+    def _redirect_key (self )->str :
+        return f"{ZDBK_BASE }|{self .username }"
+
+    def _drop_failed_shortcut (self ,relogin :bool )->bool :
+        # a fresh login that cut the redirect chain short still has no data session:
+        # forget the shortcut and walk the full chain once more
+        if relogin and self ._walk is not None and self ._walk .cut_short :
+            forget_redirect_shortcut (self ._walk .key )
+            self ._walk =None 
+            return True 
+        return False 
+
+    def restore (self ,jar )->bool :
+        # adopt persisted cookies without a probe: the first fetch doubles as the check and
+        # falls back to a full login (which needs the password) when the cookies have expired
+        if jar is None :
+            return False 
+        self .close ()
+        session =requests .session ()
+        session .headers .update (LOGIN_HEADERS )
+        session .cookies .update (jar )
+        self .session =session 
+        self .logged_in =True 
+        return True 
+
+    def cookies (self ):
+        return self .session .cookies if self .session is not None else None 
+
+    def _sleep (self ,secs :float )->None :
+        if self ._cancel .wait (secs ):
+            raise FetchCancelled ()
+
+    def _send (
+    self ,
+    send ,
+    url :str ,
+    phase :str ,
+    trace :Optional [FetchTrace ]=None ,
+    abandoned :Optional [threading .Event ]=None ,
+    **kwargs 
+    )->requests .Response :
+        # trace is bound when the request is issued so a late hedge cannot write into the next fetch
+        trace =trace or self .trace 
+        if self ._cancel .is_set ():
+            raise FetchCancelled ()
+        rate_limiter .acquire (url ,self ._sleep )
+        if abandoned is not None and abandoned .is_set ():
+            raise FetchCancelled ()
+        with self ._count_lock :
+            self .request_count +=1 
+        t0 =time .perf_counter ()
+        status :Optional [int ]=None 
+        nbytes =0 
+        timed_out =False 
+        try :
+            response =send (url ,timeout =latency_tracker .timeout (phase ),**kwargs )
+            status =response .status_code 
+            nbytes =len (response .content or b"")
+            return response 
+        except requests .exceptions .Timeout :
+            timed_out =True 
+            raise 
+        finally :
+            if phase :
+                secs =time .perf_counter ()-t0 
+                if abandoned is None or not abandoned .is_set ():
+                    trace .add_request (phase ,secs ,status ,nbytes )
+                if timed_out :
+                    latency_tracker .timed_out (phase )
+                elif status is not None :
+                    latency_tracker .observe (phase ,secs )
+
+    def _get (self ,url :str ,phase :str ="",**kwargs )->requests .Response :
+        return self ._send (self .session .get ,url ,phase ,**kwargs )
+
+    def _hedged_get (self ,url :str ,phase :str ,**kwargs )->requests .Response :
+        # once the first GET outlives the phase's p95, race a duplicate and keep whichever answers first
+        delay =latency_tracker .hedge_delay (phase )
+        if delay is None :
+            return self ._get (url ,phase =phase ,**kwargs )
+        pool =_get_hedge_pool ()
+        trace =self .trace 
+        abandoned =threading .Event ()
+        first =pool .submit (self ._get ,url ,phase ,trace =trace ,abandoned =abandoned ,**kwargs )
+        done ,_pending =wait ([first ],timeout =delay )
+        if done :
+            return first .result ()
+        if self ._cancel .is_set ():
+            abandoned .set ()
+            raise FetchCancelled ()
+        trace .add_hedge (phase )
+        second =pool .submit (self ._get ,url ,phase ,trace =trace ,abandoned =abandoned ,**kwargs )
+        pending ={first ,second }
+        error :Optional [BaseException ]=None 
+        try :
+            while pending :
+                done ,pending =wait (pending ,return_when =FIRST_COMPLETED )
+                for fut in done :
+                    try :
+                        return fut .result ()
+                    except BaseException as e :
+                        if error is None or isinstance (error ,FetchCancelled ):
+                            error =e 
+            raise error 
+        finally :
+            # the loser may still be queued or in flight; it must not count toward this or the next fetch
+            abandoned .set ()
+
+    def _post (self ,url :str ,phase :str ="",**kwargs )->requests .Response :
+        return self ._send (self .session .post ,url ,phase ,**kwargs )
+
+    def login (self )->Tuple [bool ,str ,Optional [str ]]:
+        warm =self .prefetch .take ()if self .prefetch is not None else None 
+        if warm is not None :
+            self .close ()
+            self .session ,execution_value ,pubkey =warm 
+            ok ,msg ,error_type =self ._submit_login (execution_value ,pubkey ,prefetched =True )
+            if error_type !=ERR_STALE_TOKEN :
+                return ok ,msg ,error_type 
+        return self ._full_login ()
+
+    def _full_login (self )->Tuple [bool ,str ,Optional [str ]]:
+        self .close ()
+        session =requests .session ()
+        session .headers .update (LOGIN_HEADERS )
+        self .session =session 
+
+        error_type :Optional [str ]=None 
+
+        execution_value =None 
+        for attempt in range (MAX_RETRIES ):
+            try :
+                res =self ._get (LOGIN_URL ,phase ="login_page")
+                res .raise_for_status ()
+                execution_value =extract_execution (res .text )
+                if execution_value is None :
+                    return False ,"接口变更：无法获取登录参数 execution","api"
+                if not execution_value :
+                    return False ,"接口变更：登录参数 execution 为空","api"
+                break 
             except requests .exceptions .Timeout :
                 error_type ="timeout"
-                return [],False ,"网络超时：登录重定向超时",_meta ()
+                if attempt ==MAX_RETRIES -1 :
+                    return False ,"网络超时：访问登录页超时",error_type 
+                self .trace .add_retry ("login_page")
+                self ._sleep (_retry_delay (attempt ))
             except requests .exceptions .RequestException as e :
-                return [],False ,f"重定向失败：{e }",_meta ()
-    except requests .exceptions .Timeout :
-        error_type ="timeout"
-        return [],False ,"网络超时：登录请求超时",_meta ()
-    except Exception as e :
-        return [],False ,f"登录过程异常：{e }",_meta ()
-
-    score_url ="https://zdbk.zju.edu.cn/jwglxt/cxdy/xscjcx_cxXscjIndex.html?doType=query&queryModel.showCount=2000"
-    stats_url ="https://zdbk.zju.edu.cn/jwglxt/zycjtj/xszgkc_cxXsZgkcIndex.html?doType=query&queryModel.showCount=2000"
-
-    score_data =[]
-    for attempt in range (MAX_RETRIES ):
+                if attempt ==MAX_RETRIES -1 :
+                    return False ,f"访问登录页失败：{e }",error_type 
+                self .trace .add_retry ("login_page")
+                self ._sleep (_retry_delay (attempt ))
+
         try :
-            response =session .get (score_url ,headers =data_headers ,timeout =TIMEOUT )
-            if response .status_code !=200 :
-                error_type ="api"
-                return [],False ,f"接口变更：成绩接口返回 HTTP {response .status_code }",_meta ()
-            try :
-                data =response .json ()
-            except Exception as e :
-                error_type ="api"
-                return [],False ,f"接口变更：成绩接口 JSON 解析失败：{e }",_meta ()
-            score_data =data .get ("items",[])or []
-            if not isinstance (score_data ,list ):
-                error_type ="api"
-                return [],False ,"接口变更：成绩接口 items 字段异常",_meta ()
-            break 
+            pub =self ._get (PUBKEY_URL ,phase ="pubkey").json ()
+            pubkey =(pub ["exponent"],pub ["modulus"])
         except requests .exceptions .Timeout :
-            error_type ="timeout"
-            if attempt ==MAX_RETRIES -1 :
-                return [],False ,"网络超时：读取成绩接口超时",_meta ()
-            time .sleep (1 )
+            return False ,"网络超时：获取公钥超时","timeout"
+        except Exception as e :
+            return False ,f"接口变更：获取/加密公钥失败：{e }","api"
+
+        return self ._submit_login (execution_value ,pubkey )
+
+    def _submit_login (self ,execution_value :str ,pubkey :Tuple [str ,str ],prefetched :bool =False )->Tuple [bool ,str ,Optional [str ]]:
+        error_type :Optional [str ]=None 
+        user_data ={"username":self .username ,"password":self .password ,"execution":execution_value ,"_eventId":"submit"}
+
+        try :
+            e ,n =pubkey 
+            user_data ["password"]=_rsa_encrypt (self .password ,e ,n )
         except Exception as e :
-            if attempt ==MAX_RETRIES -1 :
-                return [],False ,f"读取成绩接口失败：{e }",_meta ()
-            time .sleep (1 )
+            return False ,f"接口变更：获取/加密公钥失败：{e }","api"
 
-    stats_data =[]
-    for attempt in range (MAX_RETRIES ):
         try :
-            response =session .get (stats_url ,headers =data_headers ,timeout =TIMEOUT )
-            if response .status_code !=200 :
-                stats_data =[]
-                break 
-            try :
-                data =response .json ()
-            except Exception :
-                stats_data =[]
-                break 
-            items =data .get ("items",[])or []
-            if isinstance (items ,list ):
-                stats_data =[item for item in items if item .get ("xdbjmc")!="未修"]
-            else :
-                stats_data =[]
-            break 
+            login_response =self ._post (LOGIN_URL ,phase ="login_post",data =user_data ,allow_redirects =False )
+
+            # a wrong password is final: retrying it would post the credentials to CAS twice.  take() already
+            # drops warm-ups older than LOGIN_PREFETCH_TTL_SEC, so only a form without that text counts as stale
+            failure =_check_login_post (login_response .status_code ,login_response .text or ""if login_response .status_code ==200 else "")
+            if failure :
+                return False ,failure [0 ],failure [1 ]
+            if prefetched and login_response .status_code not in (301 ,302 ):
+                return False ,"登录参数已过期",ERR_STALE_TOKEN 
+
+            current_url =_https_location (login_response .headers .get ("location"))
+
+            walk =RedirectWalk (self ._redirect_key ())
+            max_redirects =10 
+            redirect_count =0 
+            while current_url and redirect_count <max_redirects :
+                try :
+                    redirect_response =self ._get (current_url ,phase ="redirects",allow_redirects =False )
+                    redirect_response .raise_for_status ()
+                    if "filtererr.jsp"in current_url :
+                        return False ,"认证失败：登录被拦截（filtererr.jsp）","auth"
+                    hop_url =current_url 
+                    current_url =_https_location (redirect_response .headers .get ("location"))
+                    redirect_count +=1 
+                    if walk .visited (hop_url ,current_url ):
+                        break 
+                except requests .exceptions .Timeout :
+                    return False ,"网络超时：登录重定向超时","timeout"
+                except requests .exceptions .RequestException as e :
+                    return False ,f"重定向失败：{e }",error_type 
         except requests .exceptions .Timeout :
-            if attempt ==MAX_RETRIES -1 :
-                stats_data =[]
-                break 
-            time .sleep (1 )
-        except Exception :
-            if attempt ==MAX_RETRIES -1 :
-                stats_data =[]
-                break 
-            time .sleep (1 )
+            return False ,"网络超时：登录请求超时","timeout"
+        except Exception as e :
+            return False ,f"登录过程异常：{e }",error_type 
+
+        walk .finish ()
+        self ._walk =walk 
+        self .logged_in =True 
+        return True ,"",None 
+
+    def _query_items (self ,base_url :str ,label :str ,on_items ,h ,phase :str )->Tuple [bool ,str ,Optional [str ]]:
+        page =1 
+        prev :Optional [bytes ]=None 
+        while True :
+            url =_query_url (base_url ,self .page_size ,page )
+            error_type :Optional [str ]=None 
+            data =None 
+            for attempt in range (MAX_RETRIES ):
+                try :
+                    response =self ._hedged_get (url ,phase ,headers =DATA_HEADERS ,allow_redirects =False )
+                    if _is_login_redirect (response ):
+                        return False ,"会话已过期",ERR_SESSION_EXPIRED 
+                    if response .status_code !=200 :
+                        return False ,f"接口变更：{label }返回 HTTP {response .status_code }","api"
+                    try :
+                        data =response .json ()
+                    except Exception as e :
+                        return False ,f"接口变更：{label } JSON 解析失败：{e }","api"
+                    break 
+                except requests .exceptions .Timeout :
+                    error_type ="timeout"
+                    if attempt ==MAX_RETRIES -1 :
+                        return False ,f"网络超时：读取{label }超时",error_type 
+                    self .trace .add_retry (phase )
+                    self ._sleep (_retry_delay (attempt ))
+                except Exception as e :
+                    if attempt ==MAX_RETRIES -1 :
+                        return False ,f"读取{label }失败：{e }",error_type 
+                    self .trace .add_retry (phase )
+                    self ._sleep (_retry_delay (attempt ))
+
+            items =_page_items (data )
+            if items is None :
+                return False ,f"接口变更：{label } items 字段异常","api"
+
+            prev =_hash_page (h ,items ,prev )
+            if prev is None :
+                # the server ignored the page parameter and sent the same page again
+                return True ,"",None 
+            on_items (items )
+
+            if _is_last_page (data ,items ,page ,self .page_size ):
+                return True ,"",None 
+            page +=1 
+
+    def _fetch_score (self ,merger :RawCourseMerger ,h )->Tuple [bool ,str ,Optional [str ]]:
+        return self ._query_items (SCORE_URL ,"成绩接口",lambda items :merger .add_items (items ,False ),h ,"score")
+
+    def _fetch_stats (self ,merger :RawCourseMerger ,h ,kept :List [dict ])->Tuple [bool ,str ,Optional [str ]]:
+
+        def _on_items (items :List [dict ])->None :
+            major =[item for item in items if item .get ("xdbjmc")!="未修"]
+            kept .extend (major )
+            merger .add_items (major ,True )
+
+        return self ._query_items (STATS_URL ,"主修统计接口",_on_items ,h ,"stats")
+
+    def _keep_stats (self ,res :Tuple [bool ,str ,Optional [str ]],kept :List [dict ],h )->None :
+        if res [0 ]:
+            self ._stats_items =kept 
+            self ._stats_hash =h 
+        else :
+            self ._stats_wanted .set ()
+
+    def request_stats_refresh (self )->None :
+        # an explicit sync riding on a score-only poll still gets fresh major flags
+        self ._stats_wanted .set ()
+
+    def _fetch_both (self ,merger :RawCourseMerger ,h_score ,h_stats ,timings :Dict [str ,float ])->Tuple [bool ,str ,Optional [str ]]:
+        kept :List [dict ]=[]
+        pool =_get_data_pool ()
+        score_fut =pool .submit (_timed ,lambda :self ._fetch_score (merger ,h_score ))
+        stats_fut =pool .submit (_timed ,lambda :self ._fetch_stats (merger ,h_stats ,kept ))
+        res ,timings ["score"]=score_fut .result ()
+        stats_res ,timings ["stats"]=stats_fut .result ()
+        self ._keep_stats (stats_res ,kept ,h_stats )
+        return res 
+
+    def _fetch_score_first (self ,merger :RawCourseMerger ,h_score ,timings :Dict [str ,float ])->Tuple [Tuple [bool ,str ,Optional [str ]],object ,bool ]:
+        # stats (xszgkc) only sets is_major, so it is re-read only when the score rows changed
+        res ,timings ["score"]=_timed (lambda :self ._fetch_score (merger ,h_score ))
+        if not res [0 ]:
+            return res ,None ,False 
+        if h_score .hexdigest ()==self ._score_digest and not self ._stats_wanted .is_set ():
+            merger .add_items (self ._stats_items ,True )
+            return res ,self ._stats_hash ,True 
+        self ._stats_wanted .clear ()
+        kept :List [dict ]=[]
+        h_stats =hashlib .sha1 ()
+        stats_res ,timings ["stats"]=_timed (lambda :self ._fetch_stats (merger ,h_stats ,kept ))
+        self ._keep_stats (stats_res ,kept ,h_stats )
+        return res ,h_stats ,False 
+
+    def fetch (self ,cancel :Optional [threading .Event ]=None ,refresh_stats :bool =True )->Tuple [List [dict ],bool ,str ,Dict [str ,object ]]:
+        # refresh_stats=False is the poll mode: one score request per tick unless the scores moved
+        with self ._lock :
+            start_ts =time .perf_counter ()
+            start_count =self .request_count 
+            self .trace =FetchTrace ()
+            self ._cancel =cancel if cancel is not None else threading .Event ()
+            error_type :Optional [str ]=None 
+            relogin =False 
+            timings :Dict [str ,float ]={}
+            fingerprint =""
+            stats_skipped =False 
+
+            def _meta ()->Dict [str ,object ]:
+                return {
+                "elapsed":round (float (time .perf_counter ()-start_ts ),4 ),
+                "error_type":error_type ,
+                "relogin":relogin ,
+                "requests":self .request_count -start_count ,
+                "timings":dict (timings ),
+                "fingerprint":fingerprint ,
+                "stats_skipped":stats_skipped ,
+                "trace":self .trace .to_dict ()
+                }
 
-    raw_courses :List [dict ]=[]
-    existing_primary =set ()# (ident, credits_2, semester)
-    existing_by_name =set ()
+            try :
+                while True :
+                    if not self .logged_in :
+                        (ok ,msg ,error_type ),timings ["login"]=_timed (self .login )
+                        relogin =True 
+                        if not ok :
+                            self .close ()
+                            return [],False ,msg ,_meta ()
+
+                    merger =RawCourseMerger ()
+                    h_score =hashlib .sha1 ()
+                    if refresh_stats or self ._stats_items is None :
+                        self ._stats_wanted .clear ()
+                        h_stats =hashlib .sha1 ()
+                        ok ,msg ,error_type =self ._fetch_both (merger ,h_score ,h_stats ,timings )
+                    else :
+                        (ok ,msg ,error_type ),h_stats ,stats_skipped =self ._fetch_score_first (merger ,h_score ,timings )
+                    if error_type ==ERR_SESSION_EXPIRED :
+                        self .logged_in =False 
+                        error_type =None 
+                        if self ._drop_failed_shortcut (relogin ):
+                            continue 
+                        if relogin :
+                            error_type ="auth"
+                            return [],False ,"认证失败：登录后仍无法访问成绩接口",_meta ()
+                        continue 
+                    if not ok :
+                        return [],False ,msg ,_meta ()
+
+                    fingerprint =_combine_fingerprint (h_score ,h_stats )
+                    self ._score_digest =h_score .hexdigest ()
+                    raw_courses =merger .raw_courses 
+                    return raw_courses ,True ,f"获取成功：{len (raw_courses )} 门课程",_meta ()
+            except FetchCancelled :
+                error_type =ERR_CANCELLED 
+                return [],False ,"请求已取消",_meta ()
+
+
+def fetch_data (username :str ,password :str ,page_size :int =DATA_PAGE_SIZE )->Tuple [List [dict ],bool ,str ,Dict [str ,object ]]:
+    zs =ZdbkSession (username ,password ,page_size =page_size )
+    try :
+        return zs .fetch ()
+    finally :
+        zs .close ()
 
-    def _extract_course_code (item :dict )->str :
     
-        if not isinstance (item ,dict ):
-            return ""
+def save_session_cookies (path :str ,username :str ,jar )->None :
+    cookies =[
+    {
+    "name":c .name ,
+    "value":c .value ,
+    "domain":c .domain ,
+    "path":c .path ,
+    "secure":bool (c .secure ),
+    "expires":c .expires 
+    }
+    for c in jar 
+    ]
+    doc ={"username":username ,"saved_at":now_str (),"cookies":cookies }
+    ensure_dir (os .path .dirname (path ))
+    tmp =path +".tmp"
+    # owner-only from the first byte: these cookies are as good as a password until they expire
+    fd =os .open (tmp ,os .O_WRONLY |os .O_CREAT |os .O_TRUNC ,0o600 )
+    with os .fdopen (fd ,"w",encoding ="utf-8")as f :
+        json .dump (doc ,f ,ensure_ascii =False )
+    try :
+        os .chmod (tmp ,0o600 )
+    except OSError :
+        pass 
+    os .replace (tmp ,path )
 
-        for k in ("kch","kcdm","kcbh","courseCode","course_code"):
-            v =(item .get (k )or "").strip ()
-            if v :
-                return v 
 
-                
-                
-        xkkh =(item .get ("xkkh")or "").strip ()
-        if xkkh .startswith ("(")and ")-"in xkkh :
+def load_session_cookies (path :str )->Optional [Tuple [str ,requests .cookies .RequestsCookieJar ]]:
+    try :
+        with open (path ,"r",encoding ="utf-8")as f :
+            doc =json .load (f )
+        username =str (doc .get ("username","")or "")
+        now =time .time ()
+        jar =requests .cookies .RequestsCookieJar ()
+        for c in doc .get ("cookies",[])or []:
+            expires =c .get ("expires")
+            if expires and float (expires )<now :
+                continue 
+            jar .set (
+            c ["name"],
+            c ["value"],
+            domain =c .get ("domain",""),
+            path =c .get ("path","/"),
+            secure =bool (c .get ("secure",False )),
+            expires =expires 
+            )
+    except Exception :
+        return None 
+    if not username or not len (jar ):
+        return None 
+    return username ,jar 
+
+
+def clear_session_cookies (path :str )->None :
+    try :
+        os .remove (path )
+    except OSError :
+        pass 
+
+
+
+class AsyncZdbkSession :
+
+    def __init__ (self ,username :str ,password :str ,*,connector =None ,page_size :int =DATA_PAGE_SIZE ):
+        self .username =username 
+        self .password =password 
+        self .page_size =int (page_size )
+        self .session =None 
+        self .logged_in =False 
+        self .request_count =0 
+        self .trace =FetchTrace ()
+        self ._walk :Optional [RedirectWalk ]=None 
+        self ._connector =connector 
+
+    async def close (self )->None :
+        if self .session is not None :
             try :
-                tail =xkkh .split (")-",1 )[1 ]
-                parts =tail .split ("-")
-                if len (parts )>=1 :
-                    code =(parts [0 ]or "").strip ()
-                    if code :
-                        return code 
+                await self .session .close ()
             except Exception :
                 pass 
+        self .session =None 
+        self .logged_in =False 
+
+    async def _request (self ,method :str ,url :str ,phase :str ="",**kwargs )->Tuple [int ,Dict [str ,str ],bytes ]:
+        trace =self .trace 
+        await rate_limiter .acquire_async (url )
+        self .request_count +=1 
+        connect_timeout ,read_timeout =latency_tracker .timeout (phase )
+        timeout =aiohttp .ClientTimeout (sock_connect =connect_timeout ,sock_read =read_timeout )
+        t0 =time .perf_counter ()
+        status :Optional [int ]=None 
+        nbytes =0 
+        timed_out =False 
+        try :
+            async with self .session .request (method ,url ,timeout =timeout ,**kwargs )as resp :
+                body =await resp .read ()
+                status =resp .status 
+                nbytes =len (body )
+                headers ={k .lower ():v for k ,v in resp .headers .items ()}
+                return resp .status ,headers ,body 
+        except asyncio .TimeoutError :
+            timed_out =True 
+            raise 
+        except asyncio .CancelledError :
+            # a hedge that lost the race: its partial result belongs to nobody
+            phase =""
+            raise 
+        finally :
+            if phase :
+                secs =time .perf_counter ()-t0 
+                trace .add_request (phase ,secs ,status ,nbytes )
+                if timed_out :
+                    latency_tracker .timed_out (phase )
+                elif status is not None :
+                    latency_tracker .observe (phase ,secs )
+
+    async def _hedged_request (self ,method :str ,url :str ,phase :str ,**kwargs )->Tuple [int ,Dict [str ,str ],bytes ]:
+        delay =latency_tracker .hedge_delay (phase )
+        if delay is None :
+            return await self ._request (method ,url ,phase ,**kwargs )
+        first =asyncio .ensure_future (self ._request (method ,url ,phase ,**kwargs ))
+        done ,_pending =await asyncio .wait ({first },timeout =delay )
+        if done :
+            return first .result ()
+        self .trace .add_hedge (phase )
+        pending ={first ,asyncio .ensure_future (self ._request (method ,url ,phase ,**kwargs ))}
+        error :Optional [BaseException ]=None 
+        try :
+            while pending :
+                done ,pending =await asyncio .wait (pending ,return_when =asyncio .FIRST_COMPLETED )
+                for task in done :
+                    if task .exception ()is None :
+                        return task .result ()
+                    error =task .exception ()
+            raise error 
+        finally :
+            for task in pending :
+                task .cancel ()
+
+    def _redirect_key (self )->str :
+        return f"{ZDBK_BASE }|{self .username }"
+
+    def _drop_failed_shortcut (self ,relogin :bool )->bool :
+        # a fresh login that cut the redirect chain short still has no data session:
+        # forget the shortcut and walk the full chain once more
+        if relogin and self ._walk is not None and self ._walk .cut_short :
+            forget_redirect_shortcut (self ._walk .key )
+            self ._walk =None 
+            return True 
+        return False 
 
-        return ""
+    async def login (self )->Tuple [bool ,str ,Optional [str ]]:
+        await self .close ()
+        self .session =aiohttp .ClientSession (
+        connector =self ._connector ,
+        connector_owner =self ._connector is None ,
+        headers =LOGIN_HEADERS ,
+        cookie_jar =aiohttp .CookieJar (unsafe =True )
+        )
 
+        error_type :Optional [str ]=None 
+        user_data ={"username":self .username ,"password":self .password ,"execution":None ,"_eventId":"submit"}
 
-    def _extract_semester (item :dict )->str :
-        
-        if not isinstance (item ,dict ):
-            return "未知学期"
+        execution_value =None 
+        for attempt in range (MAX_RETRIES ):
+            try :
+                status ,_headers ,body =await self ._request ("GET",LOGIN_URL ,"login_page")
+                if status >=400 :
+                    raise aiohttp .ClientError (f"HTTP {status }")
+                execution_value =extract_execution (body .decode ("utf-8",errors ="replace"))
+                if execution_value is None :
+                    return False ,"接口变更：无法获取登录参数 execution","api"
+                if not execution_value :
+                    return False ,"接口变更：登录参数 execution 为空","api"
+                break 
+            except asyncio .TimeoutError :
+                error_type ="timeout"
+                if attempt ==MAX_RETRIES -1 :
+                    return False ,"网络超时：访问登录页超时",error_type 
+                self .trace .add_retry ("login_page")
+                await asyncio .sleep (_retry_delay (attempt ))
+            except aiohttp .ClientError as e :
+                if attempt ==MAX_RETRIES -1 :
+                    return False ,f"访问登录页失败：{e }",error_type 
+                self .trace .add_retry ("login_page")
+                await asyncio .sleep (_retry_delay (attempt ))
+
+        user_data ["execution"]=execution_value 
+
+        try :
+            _status ,_headers ,body =await self ._request ("GET",PUBKEY_URL ,"pubkey")
+            pub =json .loads (body .decode ("utf-8"))
+            n ,e =pub ["modulus"],pub ["exponent"]
+            user_data ["password"]=_rsa_encrypt (self .password ,e ,n )
+        except asyncio .TimeoutError :
+            return False ,"网络超时：获取公钥超时","timeout"
+        except Exception as e :
+            return False ,f"接口变更：获取/加密公钥失败：{e }","api"
+
+        try :
+            status ,headers ,body =await self ._request ("POST",LOGIN_URL ,"login_post",data =user_data ,allow_redirects =False )
+            failure =_check_login_post (status ,body .decode ("utf-8",errors ="replace")if status ==200 else "")
+            if failure :
+                return False ,failure [0 ],failure [1 ]
+
+            current_url =_https_location (headers .get ("location"))
+            walk =RedirectWalk (self ._redirect_key ())
+            max_redirects =10 
+            redirect_count =0 
+            while current_url and redirect_count <max_redirects :
+                try :
+                    status ,headers ,_body =await self ._request ("GET",current_url ,"redirects",allow_redirects =False )
+                    if status >=400 :
+                        raise aiohttp .ClientError (f"HTTP {status }")
+                    if "filtererr.jsp"in current_url :
+                        return False ,"认证失败：登录被拦截（filtererr.jsp）","auth"
+                    hop_url =current_url 
+                    current_url =_https_location (headers .get ("location"))
+                    redirect_count +=1 
+                    if walk .visited (hop_url ,current_url ):
+                        break 
+                except asyncio .TimeoutError :
+                    return False ,"网络超时：登录重定向超时","timeout"
+                except aiohttp .ClientError as e :
+                    return False ,f"重定向失败：{e }",error_type 
+        except asyncio .TimeoutError :
+            return False ,"网络超时：登录请求超时","timeout"
+        except Exception as e :
+            return False ,f"登录过程异常：{e }",error_type 
+
+        walk .finish ()
+        self ._walk =walk 
+        self .logged_in =True 
+        return True ,"",None 
+
+    async def _query_items (self ,base_url :str ,label :str ,on_items ,h ,phase :str )->Tuple [bool ,str ,Optional [str ]]:
+        page =1 
+        prev :Optional [bytes ]=None 
+        while True :
+            url =_query_url (base_url ,self .page_size ,page )
+            error_type :Optional [str ]=None 
+            data =None 
+            for attempt in range (MAX_RETRIES ):
+                try :
+                    status ,headers ,body =await self ._hedged_request ("GET",url ,phase ,headers =DATA_HEADERS ,allow_redirects =False )
+                    if _looks_expired (status ,headers .get ("content-type","")):
+                        return False ,"会话已过期",ERR_SESSION_EXPIRED 
+                    if status !=200 :
+                        return False ,f"接口变更：{label }返回 HTTP {status }","api"
+                    try :
+                        data =json .loads (body .decode ("utf-8"))
+                    except Exception as e :
+                        return False ,f"接口变更：{label } JSON 解析失败：{e }","api"
+                    break 
+                except asyncio .TimeoutError :
+                    error_type ="timeout"
+                    if attempt ==MAX_RETRIES -1 :
+                        return False ,f"网络超时：读取{label }超时",error_type 
+                    self .trace .add_retry (phase )
+                    await asyncio .sleep (_retry_delay (attempt ))
+                except Exception as e :
+                    if attempt ==MAX_RETRIES -1 :
+                        return False ,f"读取{label }失败：{e }",error_type 
+                    self .trace .add_retry (phase )
+                    await asyncio .sleep (_retry_delay (attempt ))
+
+            items =_page_items (data )
+            if items is None :
+                return False ,f"接口变更：{label } items 字段异常","api"
+
+            prev =_hash_page (h ,items ,prev )
+            if prev is None :
+                # the server ignored the page parameter and sent the same page again
+                return True ,"",None 
+            on_items (items )
+
+            if _is_last_page (data ,items ,page ,self .page_size ):
+                return True ,"",None 
+            page +=1 
+
+    async def fetch (self )->Tuple [List [dict ],bool ,str ,Dict [str ,object ]]:
+        start_ts =time .perf_counter ()
+        start_count =self .request_count 
+        self .trace =FetchTrace ()
+        error_type :Optional [str ]=None 
+        relogin =False 
+        timings :Dict [str ,float ]={}
+        fingerprint =""
+
+        def _meta ()->Dict [str ,object ]:
+            return {
+            "elapsed":round (float (time .perf_counter ()-start_ts ),4 ),
+            "error_type":error_type ,
+            "relogin":relogin ,
+            "requests":self .request_count -start_count ,
+            "timings":dict (timings ),
+            "fingerprint":fingerprint ,
+            "trace":self .trace .to_dict ()
+            }
+
+        async def _timed_async (coro ):
+            t0 =time .perf_counter ()
+            res =await coro 
+            return res ,round (float (time .perf_counter ()-t0 ),4 )
+
+        def _on_stats (items :List [dict ])->None :
+            merger .add_items ([item for item in items if item .get ("xdbjmc")!="未修"],True )
+
+        while True :
+            if not self .logged_in :
+                (ok ,msg ,error_type ),timings ["login"]=await _timed_async (self .login ())
+                relogin =True 
+                if not ok :
+                    await self .close ()
+                    return [],False ,msg ,_meta ()
+
+            merger =RawCourseMerger ()
+            h_score =hashlib .sha1 ()
+            h_stats =hashlib .sha1 ()
+            (score_res ,timings ["score"]),(_stats_res ,timings ["stats"])=await asyncio .gather (
+            _timed_async (self ._query_items (SCORE_URL ,"成绩接口",lambda items :merger .add_items (items ,False ),h_score ,"score")),
+            _timed_async (self ._query_items (STATS_URL ,"主修统计接口",_on_stats ,h_stats ,"stats"))
+            )
+            ok ,msg ,error_type =score_res 
+            if error_type ==ERR_SESSION_EXPIRED :
+                self .logged_in =False 
+                error_type =None 
+                if self ._drop_failed_shortcut (relogin ):
+                    continue 
+                if relogin :
+                    error_type ="auth"
+                    return [],False ,"认证失败：登录后仍无法访问成绩接口",_meta ()
+                continue 
+            if not ok :
+                return [],False ,msg ,_meta ()
+
+            fingerprint =_combine_fingerprint (h_score ,h_stats )
+            raw_courses =merger .raw_courses 
+            return raw_courses ,True ,f"获取成功：{len (raw_courses )} 门课程",_meta ()
+
+
+async def fetch_many_async (
+accounts :List [Tuple [str ,str ]],
+concurrency :int =ASYNC_CONCURRENCY ,
+page_size :int =DATA_PAGE_SIZE 
+)->List [Tuple [List [dict ],bool ,str ,Dict [str ,object ]]]:
 
-        for k in ("xkkh","xnxq01id","xnxq"):
-            raw =(item .get (k )or "").strip ()
-            if raw :
-                sem =map_semester (raw )
-                if sem !="未知学期":
-                    return sem 
+    sem =asyncio .Semaphore (max (1 ,int (concurrency )))
 
-        xnm =str (item .get ("xnm")or "").strip ()
-        xqm =str (item .get ("xqm")or item .get ("xq")or "").strip ()
-        if xnm .isdigit ()and xqm in ("1","2"):
+    if not AIOHTTP_AVAILABLE :
+        async def _one_threaded (username :str ,password :str ):
+            async with sem :
+                return await asyncio .to_thread (fetch_data ,username ,password ,page_size )
+
+        return list (await asyncio .gather (*[_one_threaded (u ,p )for u ,p in accounts ]))
+
+    connector =aiohttp .TCPConnector (limit =max (1 ,int (concurrency ))*2 )
+
+    async def _one (username :str ,password :str ):
+        async with sem :
+            zs =AsyncZdbkSession (username ,password ,connector =connector ,page_size =page_size )
             try :
-                end_year =int (xnm )+1 
-                sem =map_semester (f"({xnm }-{end_year }-{xqm })")
-                return sem 
-            except Exception :
-                pass 
+                return await zs .fetch ()
+            finally :
+                await zs .close ()
+
+    try :
+        return list (await asyncio .gather (*[_one (u ,p )for u ,p in accounts ]))
+    finally :
+        await connector .close ()
+
+
+async def fetch_data_async (username :str ,password :str ,page_size :int =DATA_PAGE_SIZE )->Tuple [List [dict ],bool ,str ,Dict [str ,object ]]:
+    return (await fetch_many_async ([(username ,password )],1 ,page_size ))[0 ]
+
+
+def run_fetch_many (
+accounts :List [Tuple [str ,str ]],
+concurrency :int =ASYNC_CONCURRENCY ,
+page_size :int =DATA_PAGE_SIZE 
+)->List [Tuple [List [dict ],bool ,str ,Dict [str ,object ]]]:
+    return asyncio .run (fetch_many_async (accounts ,concurrency ,page_size ))
 
-        return "未知学期"
 
-    for item in stats_data :
-        course_name =(item .get ("kcmc")or "").strip ()
-        cj =(item .get ("cj")or "").strip ()
-        if course_name and cj :
-            semester =_extract_semester (item )
-            credits =safe_float (item .get ("xf",0.0 ),0.0 )
-            credits2 =float (f"{credits :.2f}")
-            code =_extract_course_code (item )
-
-            k_primary =((code or course_name ),credits2 ,semester )
-            k_name =(course_name ,credits2 ,semester )
-
-            existing_primary .add (k_primary )
-            existing_by_name .add (k_name )
-
-            raw_courses .append ({
-            "name":course_name ,
-            "course_code":code ,
-            "credits":credits ,
-            "score":cj ,
-            "semester":semester ,
-            "is_major":True 
-            })
+def _retry_delay (attempt :int ,base :float =RETRY_BASE_DELAY_SEC ,cap :float =RETRY_MAX_DELAY_SEC )->float :
+    delay =min (cap ,base *(2 **max (0 ,attempt )))
+    return delay /2.0 +random .uniform (0.0 ,delay /2.0 )
 
-    for item in score_data :
-        course_name =(item .get ("kcmc")or "").strip ()
-        cj =(item .get ("cj")or "").strip ()
-        if not course_name or not cj :
-            continue 
 
-        semester =_extract_semester (item )
-        credits =safe_float (item .get ("xf",0.0 ),0.0 )
-        credits2 =float (f"{credits :.2f}")
-        code =_extract_course_code (item )
+class PollScheduler :
 
-        k_primary =((code or course_name ),credits2 ,semester )
-        k_name =(course_name ,credits2 ,semester )
+    def __init__ (self ,interval_sec :float ):
+        self .interval_sec =float (interval_sec )
+        self .consecutive_failures =0 
+        self .api_failures =0 
+        self .circuit =CIRCUIT_CLOSED 
+        self .open_reason =""
 
-        
-        if (k_primary in existing_primary )or (k_name in existing_by_name ):
-            continue 
+    def reset (self ,interval_sec :Optional [float ]=None )->None :
+        if interval_sec is not None :
+            self .interval_sec =float (interval_sec )
+        self .consecutive_failures =0 
+        self .api_failures =0 
+        self .circuit =CIRCUIT_CLOSED 
+        self .open_reason =""
 
-        raw_courses .append ({
-        "name":course_name ,
-        "course_code":code ,
-        "credits":credits ,
-        "score":cj ,
-        "semester":semester ,
-        "is_major":False 
-        })
+    def record (self ,ok :bool ,error_type :Optional [str ])->Optional [float ]:
+        # returns the delay until the next poll, or None when polling must stop
+        if ok :
+            self .reset ()
+            return self .interval_sec 
 
-        
-        existing_primary .add (k_primary )
-        existing_by_name .add (k_name )
+        self .consecutive_failures +=1 
+
+        if error_type =="auth":
+            self .circuit =CIRCUIT_OPEN 
+            self .open_reason ="auth"
+            return None 
+
+        if error_type =="api":
+            self .api_failures +=1 
+            if self .circuit ==CIRCUIT_OPEN or self .api_failures >=POLL_API_FAILURES_TO_OPEN :
+                # open: wait out the cool-down, then the next tick acts as a probe
+                self .circuit =CIRCUIT_OPEN 
+                self .open_reason ="api"
+                return max (self .interval_sec ,POLL_CIRCUIT_COOLDOWN_SEC )
+            return self .interval_sec 
+        self .api_failures =0 
+
+        delay =min (POLL_BACKOFF_MAX_SEC ,self .interval_sec *(2 **(self .consecutive_failures -1 )))
+        return max (self .interval_sec ,delay /2.0 +random .uniform (0.0 ,delay /2.0 ))
 
-    return raw_courses ,True ,f"获取成功：{len (raw_courses )} 门课程",_meta ()
 
-    
 def is_binary_score (score_text :str )->bool :
     return str (score_text or "").strip ()in BINARY_SCORE_TEXTS 
 
@@ -967,6 +2604,224 @@ def group_by_semester (courses :List [Course ])->Dict [int ,List [Course ]]:
     return groups 
 
 
+def _normalize_row (rc :dict )->Optional [tuple ]:
+    name =(rc .get ("name")or "").strip ()
+    score =str (rc .get ("score","")).strip ()
+    if not name or not score :
+        return None 
+    credits =safe_float (rc .get ("credits",0.0 ),0.0 )
+    sem =(rc .get ("semester")or "未知学期").strip ()
+    code =str (rc .get ("course_code","")or "").strip ()
+    return (name ,credits ,f"{credits :.2f}",score ,sem ,code ,bool (rc .get ("is_major",False )),semester_registry .intern (sem ))
+
+
+def _merge_rows (rows ,merged :Optional [Dict [Tuple [str ,str ,int ],list ]]=None ,unique :bool =False )->Dict [Tuple [str ,str ,int ],list ]:
+    # rows merge on (name, credits, semester); credits are formatted once and reused for course_key.
+    # unique=True is for MergedRawCourses, which RawCourseMerger has already deduplicated
+    if merged is None :
+        merged ={}
+    for row in rows :
+        if row is None :
+            continue 
+        key =(row [0 ],row [2 ],row [7 ])
+        if unique :
+            merged [key ]=list (row [:7 ])
+            continue 
+        cur =merged .get (key )
+        if cur is None :
+            merged [key ]=list (row [:7 ])
+            continue 
+        cur [6 ]=cur [6 ]or row [6 ]
+        if not cur [5 ]and row [5 ]:
+            cur [5 ]=row [5 ]
+    return merged 
+
+
+def _build_course (rec ,semester_index :int ,override_type :Optional [Callable [[str ],Optional [str ]]])->Tuple [str ,Course ]:
+    name ,credits ,credits2 ,score ,sem ,code ,is_major =rec 
+    k =f"{code or name }|{credits2 }|{sem }"
+    default_type =TYPE_MAJOR if is_major else TYPE_NONMAJOR 
+    ov =override_type (k )if override_type is not None else None 
+    return k ,Course (
+    name =name ,
+    credits =credits ,
+    score_text =score ,
+    semester =sem ,
+    semester_index =semester_index ,
+    course_type =ov if ov else default_type ,
+    source_major_flag =is_major ,
+    course_code =code 
+    )
+
+
+def _course_order (c :Course )->Tuple [int ,str ,float ,str ]:
+    # a total order: merged rows are unique on (name, credits, semester), so ties on name fall to credits,
+    # and the full and incremental paths list cards identically
+    return (c .semester_index ,c .name ,c .credits ,c .course_code )
+
+
+def normalize_courses (raw_courses :List [dict ],override_type :Optional [Callable [[str ],Optional [str ]]]=None )->Tuple [List [Course ],Dict [str ,Course ]]:
+    if isinstance (raw_courses ,MergedRawCourses )and len (raw_courses .rows )==len (raw_courses ):
+        return _courses_from_merged (_merge_rows (raw_courses .rows ,unique =True ),override_type )
+    return _courses_from_merged (_merge_rows (_normalize_row (rc )for rc in (raw_courses or [])),override_type )
+
+
+def _courses_from_merged (merged :Dict [Tuple [str ,str ,int ],list ],override_type :Optional [Callable [[str ],Optional [str ]]])->Tuple [List [Course ],Dict [str ,Course ]]:
+    sem_to_idx =semester_registry .ordinals (k [2 ]for k in merged )
+
+    courses :List [Course ]=[]
+    by_key :Dict [str ,Course ]={}
+    for (_ ,_ ,sid ),rec in merged .items ():
+        k ,c =_build_course (rec ,sem_to_idx [sid ],override_type )
+        courses .append (c )
+        by_key [k ]=c 
+
+    courses .sort (key =_course_order )
+    return courses ,by_key 
+
+
+_RAW_ROW_FIELDS =("name","credits","score","semester","course_code","is_major")
+
+
+class CourseIndex :
+    # keeps one account's normalised courses between polls; only rows whose raw fields changed are parsed
+    # and override-resolved, and unchanged Course objects (with any type the user set on them) are reused
+
+    def __init__ (self ):
+        self .courses :List [Course ]=[]
+        self .by_key :Dict [str ,Course ]={}
+        self .parsed =0 
+        self .built =0 
+        self ._rows :Dict [tuple ,Optional [tuple ]]={}
+        self ._built :Dict [Tuple [str ,str ,int ],Tuple [tuple ,str ,Course ]]={}
+
+    def reset (self )->None :
+        self .courses =[]
+        self .by_key ={}
+        self ._rows ={}
+        self ._built ={}
+
+    def update (self ,raw_courses :List [dict ],override_type :Optional [Callable [[str ],Optional [str ]]]=None )->Tuple [List [Course ],Dict [str ,Course ]]:
+        cache =self ._rows 
+        rows :Dict [tuple ,Optional [tuple ]]={}
+        for rc in (raw_courses or []):
+            sig =tuple (map (rc .get ,_RAW_ROW_FIELDS ))
+            if sig in rows :
+                continue 
+            if sig in cache :
+                rows [sig ]=cache [sig ]
+            else :
+                rows [sig ]=_normalize_row (rc )
+                self .parsed +=1 
+        self ._rows =rows 
+
+        merged =_merge_rows (rows .values (),unique =isinstance (raw_courses ,MergedRawCourses ))
+        sem_to_idx =semester_registry .ordinals (k [2 ]for k in merged )
+
+        prev_built =self ._built 
+        built :Dict [Tuple [str ,str ,int ],Tuple [tuple ,str ,Course ]]={}
+        kept_ids =set ()
+        fresh :List [Course ]=[]
+        for mk ,rec in merged .items ():
+            rec =tuple (rec )
+            idx =sem_to_idx [mk [2 ]]
+            prev =prev_built .get (mk )
+            if prev is not None and prev [0 ]==rec :
+                k ,c =prev [1 ],prev [2 ]
+                if c .semester_index ==idx :
+                    kept_ids .add (id (c ))
+                else :
+                    # an earlier semester showed up: shift the index but keep the resolved type
+                    c =replace (c ,semester_index =idx )
+                    fresh .append (c )
+            else :
+                k ,c =_build_course (rec ,idx ,override_type )
+                self .built +=1 
+                fresh .append (c )
+            built [mk ]=(rec ,k ,c )
+        self ._built =built 
+
+        if not fresh and len (kept_ids )==len (self .courses ):
+            return self .courses ,self .by_key 
+
+        courses =[c for c in self .courses if id (c )in kept_ids ]
+        if len (fresh )*8 <len (courses ):
+            order =[_course_order (c )for c in courses ]
+            for c in fresh :
+                o =_course_order (c )
+                i =bisect .bisect_right (order ,o )
+                order .insert (i ,o )
+                courses .insert (i ,c )
+        else :
+            courses .extend (fresh )
+            courses .sort (key =_course_order )
+        self .courses =courses 
+        self .by_key ={k :c for _ ,k ,c in built .values ()}
+        return self .courses ,self .by_key 
+
+
+def raw_to_courses (raw_courses :List [dict ],override_type :Optional [Callable [[str ],Optional [str ]]]=None )->List [Course ]:
+    return normalize_courses (raw_courses ,override_type )[0 ]
+
+
+def courses_snapshot_payload (courses :List [Course ])->List [dict ]:
+    payload =[]
+    for c in courses :
+        payload .append ({
+        "name":c .name ,
+        "credits":c .credits ,
+        "score":c .score_text ,
+        "semester":c .semester ,
+        "semester_index":c .semester_index ,
+        "course_type":c .course_type ,
+        "course_code":c .course_code ,
+        "source_major_flag":c .source_major_flag 
+        })
+    return payload 
+
+
+def write_courses_snapshot (courses :List [Course ],directory :str ,keep :Optional [int ]=None )->Optional [str ]:
+    ensure_dir (directory )
+    fp =os .path .join (directory ,f"courses_{datetime .now ().strftime ('%Y%m%d_%H%M%S')}.json")
+    try :
+        with open (fp ,"w",encoding ="utf-8")as f :
+            json .dump (courses_snapshot_payload (courses ),f ,ensure_ascii =False ,indent =2 )
+    except Exception :
+        return None 
+    prune_snapshots (directory ,SNAPSHOT_KEEP if keep is None else keep )
+    return fp 
+
+
+def prune_snapshots (directory :str ,keep :Optional [int ]=None )->int :
+    # bounded by default; keep<=0 is the explicit opt-out for anyone who wants the full history for ingest
+    if keep is None :
+        keep =SNAPSHOT_KEEP 
+    if keep <=0 :
+        return 0 
+    try :
+        names =sorted (n for n in os .listdir (directory )if n .startswith ("courses_")and n .endswith (".json"))
+    except OSError :
+        return 0 
+    removed =0 
+    for name in names [:-keep ]:
+        try :
+            os .remove (os .path .join (directory ,name ))
+            removed +=1 
+        except OSError :
+            pass 
+    return removed 
+
+
+def percentile (values :List [float ],q :float )->float :
+    if not values :
+        return 0.0 
+    vs =sorted (values )
+    pos =(len (vs )-1 )*max (0.0 ,min (100.0 ,float (q )))/100.0 
+    lo =int (pos )
+    hi =min (lo +1 ,len (vs )-1 )
+    return vs [lo ]+(vs [hi ]-vs [lo ])*(pos -lo )
+
+
 def _stat_courses_for_analysis (courses :List [Course ],wc :WeightsConfig )->List [Course ]:
     stat_courses =select_retake_attempts (courses ,wc .retake_policy )
     return [c for c in stat_courses if not is_excluded_from_calc (c )]
@@ -1245,7 +3100,7 @@ class CourseCard (tk .Frame ):
         self ._build ()
 
     def _build (self ):
-        sem_idx =max (1 ,min (MAX_SEMESTER_INDEX ,int (self .course .semester_index )))
+        sem_idx =max (1 ,int (self .course .semester_index ))
         sem_color =SEM_COLORS [(sem_idx -1 )%len (SEM_COLORS )]
 
         
@@ -1448,9 +3303,11 @@ class GradeApp (tk .Tk ):
 
         self .username :Optional [str ]=None 
         self .password :Optional [str ]=None 
+        self .zdbk :Optional [ZdbkSession ]=None 
 
         self .courses :List [Course ]=[]
         self .course_by_key :Dict [str ,Course ]={}
+        self ._course_index =CourseIndex ()
 
         self .view_courses :List [Course ]=[]
         self ._view_weights :Optional [WeightsConfig ]=None 
@@ -1459,12 +3316,26 @@ class GradeApp (tk .Tk ):
 
         self .polling =False 
         self .poll_interval_sec =30 
-        self ._fetch_inflight =False 
+        self .poll_scheduler =PollScheduler (self .poll_interval_sec )
+        self ._poll_after_id =None 
+        self .net =NetworkExecutor ()
+        self ._fetch_task :Optional [NetworkTask ]=None 
+        self ._fetch_kinds :List [str ]=[]
+        self ._cancelling :Optional [NetworkTask ]=None 
 
         self .new_course_pending_keys :set =set ()
         self .last_success_sync_time :str =""
         self .last_request_elapsed :float =0.0 
+        self ._fingerprint_by_user :Dict [str ,str ]={}
+        self .fetch_history =FetchHistory ()
+        self .login_prefetch =LoginPrefetch ()
+
+        try :
+            start_metrics_exporter (int (safe_float (os .environ .get ("ZJU_METRICS_PORT"),0 )),os .environ .get ("ZJU_METRICS_FILE",""))
+        except OSError :
+            pass 
 
+        self .protocol ("WM_DELETE_WINDOW",self ._on_close )
         self ._build_login ()
         self .after (120 ,self ._process_net_queue )
 
@@ -1691,6 +3562,10 @@ class GradeApp (tk .Tk ):
         self .var_pass =tk .StringVar ()
         self .ent_pass =ttk .Entry (inner ,textvariable =self .var_pass ,width =32 ,show ="*")
         self .ent_pass .grid (row =4 ,column =0 ,columnspan =2 ,sticky ="we",pady =(6 ,0 ))
+        # an expired warm-up is renewed only when the user is actually filling in the form
+        for ent in (ent_user ,self .ent_pass ):
+            ent .bind ("<FocusIn>",lambda _e :self ._start_prewarm (),add ="+")
+            ent .bind ("<Key>",lambda _e :self ._start_prewarm (),add ="+")
 
         self .var_showpass =tk .BooleanVar (value =False )
         chk =tk .Checkbutton (
@@ -1724,6 +3599,21 @@ class GradeApp (tk .Tk ):
         )
         chk2 .grid (row =5 ,column =1 ,sticky ="e",pady =(10 ,0 ))
 
+        self .var_persist =tk .BooleanVar (value =self .config_store .get_persist_session ())
+        chk3 =tk .Checkbutton (
+        inner ,
+        text ="保持登录状态（本地保存会话 Cookie）",
+        variable =self .var_persist ,
+        bg =COLOR_CARD ,
+        fg =COLOR_TEXT ,
+        activebackground =COLOR_CARD ,
+        activeforeground =COLOR_TEXT ,
+        selectcolor =COLOR_CARD ,
+        relief ="flat",
+        highlightthickness =0 
+        )
+        chk3 .grid (row =6 ,column =0 ,columnspan =2 ,sticky ="w",pady =(6 ,0 ))
+
         
         enabled ,su ,sp =self .config_store .get_saved_login ()
         if enabled and su :
@@ -1732,7 +3622,7 @@ class GradeApp (tk .Tk ):
             self .var_remember .set (True )
 
         btn_row =tk .Frame (inner ,bg =COLOR_CARD )
-        btn_row .grid (row =6 ,column =0 ,columnspan =2 ,sticky ="we",pady =(16 ,0 ))
+        btn_row .grid (row =7 ,column =0 ,columnspan =2 ,sticky ="we",pady =(16 ,0 ))
         btn_row .grid_columnconfigure (0 ,weight =1 )
         btn_row .grid_columnconfigure (1 ,weight =1 )
 
@@ -1743,20 +3633,91 @@ class GradeApp (tk .Tk ):
         self .btn_clear_saved .grid (row =0 ,column =1 ,sticky ="we",padx =(10 ,0 ))
 
         self .lbl_status =tk .Label (inner ,text ="",bg =COLOR_CARD ,fg =COLOR_DANGER )
-        self .lbl_status .grid (row =7 ,column =0 ,columnspan =2 ,sticky ="w",pady =(12 ,0 ))
+        self .lbl_status .grid (row =8 ,column =0 ,columnspan =2 ,sticky ="w",pady =(12 ,0 ))
 
         hint ="提示：保存仅在本机本地文件中存储（轻度编码，不是强加密）。"
         tk .Label (inner ,text =hint ,bg =COLOR_CARD ,fg =COLOR_SUBTEXT ,
-        font =("Microsoft YaHei UI",9 )).grid (row =8 ,column =0 ,columnspan =2 ,sticky ="w",pady =(18 ,0 ))
+        font =("Microsoft YaHei UI",9 )).grid (row =9 ,column =0 ,columnspan =2 ,sticky ="w",pady =(18 ,0 ))
 
         inner .grid_columnconfigure (0 ,weight =1 )
         inner .grid_columnconfigure (1 ,weight =1 )
 
-        ent_user .focus_set ()
+        if not self ._try_resume_session ():
+            ent_user .focus_set ()
+
+    def _try_resume_session (self )->bool :
+        if not self .config_store .get_persist_session ():
+            return False 
+        saved =load_session_cookies (SESSION_FILE )
+        if saved is None :
+            return False 
+        username ,jar =saved 
+        enabled ,su ,sp =self .config_store .get_saved_login ()
+        if not (enabled and su ==username and sp ):
+            # without a password an expired cookie could never be renewed; use the login form instead
+            self .var_user .set (username )
+            return False 
+        password =sp 
+
+        self .var_user .set (username )
+        self .btn_login .configure (state ="disabled")
+        self .lbl_status .configure (text ="正在恢复上次会话…",fg =COLOR_SUBTEXT )
+
+        def worker (cancel :threading .Event ):
+            zs =ZdbkSession (username ,password )
+            if zs .restore (jar ):
+                raw ,ok ,msg ,meta =zs .fetch (cancel )
+            else :
+                raw ,ok ,msg ,meta =[],False ,"上次会话已失效，请重新登录。",{"error_type":"auth"}
+            if not ok :
+                zs .close ()
+            self .net_q .put ({
+            "type":"login_result",
+            "ok":ok ,
+            "msg":msg ,
+            "meta":meta ,
+            "username":username ,
+            "password":password ,
+            "remember":True ,
+            "resumed":True ,
+            "session":zs ,
+            "raw":raw 
+            })
+
+        self .net .submit ("login",worker )
+        return True 
+
+    def _persist_session (self ):
+        if not self .config_store .get_persist_session ()or self .zdbk is None :
+            return 
+        jar =self .zdbk .cookies ()
+        if jar is None :
+            return 
+        try :
+            save_session_cookies (SESSION_FILE ,str (self .username or ""),jar )
+        except Exception :
+            pass 
+
+    def _start_prewarm (self ):
+        # one zjuam round trip per visit to the form, never on a timer; a no-op while fresh, in flight or backing off
+        if not (getattr (self ,"login_frame",None )is not None and self .login_frame .winfo_exists ()):
+            return 
+        if str (self .btn_login .cget ("state"))=="disabled"or self .net .inflight ("prewarm")is not None :
+            return 
+        if self .login_prefetch .closed :
+            self .login_prefetch =LoginPrefetch ()
+        if not self .login_prefetch .should_warm ():
+            return 
+        prefetch =self .login_prefetch 
+        self .net .submit ("prewarm",lambda cancel :prefetch .warm ())
+
+    def _stop_prewarm (self ):
+        self .login_prefetch .close ()
 
     def _clear_saved_login (self ):
         self .config_store .clear_saved_login ()
         self .var_remember .set (False )
+        clear_session_cookies (SESSION_FILE )
         self .lbl_status .configure (text ="已清除本地保存的账号密码。",fg =COLOR_SUBTEXT )
 
     def _toggle_password (self ):
@@ -1771,12 +3732,20 @@ class GradeApp (tk .Tk ):
 
             
         remember =bool (self .var_remember .get ())
+        self .config_store .set_persist_session (bool (self .var_persist .get ()))
+        if not self .config_store .get_persist_session ():
+            clear_session_cookies (SESSION_FILE )
 
         self .btn_login .configure (state ="disabled")
         self .lbl_status .configure (text ="正在登录并拉取成绩…",fg =COLOR_SUBTEXT )
 
-        def worker ():
-            raw ,ok ,msg ,meta =fetch_data (username ,password )
+        prefetch =self .login_prefetch 
+
+        def worker (cancel :threading .Event ):
+            zs =ZdbkSession (username ,password ,prefetch =prefetch )
+            raw ,ok ,msg ,meta =zs .fetch (cancel )
+            if not ok :
+                zs .close ()
             self .net_q .put ({
             "type":"login_result",
             "ok":ok ,
@@ -1785,10 +3754,11 @@ class GradeApp (tk .Tk ):
             "username":username ,
             "password":password ,
             "remember":remember ,
+            "session":zs ,
             "raw":raw 
             })
 
-        threading .Thread (target =worker ,daemon =True ).start ()
+        self .net .submit ("login",worker )
 
         
     def _build_main (self ):
@@ -2282,7 +4252,7 @@ class GradeApp (tk .Tk ):
         credits =simpledialog .askfloat ("新增课程（模拟）","学分：",parent =self ,minvalue =0.0 )
         if credits is None :
             return 
-        sem_idx =simpledialog .askinteger ("新增课程（模拟）","学期序号（1~12）：",parent =self ,minvalue =1 ,maxvalue =MAX_SEMESTER_INDEX )
+        sem_idx =simpledialog .askinteger ("新增课程（模拟）","学期序号（从 1 开始）：",parent =self ,minvalue =1 )
         if sem_idx is None :
             return 
         score =simpledialog .askstring ("新增课程（模拟）","成绩（如 92 / 良好 / 合格）：",parent =self )
@@ -2468,97 +4438,15 @@ class GradeApp (tk .Tk ):
         self ._render_stats ()
 
         
-    def _raw_to_courses (self ,raw_courses :List [dict ],keep_user_override :bool )->List [Course ]:
-        sems =sorted ({(rc .get ("semester")or "未知学期")for rc in raw_courses },key =parse_semester_sort_key )
-        sem_to_idx :Dict [str ,int ]={}
-        idx =1 
-        for s in sems :
-            sem_to_idx [s ]=idx 
-            idx +=1 
-            if idx >MAX_SEMESTER_INDEX :
-                break 
-
-                
-        merged :Dict [Tuple [str ,float ,str ],dict ]={}
-        for rc in (raw_courses or []):
-            name0 =(rc .get ("name")or "").strip ()
-            credits0 =safe_float (rc .get ("credits",0.0 ),0.0 )
-            sem0 =(rc .get ("semester")or "未知学期").strip ()
-            score0 =str (rc .get ("score","")).strip ()
-            if not name0 or not score0 :
-                continue 
-
-            credits2 =float (f"{credits0 :.2f}")
-            key =(name0 ,credits2 ,sem0 )
-
-            cur =merged .get (key )
-            if cur is None :
-                merged [key ]=dict (rc )
-            else :
-            
-                cur ["is_major"]=bool (cur .get ("is_major",False ))or bool (rc .get ("is_major",False ))
-                
-                if not str (cur .get ("course_code","")or "").strip ():
-                    cc =str (rc .get ("course_code","")or "").strip ()
-                    if cc :
-                        cur ["course_code"]=cc 
-
-        courses :List [Course ]=[]
-        for rc in merged .values ():
-            name =(rc .get ("name")or "").strip ()
-            credits =safe_float (rc .get ("credits",0.0 ),0.0 )
-            score =str (rc .get ("score","")).strip ()
-            sem =(rc .get ("semester")or "未知学期").strip ()
-            is_major =bool (rc .get ("is_major",False ))
-
-            if not name or not score :
-                continue 
-
-            sem_idx =sem_to_idx .get (sem ,0 )
-            code =str (rc .get ("course_code","")or "").strip ()
-            k =course_key (name ,credits ,sem ,code )
-
-            default_type =TYPE_MAJOR if is_major else TYPE_NONMAJOR 
-            if keep_user_override :
-                ov =self .config_store .get_override_type (k ,self .username )
-                ctype =ov if ov else default_type 
-            else :
-                ctype =default_type 
-
-            courses .append (Course (
-            name =name ,
-            credits =credits ,
-            score_text =score ,
-            semester =sem ,
-            semester_index =sem_idx ,
-            course_type =ctype ,
-            source_major_flag =is_major ,
-            course_code =code 
-            ))
-
-        courses .sort (key =lambda c :(c .semester_index ,c .name ))
-        return courses 
+    def _raw_to_courses (self ,raw_courses :List [dict ],keep_user_override :bool )->Tuple [List [Course ],Dict [str ,Course ]]:
+        override_type =None 
+        if keep_user_override :
+            override_type =lambda k :self .config_store .get_override_type (k ,self .username )
+            return self ._course_index .update (raw_courses ,override_type )
+        return normalize_courses (raw_courses ,override_type )
 
     def _snapshot_courses (self ):
-        ensure_dir (SNAPSHOT_DIR )
-        payload =[]
-        for c in self .courses :
-            payload .append ({
-            "name":c .name ,
-            "credits":c .credits ,
-            "score":c .score_text ,
-            "semester":c .semester ,
-            "semester_index":c .semester_index ,
-            "course_type":c .course_type ,
-            "course_code":c .course_code ,
-            "source_major_flag":c .source_major_flag 
-            })
-        fp =os .path .join (SNAPSHOT_DIR ,f"courses_{datetime .now ().strftime ('%Y%m%d_%H%M%S')}.json")
-        try :
-            with open (fp ,"w",encoding ="utf-8")as f :
-                json .dump (payload ,f ,ensure_ascii =False ,indent =2 )
-        except Exception :
-            pass 
+        write_courses_snapshot (self .courses ,SNAPSHOT_DIR )
 
     def _refresh_filter_options (self ):
         max_sem =max ([c .semester_index for c in self .view_courses ],default =0 )
@@ -3399,18 +5287,28 @@ class GradeApp (tk .Tk ):
 
             
     def _sync_click (self ):
-        if self ._fetch_inflight :
+        if "sync_result"in self ._fetch_kinds :
             return 
         if not messagebox .askyesno ("确认同步","将重新从教务网拉取成绩并重建所有卡片。\n\n确认继续？"):
             return 
-        self ._log (f"{now_str ()}：开始同步教务网…")
-        self ._fetch_inflight =True 
-
-        def worker ():
-            raw ,ok ,msg ,meta =fetch_data (self .username ,self .password )
-            self .net_q .put ({"type":"sync_result","ok":ok ,"msg":msg ,"meta":meta ,"raw":raw })
-
-        threading .Thread (target =worker ,daemon =True ).start ()
+        if self ._submit_fetch ("sync_result"):
+            self ._log (f"{now_str ()}：已有查询进行中，同步将复用其结果…")
+        else :
+            self ._log (f"{now_str ()}：开始同步教务网…")
+
+    def _submit_fetch (self ,kind :str )->bool :
+        # sync and poll share one "fetch" task; returns True when joining one already running
+        zs =self .zdbk 
+        if kind !="poll_result":
+            zs .request_stats_refresh ()
+        task ,joined =self .net .submit ("fetch",lambda cancel :zs .fetch (cancel ,refresh_stats =kind !="poll_result"))
+        if not joined :
+            self ._fetch_task =task 
+            self ._fetch_kinds =[]
+            task .add_done_callback (lambda t :self .net_q .put ({"type":"fetch_done","task":t }))
+        if kind not in self ._fetch_kinds :
+            self ._fetch_kinds .append (kind )
+        return joined 
 
     def _reset_type_click (self ):
         if not messagebox .askyesno ("确认重置","将按教务网主修/非主修结果覆盖你的课程类型选择（包括专业核心也会被重置）。\n\n确认继续？"):
@@ -3437,41 +5335,89 @@ class GradeApp (tk .Tk ):
             return 
 
         self .poll_interval_sec =interval 
+        self .poll_scheduler .reset (interval )
         self .polling =True 
         self .btn_start .configure (state ="disabled")
         self .btn_stop .configure (state ="normal")
         self ._log (f"{now_str ()}：已开始自动查询，频率 {interval }s。")
-        self .after (0 ,self ._poll_once )
+        self ._schedule_poll (0 )
 
     def _stop_polling (self ):
         self .polling =False 
+        self ._cancel_scheduled_poll ()
+        if self ._fetch_task is not None and self ._fetch_kinds ==["poll_result"]:
+            # cancellation is seen between requests, so one already on the wire may run up to its timeout
+            self ._fetch_task .cancel ()
+            self ._cancelling =self ._fetch_task 
+            self ._fetch_task =None 
+            self ._fetch_kinds =[]
+        elif "poll_result"in self ._fetch_kinds :
+            self ._fetch_kinds .remove ("poll_result")
         self .btn_start .configure (state ="normal")
         self .btn_stop .configure (state ="disabled")
-        self ._log (f"{now_str ()}：已停止自动查询。")
+        if self ._cancelling is not None :
+            self ._log (f"{now_str ()}：已停止自动查询，正在取消进行中的请求…")
+        else :
+            self ._log (f"{now_str ()}：已停止自动查询。")
+        self ._update_sync_meta ()
 
-    def _poll_once (self ):
+    def _schedule_poll (self ,delay_sec :float )->None :
+        self ._cancel_scheduled_poll ()
+        self ._poll_after_id =self .after (int (max (0.0 ,float (delay_sec ))*1000 ),self ._poll_once )
+
+    def _cancel_scheduled_poll (self )->None :
+        if self ._poll_after_id is not None :
+            try :
+                self .after_cancel (self ._poll_after_id )
+            except Exception :
+                pass 
+        self ._poll_after_id =None 
+
+    def _schedule_next_poll (self ,ok :bool ,meta :dict )->None :
         if not self .polling :
             return 
-        if self ._fetch_inflight :
-            self .after (self .poll_interval_sec *1000 ,self ._poll_once )
+        et =str (meta .get ("error_type","")or "")or None 
+        delay =self .poll_scheduler .record (ok ,et )
+        if delay is None :
+            self ._log (f"{now_str ()}：认证失败，已暂停自动查询（请检查账号密码后重新开始）。")
+            self ._stop_polling ()
             return 
+        if self .poll_scheduler .circuit ==CIRCUIT_OPEN :
+            self ._log (f"{now_str ()}：接口连续异常，暂停 {delay :.0f}s 后再试探。")
+        elif not ok and delay >self .poll_interval_sec :
+            self ._log (f"{now_str ()}：连续失败 {self .poll_scheduler .consecutive_failures } 次，{delay :.0f}s 后重试。")
+        self ._schedule_poll (delay )
 
-        self ._fetch_inflight =True 
-        self ._log (f"{now_str ()}：开始查询…")
+    def _ensure_poll_scheduled (self )->None :
+        # a cancelled or superseded fetch must not leave polling on with no tick queued
+        if self .polling and self ._poll_after_id is None and "poll_result"not in self ._fetch_kinds :
+            self ._schedule_poll (self .poll_interval_sec )
 
-        def worker ():
-            raw ,ok ,msg ,meta =fetch_data (self .username ,self .password )
-            self .net_q .put ({"type":"poll_result","ok":ok ,"msg":msg ,"meta":meta ,"raw":raw })
-
-        threading .Thread (target =worker ,daemon =True ).start ()
+    def _poll_once (self ):
+        self ._poll_after_id =None 
+        if not self .polling :
+            return 
+        if "poll_result"in self ._fetch_kinds :
+            return 
+        if not self ._submit_fetch ("poll_result"):
+            self ._log (f"{now_str ()}：开始查询…")
 
 
         
+    def _on_close (self ):
+        self .polling =False 
+        self ._cancel_scheduled_poll ()
+        self ._stop_prewarm ()
+        self .net .shutdown ()
+        self ._persist_session ()
+        self .destroy ()
+
     def _process_net_queue (self ):
         try :
             while True :
                 item =self .net_q .get_nowait ()
                 self ._handle_net_result (item )
+                self ._record_fetch (item )
         except Empty :
             pass 
         finally :
@@ -3488,19 +5434,26 @@ class GradeApp (tk .Tk ):
 
             if not ok :
                 self .btn_login .configure (state ="normal")
+                if item .get ("resumed"):
+                    clear_session_cookies (SESSION_FILE )
+                    self .lbl_status .configure (text =msg if msg .startswith ("上次会话")else f"恢复会话失败：{msg }",fg =COLOR_SUBTEXT )
+                    return 
                 self .lbl_status .configure (text =f"登录失败：{msg }",fg =COLOR_DANGER )
+                self ._start_prewarm ()
                 return 
 
             self .username =item .get ("username")
             self .password =item .get ("password")
+            self .zdbk =item .get ("session")or ZdbkSession (self .username ,self .password )
 
             remember =bool (item .get ("remember",False ))
             if remember :
                 self .config_store .set_saved_login (True ,self .username ,self .password )
 
             raw =item .get ("raw",[])or []
-            self .courses =self ._raw_to_courses (raw ,keep_user_override =True )
-            self .course_by_key ={course_key (c .name ,c .credits ,c .semester ,c .course_code ):c for c in self .courses }
+            self ._course_index .reset ()
+            self .courses ,self .course_by_key =self ._raw_to_courses (raw ,keep_user_override =True )
+            self ._remember_fingerprint (meta )
 
             
             self .view_courses =self .courses 
@@ -3510,12 +5463,11 @@ class GradeApp (tk .Tk ):
 
             self .last_success_sync_time =now_str ()
 
+            self ._stop_prewarm ()
+            self ._persist_session ()
             self .login_frame .destroy ()
             self ._build_main ()
-            if hasattr (self ,"lbl_sync_meta"):
-                self .lbl_sync_meta .configure (
-                text =f"最近成功同步：{self .last_success_sync_time }｜上次请求耗时：{self .last_request_elapsed :.3f}s"
-                )
+            self ._update_sync_meta ()
             self ._log (f"{now_str ()}：登录成功。{msg }（耗时 {self .last_request_elapsed :.3f}s）")
 
         elif t =="sync_result":
@@ -3524,7 +5476,6 @@ class GradeApp (tk .Tk ):
             raw =item .get ("raw",[])or []
             meta =item .get ("meta",{})or {}
             self .last_request_elapsed =float (meta .get ("elapsed",0.0 )or 0.0 )
-            self ._fetch_inflight =False 
 
             if not ok :
                 et =str (meta .get ("error_type","")or "")
@@ -3539,10 +5490,15 @@ class GradeApp (tk .Tk ):
                 self ._log (f"{now_str ()}：同步失败：{msg }（耗时 {self .last_request_elapsed :.3f}s）")
                 return 
 
+            if self ._is_unchanged (meta ):
+                self .last_success_sync_time =now_str ()
+                self ._update_sync_meta ()
+                self ._log (f"{now_str ()}：同步完成，数据无变化。（耗时 {self .last_request_elapsed :.3f}s）")
+                return 
+
             old_keys =set (self .course_by_key .keys ())
 
-            self .courses =self ._raw_to_courses (raw ,keep_user_override =True )
-            self .course_by_key ={course_key (c .name ,c .credits ,c .semester ,c .course_code ):c for c in self .courses }
+            self .courses ,self .course_by_key =self ._raw_to_courses (raw ,keep_user_override =True )
 
             
             if not (self ._sim_enabled and (getattr (self ,"var_sim_profile",tk .StringVar (value ="主配置")).get ()!="主配置")):
@@ -3552,21 +5508,21 @@ class GradeApp (tk .Tk ):
 
             new_keys =set (self .course_by_key .keys ())
             added =sorted (list (new_keys -old_keys ))
+            self .new_course_pending_keys &=new_keys 
             if added :
                 self .new_course_pending_keys .update (added )
 
             self .last_success_sync_time =now_str ()
-            if hasattr (self ,"lbl_sync_meta"):
-                self .lbl_sync_meta .configure (
-                text =f"最近成功同步：{self .last_success_sync_time }｜上次请求耗时：{self .last_request_elapsed :.3f}s"
-                )
+            self ._update_sync_meta ()
 
+            self ._remember_fingerprint (meta )
             self ._refresh_filter_options ()
             self ._render_stats ()
             self ._refresh_cards ()
             self ._log (f"{now_str ()}：同步完成。{msg }（耗时 {self .last_request_elapsed :.3f}s）")
 
             if added :
+                poll_metrics .record_new_grades (self .username ,len (added ))
                 self ._notify_new_grades (added )
 
         elif t =="poll_result":
@@ -3575,7 +5531,6 @@ class GradeApp (tk .Tk ):
             raw =item .get ("raw",[])or []
             meta =item .get ("meta",{})or {}
             self .last_request_elapsed =float (meta .get ("elapsed",0.0 )or 0.0 )
-            self ._fetch_inflight =False 
 
             if not ok :
                 et =str (meta .get ("error_type","")or "")
@@ -3588,46 +5543,111 @@ class GradeApp (tk .Tk ):
                 else :
                     self ._log (f"{now_str ()}：查询失败：{msg }（耗时 {self .last_request_elapsed :.3f}s）")
 
-                if self .polling :
-                    self .after (self .poll_interval_sec *1000 ,self ._poll_once )
+                self ._schedule_next_poll (False ,meta )
                 return 
 
             self .last_success_sync_time =now_str ()
-            if hasattr (self ,"lbl_sync_meta"):
-                self .lbl_sync_meta .configure (
-                text =f"最近成功同步：{self .last_success_sync_time }｜上次请求耗时：{self .last_request_elapsed :.3f}s"
-                )
+            self ._update_sync_meta ()
+
+            if self ._is_unchanged (meta ):
+                self ._log (f"{now_str ()}：无新成绩。（耗时 {self .last_request_elapsed :.3f}s）")
+                self ._schedule_next_poll (True ,meta )
+                return 
 
-            new_courses_all =self ._raw_to_courses (raw ,keep_user_override =True )
-            new_map ={course_key (c .name ,c .credits ,c .semester ,c .course_code ):c for c in new_courses_all }
+            new_courses_all ,new_map =self ._raw_to_courses (raw ,keep_user_override =True )
 
             old_keys =set (self .course_by_key .keys ())
             new_keys =set (new_map .keys ())
             added =sorted (list (new_keys -old_keys ))
 
+            # the fingerprint moved, so apply the data even without a new course (score fix, removal, major flag);
+            # it is remembered only once self.courses reflects it, or the next sync would wrongly skip
+            self .courses =new_courses_all 
+            self .course_by_key =new_map 
+            self .new_course_pending_keys &=new_keys 
+            if not (self ._sim_enabled and (getattr (self ,"var_sim_profile",tk .StringVar (value ="主配置")).get ()!="主配置")):
+                self .view_courses =self .courses 
+                self ._view_weights =None 
+            self ._remember_fingerprint (meta )
+
+            self ._snapshot_courses ()
+            self ._refresh_filter_options ()
+            self ._render_stats ()
+            self ._refresh_cards ()
+
             if added :
                 self .new_course_pending_keys .update (added )
 
                 added_names =[new_map [k ].name for k in added if k in new_map ]
                 self ._log (f"{now_str ()}：发现新成绩：{', '.join (added_names )}（耗时 {self .last_request_elapsed :.3f}s）")
 
-                self .courses =new_courses_all 
-                self .course_by_key =new_map 
-
-                self ._snapshot_courses ()
-                self ._refresh_filter_options ()
-                self ._render_stats ()
-                self ._refresh_cards ()
-
+                poll_metrics .record_new_grades (self .username ,len (added ))
                 self ._notify_new_grades (added )
             else :
-                self ._log (f"{now_str ()}：无新成绩。（耗时 {self .last_request_elapsed :.3f}s）")
+                self ._log (f"{now_str ()}：无新成绩，已更新已有课程。（耗时 {self .last_request_elapsed :.3f}s）")
 
-            if self .polling :
-                self .after (self .poll_interval_sec *1000 ,self ._poll_once )
+            self ._schedule_next_poll (True ,meta )
 
-        else :
-            self ._fetch_inflight =False 
+        elif t =="fetch_done":
+            task =item .get ("task")
+            try :
+                raw ,ok ,msg ,meta =task .result ()
+            except BaseException as e :
+                raw ,ok ,msg ,meta =[],False ,f"请求异常：{e }",{"error_type":ERR_CANCELLED if task .cancelled ()else None }
+            if task is not self ._fetch_task :
+                if task is self ._cancelling :
+                    self ._cancelling =None 
+                    self ._log (f"{now_str ()}：请求已取消。")
+                    self ._update_sync_meta ()
+                self ._ensure_poll_scheduled ()
+                return 
+            kinds =sorted (self ._fetch_kinds ,key =lambda k :k !="sync_result")
+            self ._fetch_task =None 
+            self ._fetch_kinds =[]
+            if ok and meta .get ("relogin"):
+                self ._persist_session ()
+            if task .cancelled ()or meta .get ("error_type")==ERR_CANCELLED :
+                self ._log (f"{now_str ()}：请求已取消。")
+                self ._ensure_poll_scheduled ()
+                return 
+            # a manual sync that joined a poll is handled first so it rebuilds; the poll then sees no change
+            for i ,kind in enumerate (kinds ):
+                sub ={"type":kind ,"ok":ok ,"msg":msg ,"meta":meta ,"raw":raw ,"shared":i >0 }
+                self ._handle_net_result (sub )
+                self ._record_fetch (sub )
+
+    def _update_sync_meta (self ):
+        if hasattr (self ,"lbl_sync_meta"):
+            text =f"最近成功同步：{self .last_success_sync_time }｜上次请求耗时：{self .last_request_elapsed :.3f}s"
+            if len (self .fetch_history .entries )>=2 :
+                text +=f"｜p95：{self .fetch_history .percentiles ((95 ,))['total'][0 ]:.3f}s"
+            if self ._cancelling is not None :
+                text +="｜正在取消…"
+            self .lbl_sync_meta .configure (text =text )
+
+    def _record_fetch (self ,item :dict )->None :
+        if item .get ("type")not in ("login_result","sync_result","poll_result")or item .get ("shared"):
+            return 
+        meta =item .get ("meta",{})or {}
+        if meta .get ("error_type")!=ERR_CANCELLED :
+            poll_metrics .record_fetch (self .username or item .get ("username")or "",item ["type"].split ("_")[0 ],bool (item .get ("ok")),meta )
+            poll_metrics .set_courses (self .username or "",len (self .courses ))
+        self .fetch_history .add (meta )
+        trace =meta .get ("trace")
+        if trace :
+            self ._log (f"{now_str ()}：请求明细：{format_trace (trace )}")
+        if len (self .fetch_history .entries )%10 ==0 :
+            self ._log (f"{now_str ()}：{self .fetch_history .format_summary ()}")
+        self ._update_sync_meta ()
+
+    def _is_unchanged (self ,meta :dict )->bool :
+        fp =str (meta .get ("fingerprint","")or "")
+        return bool (fp )and self ._fingerprint_by_user .get (str (self .username or ""))==fp 
+
+    def _remember_fingerprint (self ,meta :dict )->None :
+        fp =str (meta .get ("fingerprint","")or "")
+        if fp :
+            self ._fingerprint_by_user [str (self .username or "")]=fp 
 
     def _notify_new_grades (self ,keys :List [str ]):
         title ="新成绩通知"
@@ -3665,8 +5685,664 @@ class GradeApp (tk .Tk ):
             pass 
 
             
-if __name__ =="__main__":
+_ACCOUNT_NAME_RE =re .compile (r"^[A-Za-z0-9_-]+$")
+
+
+def safe_account_name (name :str )->str :
+    # account names from imported files become directory names; anything else is refused
+    name =str (name or "").strip ()
+    return name if _ACCOUNT_NAME_RE .match (name )else ""
+
+
+def load_accounts (path :str )->List [dict ]:
+    # rows without a password, or whose username is not safe_account_name(), are skipped in both formats
+    with open (path ,"r",encoding ="utf-8-sig")as f :
+        text =f .read ()
+
+    accounts :List [dict ]=[]
+    stripped =text .lstrip ()
+    if stripped .startswith ("[")or stripped .startswith ("{"):
+        obj =json .loads (text )
+        if isinstance (obj ,dict ):
+            obj =obj .get ("accounts",[])if isinstance (obj .get ("accounts"),list )else [
+            {"username":k ,"password":v }for k ,v in obj .items ()
+            ]
+        for it in obj :
+            if isinstance (it ,dict ):
+                acc =dict (it )
+            elif isinstance (it ,(list ,tuple ))and len (it )>=2 :
+                acc ={"username":it [0 ],"password":it [1 ]}
+            else :
+                continue 
+            acc ["username"]=safe_account_name (acc .get ("username",""))
+            acc ["password"]=str (acc .get ("password","")or "")
+            if acc ["username"]and acc ["password"]:
+                accounts .append (acc )
+        return accounts 
+
+    for row in csv .reader (io .StringIO (text )):
+        if len (row )<2 or row [0 ].strip ().startswith ("#"):
+            continue 
+        if row [0 ].strip ().lower ()in ("username","学号"):
+            continue 
+        username =safe_account_name (row [0 ])
+        if not username or not row [1 ]:
+            continue 
+        acc ={"username":username ,"password":row [1 ]}
+        if len (row )>=3 and row [2 ].strip ():
+            acc ["interval"]=row [2 ].strip ()
+        accounts .append (acc )
+    return accounts 
+
+
+def summarize_courses (courses :List [Course ],weights :WeightsConfig )->Dict [str ,object ]:
+    avg_score ,avg_gpa =compute_metrics (courses ,weights ,weighted =False )
+    w_score ,w_gpa =compute_metrics (courses ,weights ,weighted =True )
+    return {
+    "courses":len (courses ),
+    "credits":credits_sum_unique (courses ,weights ),
+    "avg_score":avg_score ,
+    "gpa":avg_gpa ,
+    "weighted_score":w_score ,
+    "weighted_gpa":w_gpa ,
+    "gpa_43":compute_gpa_43 (courses ,weights )
+    }
+
+
+_JSON_ITEMS_RE =re .compile (r'"items"\s*:\s*\[')
+_JSON_SKIP =" \t\r\n,"
+
+_CSV_COLUMNS ={
+"name":("name","kcmc","课程名称","课程名"),
+"score":("score","cj","成绩"),
+"credits":("credits","xf","学分"),
+"semester":("semester","学期","学年学期","xnxq"),
+"course_code":("course_code","kch","课程代码","课程号"),
+"xkkh":("xkkh","选课课号"),
+"is_major":("is_major","source_major_flag","主修"),
+"username":("username","xh","学号")
+}
+
+
+def iter_json_items (f ,chunk_size :int =INGEST_CHUNK_SIZE )->Iterator [object ]:
+    # yields the elements of a top-level array, or of the "items" array of a zdbk response,
+    # holding at most one element plus one chunk in memory
+    decoder =json .JSONDecoder ()
+    chunks =iter (lambda :f .read (chunk_size ),"")
+    buf =""
+    first =True 
+    for chunk in chunks :
+        buf +=chunk 
+        if first :
+            head =buf .lstrip ()
+            if not head :
+                buf =""
+                continue 
+            first =False 
+            if head [0 ]=="[":
+                buf =head [1 :]
+                break 
+        m =_JSON_ITEMS_RE .search (buf )
+        if m :
+            buf =buf [m .end ():]
+            break 
+        # keep a tail in case the key is split across two chunks
+        buf =buf [-32 :]
+    else :
+        return 
+
+    pos =0 
+    while True :
+        n =len (buf )
+        while pos <n and buf [pos ]in _JSON_SKIP :
+            pos +=1 
+        if pos <n and buf [pos ]=="]":
+            return 
+        if pos <n :
+            try :
+                obj ,end =decoder .raw_decode (buf ,pos )
+            except json .JSONDecodeError :
+                obj ,end =None ,-1 
+            if end >=0 :
+                yield obj 
+                pos =end 
+                continue 
+        chunk =next (chunks ,"")
+        if not chunk :
+            if pos <n :
+                raise ValueError (f"JSON 在第 {pos } 个字符处不完整")
+            return 
+        buf =buf [pos :]+chunk 
+        pos =0 
+
+
+def _csv_flag (value :str ,default :bool )->bool :
+    v =str (value or "").strip ().lower ()
+    if not v :
+        return default 
+    return v in ("1","true","yes","y","是","主修")
+
+
+def _raw_course_from_csv (row :Dict [str ,str ],cols :Dict [str ,str ],is_major :bool )->Optional [dict ]:
+    def col (field :str )->str :
+        name =cols .get (field )
+        return str (row .get (name )or "").strip ()if name else ""
+
+    name =col ("name")
+    score =col ("score")
+    if not name or not score :
+        return None 
+    xkkh_semester ,xkkh_code =_split_xkkh (col ("xkkh"))
+    semester =col ("semester")
+    if semester .startswith ("("):
+        semester =map_semester (semester )
+    elif not semester :
+        semester =xkkh_semester 
+    return {
+    "name":name ,
+    "course_code":col ("course_code")or xkkh_code ,
+    "credits":safe_float (col ("credits"),0.0 ),
+    "score":score ,
+    "semester":semester or "未知学期",
+    "is_major":_csv_flag (col ("is_major"),is_major ),
+    "username":col ("username")
+    }
+
+
+def _raw_course_from_record (obj :object ,is_major :bool )->Optional [dict ]:
+    if not isinstance (obj ,dict ):
+        return None 
+    if "kcmc"in obj :
+        rc =raw_course_from_item (obj ,is_major )
+        if rc is not None :
+            rc ["username"]=str (obj .get ("xh")or "").strip ()
+        return rc 
+    # snapshots and raw dumps already use the raw-course field names
+    name =str (obj .get ("name")or "").strip ()
+    score =str (obj .get ("score","")or "").strip ()
+    if not name or not score :
+        return None 
+    return {
+    "name":name ,
+    "course_code":str (obj .get ("course_code","")or "").strip (),
+    "credits":safe_float (obj .get ("credits",0.0 ),0.0 ),
+    "score":score ,
+    "semester":str (obj .get ("semester")or "未知学期").strip (),
+    "is_major":bool (obj .get ("is_major",obj .get ("source_major_flag",is_major ))),
+    "username":str (obj .get ("username")or "").strip ()
+    }
+
+
+def iter_ingest_rows (path :str ,kind :str ="auto",chunk_size :int =INGEST_CHUNK_SIZE )->Iterator [dict ]:
+    # streams raw-course dicts (plus "username" when the file carries one) from a saved score/stats
+    # response, a courses_*.json snapshot or a CSV export
+    base =os .path .basename (path ).lower ()
+    as_csv =kind =="csv"or (kind !="json"and base .endswith (".csv"))
+    is_major =kind =="stats"or (kind in ("auto","json")and ("stats"in base or "zgkc"in base ))
+
+    with open (path ,"r",encoding ="utf-8-sig",errors ="replace",newline ="")as f :
+        if as_csv :
+            reader =csv .DictReader (f )
+            headers ={h .strip ().lower ():h for h in (reader .fieldnames or [])}
+            cols ={}
+            for field ,aliases in _CSV_COLUMNS .items ():
+                for a in aliases :
+                    if a .lower ()in headers :
+                        cols [field ]=headers [a .lower ()]
+                        break 
+            for row in reader :
+                rc =_raw_course_from_csv (row ,cols ,is_major )
+                if rc is not None :
+                    yield rc 
+            return 
+
+        for obj in iter_json_items (f ,chunk_size ):
+            rc =_raw_course_from_record (obj ,is_major )
+            if rc is not None :
+                yield rc 
+
+
+def run_ingest (
+paths :List [str ],
+out_dir :str ,
+*,
+kind :str ="auto",
+default_user :str ="local",
+config_store :Optional [ConfigStore ]=None 
+)->Dict [str ,object ]:
+    fallback =safe_account_name (default_user )
+    if not fallback :
+        raise ValueError (f"账号名只能包含字母、数字、下划线和连字符：{default_user !r}")
+    ensure_dir (out_dir )
+    # rows are merged per student as they stream in, so memory follows distinct courses, not file size
+    merged_by_user :Dict [str ,Dict [Tuple [str ,str ,int ],list ]]={}
+    rows_read =0 
+    rows_rejected =0 
+    for path in paths :
+        for rc in iter_ingest_rows (path ,kind ):
+            rows_read +=1 
+            raw_user =rc .pop ("username","")
+            username =safe_account_name (raw_user )if raw_user else fallback 
+            if not username :
+                rows_rejected +=1 
+                continue 
+            _merge_rows ((_normalize_row (rc ),),merged_by_user .setdefault (username ,{}))
+
+    results =[]
+    for username ,merged in sorted (merged_by_user .items ()):
+        override_type =None 
+        weights =WeightsConfig ()
+        if config_store is not None :
+            override_type =lambda k ,u =username :config_store .get_override_type (k ,u )
+            weights =config_store .get_weights (username )
+        courses ,_ =_courses_from_merged (merged ,override_type )
+        row :Dict [str ,object ]={"username":username }
+        row ["snapshot"]=write_courses_snapshot (courses ,os .path .join (out_dir ,username ))
+        row .update (summarize_courses (courses ,weights ))
+        results .append (row )
+
+    summary :Dict [str ,object ]={
+    "generated_at":now_str (),
+    "sources":[os .path .abspath (p )for p in paths ],
+    "rows_read":rows_read ,
+    "rows_rejected":rows_rejected ,
+    "accounts":len (results ),
+    "results":results 
+    }
+    with open (os .path .join (out_dir ,"summary.json"),"w",encoding ="utf-8")as f :
+        json .dump (summary ,f ,ensure_ascii =False ,indent =2 )
+    return summary 
+
+
+def run_batch (
+accounts :List [dict ],
+out_dir :str ,
+*,
+workers :int =4 ,
+page_size :int =DATA_PAGE_SIZE ,
+use_async :bool =False ,
+config_store :Optional [ConfigStore ]=None 
+)->Dict [str ,object ]:
+    ensure_dir (out_dir )
+    workers =max (1 ,int (workers ))
+    configure_data_pools (workers )
+
+    def _process (acc :dict ,raw :List [dict ],ok :bool ,msg :str ,meta :Dict [str ,object ])->Dict [str ,object ]:
+        username =acc ["username"]
+        row :Dict [str ,object ]={
+        "username":username ,
+        "ok":ok ,
+        "msg":msg ,
+        "elapsed":float (meta .get ("elapsed",0.0 )or 0.0 ),
+        "error_type":meta .get ("error_type")
+        }
+        if not ok :
+            return row 
+        name =safe_account_name (username )
+        if not name :
+            row .update (ok =False ,msg =f"账号名不合法，未写入快照：{username !r}")
+            return row 
+        override_type =None 
+        weights =WeightsConfig ()
+        if config_store is not None :
+            override_type =lambda k :config_store .get_override_type (k ,username )
+            weights =config_store .get_weights (username )
+        courses =raw_to_courses (raw ,override_type )
+        row ["snapshot"]=write_courses_snapshot (courses ,os .path .join (out_dir ,name ))
+        row .update (summarize_courses (courses ,weights ))
+        return row 
+
+    start_ts =time .perf_counter ()
+    if use_async :
+        results =run_fetch_many ([(a ["username"],a ["password"])for a in accounts ],workers ,page_size )
+        rows =[_process (a ,*res )for a ,res in zip (accounts ,results )]
+    else :
+        def _one (acc :dict )->Dict [str ,object ]:
+            return _process (acc ,*fetch_data (acc ["username"],acc ["password"],page_size ))
+
+        with ThreadPoolExecutor (max_workers =workers ,thread_name_prefix ="batch")as pool :
+            rows =list (pool .map (_one ,accounts ))
+    wall =time .perf_counter ()-start_ts 
+
+    latencies =[float (r ["elapsed"])for r in rows ]
+    summary :Dict [str ,object ]={
+    "generated_at":now_str (),
+    "engine":"async"if use_async else "threads",
+    "workers":workers ,
+    "page_size":page_size ,
+    "accounts":len (rows ),
+    "ok":sum (1 for r in rows if r ["ok"]),
+    "wall_sec":round (wall ,4 ),
+    "accounts_per_sec":round (len (rows )/wall ,4 )if wall >0 else 0.0 ,
+    "latency_p50":round (percentile (latencies ,50 ),4 ),
+    "latency_p95":round (percentile (latencies ,95 ),4 ),
+    "rate_limit":{"per_sec":rate_limiter .rate ,"burst":rate_limiter .burst ,"hosts":rate_limiter .metrics ()},
+    "results":rows 
+    }
+    with open (os .path .join (out_dir ,"summary.json"),"w",encoding ="utf-8")as f :
+        json .dump (summary ,f ,ensure_ascii =False ,indent =2 )
+    return summary 
+
+
+def _cmd_batch (args )->int :
+    accounts =load_accounts (args .accounts )
+    if not accounts :
+        print (f"账号文件中没有可用账号：{args .accounts }",file =sys .stderr )
+        return 2 
+    out_dir =args .out or os .path .join (OUTPUT_DIR ,"batch",datetime .now ().strftime ("%Y%m%d_%H%M%S"))
+    if args .rate_limit is not None :
+        rate_limiter .configure (args .rate_limit )
+    summary =run_batch (
+    accounts ,
+    out_dir ,
+    workers =args .workers ,
+    page_size =args .page_size ,
+    use_async =args .use_async ,
+    config_store =ConfigStore (CONFIG_FILE )
+    )
+    for row in summary ["results"]:
+        if row ["ok"]:
+            print (f"{row ['username']}：{row ['courses']} 门｜均绩 {row ['gpa']:.4f}｜加权 {row ['weighted_gpa']:.4f}｜4.3制 {row ['gpa_43']:.4f}｜{row ['elapsed']:.3f}s")
+        else :
+            print (f"{row ['username']}：失败：{row ['msg']}｜{row ['elapsed']:.3f}s")
+    print (
+    f"完成 {summary ['ok']}/{summary ['accounts']}｜{summary ['accounts_per_sec']:.2f} 账号/s｜"
+    f"p50 {summary ['latency_p50']:.3f}s｜p95 {summary ['latency_p95']:.3f}s｜输出 {out_dir }"
+    )
+    for host ,st in summary ["rate_limit"]["hosts"].items ():
+        if st ["throttled"]:
+            print (f"限速 {host }：{st ['throttled']}/{st ['requests']} 次排队｜累计等待 {st ['wait_sec']:.2f}s｜最长 {st ['max_wait_sec']:.2f}s｜最大队列 {st ['max_queued']}")
+    return 0 if summary ["ok"]==summary ["accounts"]else 1 
+
+
+class WatchAccount :
+
+    def __init__ (self ,username :str ,password :str ,interval_sec :float ):
+        self .username =username 
+        self .interval_sec =max (float (WATCH_MIN_INTERVAL_SEC ),float (interval_sec ))
+        self .session =ZdbkSession (username ,password )
+        self .scheduler =PollScheduler (self .interval_sec )
+        self .cancel =threading .Event ()
+        self .known_keys :Optional [set ]=None 
+        self .course_index =CourseIndex ()
+        self .fingerprint =""
+        self .last_success =""
+        self .fetches =0 
+        self .paused =""
+
+    def state (self )->Dict [str ,object ]:
+        return {
+        "fingerprint":self .fingerprint ,
+        "known_keys":sorted (self .known_keys )if self .known_keys is not None else None ,
+        "last_success":self .last_success ,
+        "paused":self .paused 
+        }
+
+    def restore (self ,st :dict )->None :
+        self .fingerprint =str (st .get ("fingerprint","")or "")
+        keys =st .get ("known_keys")
+        self .known_keys =set (keys )if isinstance (keys ,list )else None 
+        self .last_success =str (st .get ("last_success","")or "")
+
+
+class WatchEventSink :
+    # append-only JSONL; one line per event so other tools can tail it
+
+    def __init__ (self ,path :str ,notify :bool =False ):
+        self .path =path 
+        self .notify =bool (notify )and PLYER_AVAILABLE 
+        self ._lock =threading .Lock ()
+        ensure_dir (os .path .dirname (os .path .abspath (path )))
+
+    def emit (self ,event :str ,username :str ,**fields )->Dict [str ,object ]:
+        doc ={"ts":now_str (),"event":event ,"username":username }
+        doc .update (fields )
+        line =json .dumps (doc ,ensure_ascii =False )
+        with self ._lock :
+            with open (self .path ,"a",encoding ="utf-8")as f :
+                f .write (line +"\n")
+        if self .notify and event =="new_grades":
+            names =[c ["name"]for c in fields .get ("courses",[])]
+            try :
+                notification .notify (title =f"新成绩通知（{username }）",message ="新增课程出分：\n"+"\n".join (names ),timeout =10 )
+            except Exception :
+                pass 
+        return doc 
+
+
+class WatchDaemon :
+    # one scheduler for many accounts: a due-time heap feeding a pool capped at `concurrency`
+
+    def __init__ (
+    self ,
+    accounts :List [dict ],
+    out_dir :str ,
+    *,
+    default_interval :float =WATCH_DEFAULT_INTERVAL_SEC ,
+    concurrency :int =WATCH_CONCURRENCY ,
+    config_store :Optional [ConfigStore ]=None ,
+    notify :bool =False 
+    ):
+        self .out_dir =out_dir 
+        self .concurrency =max (1 ,int (concurrency ))
+        configure_data_pools (self .concurrency )
+        self .config_store =config_store 
+        self .state_path =os .path .join (out_dir ,"state.json")
+        self .sink =WatchEventSink (os .path .join (out_dir ,"events.jsonl"),notify =notify )
+        self .accounts =[
+        WatchAccount (a ["username"],a ["password"],safe_float (a .get ("interval"),default_interval )or default_interval )
+        for a in accounts if safe_account_name (a ["username"])
+        ]
+        self ._load_state ()
+
+    def _load_state (self )->None :
+        try :
+            with open (self .state_path ,"r",encoding ="utf-8")as f :
+                doc =json .load (f )
+        except (OSError ,ValueError ):
+            return 
+        saved =doc .get ("accounts")or {}
+        for acc in self .accounts :
+            st =saved .get (acc .username )
+            if isinstance (st ,dict ):
+                acc .restore (st )
+
+    def save_state (self )->None :
+        doc ={"saved_at":now_str (),"accounts":{acc .username :acc .state ()for acc in self .accounts }}
+        ensure_dir (self .out_dir )
+        tmp =self .state_path +".tmp"
+        with open (tmp ,"w",encoding ="utf-8")as f :
+            json .dump (doc ,f ,ensure_ascii =False ,indent =1 )
+        os .replace (tmp ,self .state_path )
+
+    def _fetch (self ,acc :WatchAccount ):
+        # the first fetch after start reads both endpoints; later ticks are score-only
+        refresh =acc .fetches ==0 
+        acc .fetches +=1 
+        return acc .session .fetch (acc .cancel ,refresh_stats =refresh )
+
+    def _handle (self ,acc :WatchAccount ,raw :List [dict ],ok :bool ,msg :str ,meta :Dict [str ,object ])->Optional [float ]:
+        et =meta .get ("error_type")
+        if et ==ERR_CANCELLED :
+            return None 
+        poll_metrics .record_fetch (acc .username ,"watch",ok ,meta )
+        was_failing =acc .scheduler .consecutive_failures >0 
+        delay =acc .scheduler .record (ok ,et )
+        if not ok :
+            if acc .scheduler .consecutive_failures ==1 :
+                self .sink .emit ("error",acc .username ,error_type =et ,msg =msg )
+            if delay is None :
+                acc .paused =str (et or "")
+                self .sink .emit ("paused",acc .username ,error_type =et ,msg =msg )
+            return delay 
+
+        acc .last_success =now_str ()
+        if was_failing :
+            self .sink .emit ("recovered",acc .username )
+        fp =str (meta .get ("fingerprint","")or "")
+        if fp and fp ==acc .fingerprint :
+            return delay 
+
+        override_type =None 
+        if self .config_store is not None :
+            override_type =lambda k :self .config_store .get_override_type (k ,acc .username )
+        courses ,by_key =acc .course_index .update (raw ,override_type )
+        snapshot =write_courses_snapshot (courses ,os .path .join (self .out_dir ,safe_account_name (acc .username )))
+        if acc .known_keys is None :
+            self .sink .emit ("baseline",acc .username ,courses =len (courses ),snapshot =snapshot )
+        else :
+            added =sorted (set (by_key )-acc .known_keys )
+            if added :
+                poll_metrics .record_new_grades (acc .username ,len (added ))
+                self .sink .emit (
+                "new_grades",acc .username ,
+                courses =[
+                {"name":by_key [k ].name ,"semester":by_key [k ].semester ,"credits":by_key [k ].credits ,"score":by_key [k ].score_text }
+                for k in added 
+                ],
+                snapshot =snapshot 
+                )
+        acc .known_keys =set (by_key )
+        acc .fingerprint =fp 
+        poll_metrics .set_courses (acc .username ,len (courses ))
+        self .save_state ()
+        return delay 
+
+    def run (self ,stop :threading .Event )->None :
+        due :List [Tuple [float ,int ,int ]]=[]
+        now =time .monotonic ()
+        for i ,acc in enumerate (self .accounts ):
+            # spread the first round over one interval so a large file does not burst the servers
+            heapq .heappush (due ,(now +acc .interval_sec *i /max (1 ,len (self .accounts )),i ,i ))
+        seq =len (self .accounts )
+        inflight :Dict [Future ,int ]={}
+        pool =ThreadPoolExecutor (max_workers =self .concurrency ,thread_name_prefix ="watch")
+        try :
+            while not stop .is_set ():
+                now =time .monotonic ()
+                while due and due [0 ][0 ]<=now and len (inflight )<self .concurrency :
+                    _t ,_seq ,i =heapq .heappop (due )
+                    inflight [pool .submit (self ._fetch ,self .accounts [i ])]=i 
+
+                timeout =1.0 
+                if due and len (inflight )<self .concurrency :
+                    timeout =min (timeout ,max (0.0 ,due [0 ][0 ]-now ))
+                if not inflight :
+                    stop .wait (timeout )
+                    continue 
+                done ,_pending =wait (list (inflight ),timeout =timeout ,return_when =FIRST_COMPLETED )
+                for fut in done :
+                    i =inflight .pop (fut )
+                    acc =self .accounts [i ]
+                    try :
+                        raw ,ok ,msg ,meta =fut .result ()
+                    except Exception as e :
+                        raw ,ok ,msg ,meta =[],False ,f"请求异常：{e }",{"error_type":None }
+                    delay =self ._handle (acc ,raw ,ok ,msg ,meta )
+                    if delay is not None and not stop .is_set ():
+                        seq +=1 
+                        heapq .heappush (due ,(time .monotonic ()+delay ,seq ,i ))
+        finally :
+            for i in inflight .values ():
+                self .accounts [i ].cancel .set ()
+            pool .shutdown (wait =True )
+            for acc in self .accounts :
+                acc .session .close ()
+            self .save_state ()
+
+
+def _cmd_watch (args )->int :
+    accounts =load_accounts (args .accounts )
+    if not accounts :
+        print (f"账号文件中没有可用账号：{args .accounts }",file =sys .stderr )
+        return 2 
+    if args .rate_limit is not None :
+        rate_limiter .configure (args .rate_limit )
+    start_metrics_exporter (args .metrics_port ,args .metrics_file )
+    out_dir =args .out or os .path .join (OUTPUT_DIR ,"watch")
+    daemon =WatchDaemon (
+    accounts ,
+    out_dir ,
+    default_interval =args .interval ,
+    concurrency =args .workers ,
+    config_store =ConfigStore (CONFIG_FILE ),
+    notify =args .notify 
+    )
+    stop =threading .Event ()
+
+    def _on_signal (_signum ,_frame )->None :
+        stop .set ()
+
+    signal .signal (signal .SIGINT ,_on_signal )
+    if hasattr (signal ,"SIGTERM"):
+        signal .signal (signal .SIGTERM ,_on_signal )
+    print (f"开始监视 {len (daemon .accounts )} 个账号｜并发 {daemon .concurrency }｜事件 {daemon .sink .path }")
+    daemon .run (stop )
+    print (f"已停止，状态已保存到 {daemon .state_path }")
+    return 0 
+
+
+def _cmd_ingest (args )->int :
+    missing =[p for p in args .files if not os .path .isfile (p )]
+    if missing :
+        print (f"找不到文件：{'，'.join (missing )}",file =sys .stderr )
+        return 2 
+    out_dir =args .out or os .path .join (OUTPUT_DIR ,"ingest",datetime .now ().strftime ("%Y%m%d_%H%M%S"))
+    try :
+        summary =run_ingest (args .files ,out_dir ,kind =args .kind ,default_user =args .user ,config_store =ConfigStore (CONFIG_FILE ))
+    except (OSError ,ValueError )as e :
+        print (f"导入失败：{e }",file =sys .stderr )
+        return 2 
+    for row in summary ["results"]:
+        print (f"{row ['username']}：{row ['courses']} 门｜均绩 {row ['gpa']:.4f}｜加权 {row ['weighted_gpa']:.4f}｜4.3制 {row ['gpa_43']:.4f}")
+    if summary ["rows_rejected"]:
+        print (f"已跳过 {summary ['rows_rejected']} 行：学号包含非法字符",file =sys .stderr )
+    print (f"完成：读取 {summary ['rows_read']} 行｜{summary ['accounts']} 个账号｜输出 {out_dir }")
+    return 0 if summary ["accounts"]else 1 
+
+
+def main (argv :Optional [List [str ]]=None )->int :
+    parser =argparse .ArgumentParser (description =APP_TITLE )
+    sub =parser .add_subparsers (dest ="command")
+
+    p_batch =sub .add_parser ("batch",help ="无界面批量拉取多个账号的成绩")
+    p_batch .add_argument ("accounts",help ="账号文件：JSON 列表或 CSV（username,password）")
+    p_batch .add_argument ("-o","--out",default ="",help ="输出目录（默认 data/batch/<时间>）")
+    p_batch .add_argument ("-j","--workers",type =int ,default =4 ,help ="并发数")
+    p_batch .add_argument ("--page-size",type =int ,default =DATA_PAGE_SIZE ,help ="分页大小，0 表示单次拉取")
+    p_batch .add_argument ("--async",dest ="use_async",action ="store_true",help ="使用 asyncio 引擎")
+    p_batch .add_argument ("--rate-limit",type =float ,default =None ,help =f"每个主机每秒请求上限，0 表示不限（默认 {RATE_LIMIT_PER_SEC :g}）")
+
+    p_watch =sub .add_parser ("watch",help ="无界面持续监视多个账号的新成绩")
+    p_watch .add_argument ("accounts",help ="账号文件：JSON 列表或 CSV（username,password[,interval]）")
+    p_watch .add_argument ("-o","--out",default ="",help ="状态、快照与 events.jsonl 的目录（默认 data/watch）")
+    p_watch .add_argument ("-j","--workers",type =int ,default =WATCH_CONCURRENCY ,help ="同时进行的查询上限")
+    p_watch .add_argument ("--interval",type =float ,default =WATCH_DEFAULT_INTERVAL_SEC ,help ="账号未指定 interval 时的查询间隔（秒）")
+    p_watch .add_argument ("--notify",action ="store_true",help ="发现新成绩时发送桌面通知（需要 plyer）")
+    p_watch .add_argument ("--rate-limit",type =float ,default =None ,help =f"每个主机每秒请求上限，0 表示不限（默认 {RATE_LIMIT_PER_SEC :g}）")
+    p_watch .add_argument ("--metrics-port",type =int ,default =int (safe_float (os .environ .get ("ZJU_METRICS_PORT"),0 )),help ="在 127.0.0.1 上提供 /metrics（Prometheus 文本格式），0 表示关闭")
+    p_watch .add_argument ("--metrics-file",default =os .environ .get ("ZJU_METRICS_FILE",""),help ="定期把指标写入该 .prom 文件（node_exporter textfile）")
+
+    p_ingest =sub .add_parser ("ingest",help ="从导出文件离线导入成绩并统计（不联网）")
+    p_ingest .add_argument ("files",nargs ="+",help ="成绩/主修统计接口的 JSON 响应、courses_*.json 快照或 CSV 导出")
+    p_ingest .add_argument ("-o","--out",default ="",help ="输出目录（默认 data/ingest/<时间>）")
+    p_ingest .add_argument ("--kind",choices =("auto","score","stats","json","csv"),default ="auto",help ="文件类型；auto 按扩展名判断，文件名含 stats/zgkc 的视为主修统计")
+    p_ingest .add_argument ("--user",default ="local",help ="文件中没有学号列时使用的账号名")
+
+    args =parser .parse_args (argv )
+    if args .command =="batch":
+        return _cmd_batch (args )
+    if args .command =="watch":
+        return _cmd_watch (args )
+    if args .command =="ingest":
+        return _cmd_ingest (args )
+
     ensure_dir (OUTPUT_DIR )
     ensure_dir (SNAPSHOT_DIR )
     app =GradeApp ()
-    app .mainloop ()
\ No newline at end of file
+    app .mainloop ()
+    return 0 
+
+
+if __name__ =="__main__":
+    sys .exit (main ())